@@ -0,0 +1,39 @@
+import http from 'k6/http';
+import { check } from 'k6';
+
+// Throughput benchmark for GET /events on the catalog service.
+//
+// Run it against two builds and compare the http_reqs rate (requests/s):
+//   k6 run -e BASE_URL=http://localhost:8002 cloud-config/k6/catalog-events-benchmark.js
+//
+// Seed a few thousand events first (POST /events/import). To measure the
+// database and serialization path rather than the Redis response cache,
+// start catalog without REDIS_URL.
+//
+// Measured for the async engine + orjson change (5,000 seeded events,
+// limit=200, no Redis, one uvicorn worker, 20 keep-alive connections, 30 s,
+// load generator on the same single CPU): ~101 req/s on the sync handlers
+// before, ~181 req/s after (two runs each: 100.9/101.2 vs 174.5/187.5).
+
+const BASE_URL = __ENV.BASE_URL || 'http://localhost:8002';
+const LIMIT = __ENV.LIMIT || '200';
+
+export const options = {
+  scenarios: {
+    list_events: {
+      executor: 'constant-vus',
+      vus: Number(__ENV.VUS || 50),
+      duration: __ENV.DURATION || '1m',
+    },
+  },
+  thresholds: {
+    http_req_failed: ['rate<0.01'],
+  },
+};
+
+export default function () {
+  const response = http.get(`${BASE_URL}/events?limit=${LIMIT}`);
+  check(response, {
+    'status is 200': (r) => r.status === 200,
+  });
+}
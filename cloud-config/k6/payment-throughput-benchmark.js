@@ -0,0 +1,40 @@
+import http from 'k6/http';
+import { check } from 'k6';
+import { uuidv4 } from 'https://jslib.k6.io/k6-utils/1.4.0/index.js';
+
+// Payment throughput against the local payment simulator.
+//
+// Start the stack with PAYMENT_GATEWAY=simulator, log in to get a token, then:
+//   k6 run -e BASE_URL=http://localhost:8004 -e TOKEN=<access token> cloud-config/k6/payment-throughput-benchmark.js
+//
+// Tune the processor with the SIM_* variables (latency, decline and error
+// rates) and the client side with PAYMENT_GATEWAY_CONCURRENCY. A 503 means
+// every gateway slot stayed busy for PAYMENT_GATEWAY_QUEUE_TIMEOUT.
+
+const BASE_URL = __ENV.BASE_URL || 'http://localhost:8004';
+const TOKEN = __ENV.TOKEN;
+
+export const options = {
+  scenarios: {
+    payments: {
+      executor: 'constant-arrival-rate',
+      rate: Number(__ENV.RATE || 100),
+      timeUnit: '1s',
+      duration: __ENV.DURATION || '1m',
+      preAllocatedVUs: Number(__ENV.VUS || 200),
+    },
+  },
+};
+
+export default function () {
+  const response = http.post(
+    `${BASE_URL}/process-payment`,
+    JSON.stringify({ booking_id: uuidv4(), amount: 10, phone_number: '+10000000000' }),
+    { headers: { 'Content-Type': 'application/json', Authorization: `Bearer ${TOKEN}` } },
+  );
+  check(response, {
+    'accepted or settled': (r) => r.status === 200,
+    'declined': (r) => r.status === 402,
+    'gateway busy': (r) => r.status === 503,
+  });
+}
@@ -21,18 +21,31 @@ const getEventImage = (eventTitle) => {
   return images[eventTitle] || null;
 };
 
+// Events fetched per page; more are loaded on demand
+const EVENTS_PAGE_SIZE = 24;
+
 export default function Events({ onBookingComplete }) {
   const token = useSelector(selectToken);
   const [events, setEvents] = useState([]);
   const [selected, setSelected] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+
+  // GET /events is paginated: X-Next-Cursor points at the next page and is absent on the last one
+  const fetchPage = async (cursor) => {
+    const response = await catalogAPI.get("/events", {
+      params: cursor ? { limit: EVENTS_PAGE_SIZE, cursor } : { limit: EVENTS_PAGE_SIZE }
+    });
+    setNextCursor(response.headers["x-next-cursor"] || null);
+    return response.data;
+  };
 
   useEffect(() => {
     const fetchEvents = async () => {
       try {
         setLoading(true);
-        const response = await catalogAPI.get("/events");
-        setEvents(response.data);
+        setEvents(await fetchPage(null));
       } catch (error) {
         console.error("Failed to fetch events:", error);
       } finally {
@@ -43,6 +56,21 @@ export default function Events({ onBookingComplete }) {
     fetchEvents();
   }, []);
 
+  const loadMore = async () => {
+    if (!nextCursor || loadingMore) {
+      return;
+    }
+    try {
+      setLoadingMore(true);
+      const page = await fetchPage(nextCursor);
+      setEvents((current) => [...current, ...page]);
+    } catch (error) {
+      console.error("Failed to fetch more events:", error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleBookingComplete = () => {
     setSelected(null);
     if (onBookingComplete) {
@@ -152,6 +180,14 @@ export default function Events({ onBookingComplete }) {
         })}
       </div>
 
+      {nextCursor && (
+        <div style={{ display: 'flex', justifyContent: 'center', marginTop: 'var(--space-4)' }}>
+          <button className="btn btn-outline" onClick={loadMore} disabled={loadingMore}>
+            {loadingMore ? 'Loading...' : 'Load more events'}
+          </button>
+        </div>
+      )}
+
       {selected && (
         <div className="modal-overlay" onClick={() => setSelected(null)}>
           <div className="modal-content" onClick={(e) => e.stopPropagation()}>
@@ -1,9 +1,11 @@
 import React, { useEffect, useState } from "react";
 import { useSelector } from "react-redux";
 import { selectToken } from "../store/authSlice";
-import { bookingAPI, catalogAPI, paymentAPI } from "../utils/api";
+import { bookingAPI, catalogAPI } from "../utils/api";
 import { generateTicketPDF, generateReceiptPDF } from "../utils/pdfGenerator";
 
+const EVENT_IDS_PER_REQUEST = 200;
+
 export default function MyBookings() {
     const token = useSelector(selectToken);
     const [bookings, setBookings] = useState([]);
@@ -14,47 +16,28 @@ export default function MyBookings() {
 
     useEffect(() => {
         fetchBookings();
-        fetchEvents();
     }, []);
 
     const fetchBookings = async () => {
         try {
             const response = await bookingAPI.get("/my-bookings");
             setBookings(response.data);
+            fetchEvents([...new Set(response.data.map(booking => booking.event_id))]);
 
-            // Fetch payment receipts for each booking
-            const paymentPromises = response.data
-                .filter(booking => booking.status === "confirmed")
-                .map(async (booking) => {
-                    try {
-                        // First try to get payment info from the booking service
-                        const paymentResponse = await bookingAPI.get(`/booking-payment/${booking.id}`);
-
-                        if (paymentResponse.data.payment_id) {
-                            // Now fetch the payment receipt using the payment ID
-                            const receiptResponse = await paymentAPI.get(`/payment-receipt/${paymentResponse.data.payment_id}`);
-                            return {
-                                bookingId: booking.id,
-                                receipt: receiptResponse.data
-                            };
-                        }
-                    } catch (error) {
-                        console.log("No payment receipt found for booking:", booking.id);
-                        return null;
+            // Fetch the payment receipts of all bookings in one call; a pending
+            // or failed payment is not a receipt
+            try {
+                const paymentsResponse = await bookingAPI.get("/my-bookings/payments");
+                const receipts = {};
+                Object.entries(paymentsResponse.data.payments).forEach(([bookingId, payment]) => {
+                    if (payment.status === "completed") {
+                        receipts[bookingId] = payment;
                     }
                 });
-
-            // Wait for all payment receipt requests to complete
-            const paymentResults = await Promise.all(paymentPromises);
-
-            // Update payment receipts state
-            const newPaymentReceipts = {};
-            paymentResults.forEach(result => {
-                if (result && result.receipt) {
-                    newPaymentReceipts[result.bookingId] = result.receipt;
-                }
-            });
-            setPaymentReceipts(newPaymentReceipts);
+                setPaymentReceipts(receipts);
+            } catch (error) {
+                console.log("Payment receipts not available:", error);
+            }
         } catch (error) {
             console.error("Failed to fetch bookings:", error);
         } finally {
@@ -62,13 +45,19 @@ export default function MyBookings() {
         }
     };
 
-    const fetchEvents = async () => {
+    // Only the events these bookings refer to, in chunks of the catalog's ids= limit
+    const fetchEvents = async (eventIds) => {
         try {
-            const response = await catalogAPI.get("/events");
             const eventsMap = {};
-            response.data.forEach(event => {
-                eventsMap[event.id] = event;
-            });
+            for (let i = 0; i < eventIds.length; i += EVENT_IDS_PER_REQUEST) {
+                const chunk = eventIds.slice(i, i + EVENT_IDS_PER_REQUEST);
+                const response = await catalogAPI.get("/events", {
+                    params: { ids: chunk.join(","), limit: EVENT_IDS_PER_REQUEST }
+                });
+                response.data.forEach(event => {
+                    eventsMap[event.id] = event;
+                });
+            }
             setEvents(eventsMap);
         } catch (error) {
             console.error("Failed to fetch events:", error);
@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import os
+from collections import deque
+from typing import Dict, Any, List, Optional
+import redis.asyncio as aioredis
+from .database import cancel_bookings_page
+from .event_publisher import EventPublisher
+
+logger = logging.getLogger(__name__)
+
+# Keyset start for UUID primary keys
+FIRST_ID = "00000000-0000-0000-0000-000000000000"
+
+def checkpoint_key(event_id: str) -> str:
+    return f"cancel_job:{event_id}"
+
+class EventCancellationJob:
+    """Cancels every booking of a cancelled event in resumable chunks.
+    
+    Bookings are cancelled one keyset page at a time with a set-based UPDATE.
+    Refund and notification events for a page are published in the background
+    with at most ``max_concurrency`` pages in flight. The checkpoint in Redis
+    only advances past a page once its events are out, so a crashed job
+    resumes without losing refunds (it may repeat some).
+    """
+    
+    def __init__(
+        self,
+        event_id: str,
+        redis_client: aioredis.Redis,
+        publisher: EventPublisher,
+        chunk_size: Optional[int] = None,
+        max_concurrency: Optional[int] = None
+    ):
+        self.event_id = event_id
+        self.redis = redis_client
+        self.publisher = publisher
+        self.chunk_size = chunk_size or int(os.getenv("CANCELLATION_CHUNK_SIZE", "1000"))
+        self.max_concurrency = max_concurrency or int(os.getenv("CANCELLATION_CONCURRENCY", "4"))
+    
+    async def run(self) -> int:
+        """Run (or resume) the job. Returns the number of bookings handled."""
+        key = checkpoint_key(self.event_id)
+        checkpoint = await self.redis.hgetall(key)
+        if checkpoint.get(b"status") == b"done":
+            logger.info(f"Cancellation of event {self.event_id} already completed")
+            return int(checkpoint.get(b"cancelled", 0))
+        
+        after_id = checkpoint.get(b"last_id", FIRST_ID.encode()).decode()
+        cancelled = int(checkpoint.get(b"cancelled", 0))
+        await self.redis.hset(key, mapping={"status": "running", "last_id": after_id, "cancelled": cancelled})
+        logger.info(f"Cancelling bookings for event {self.event_id} after {after_id}")
+        
+        if self.publisher.channel is None:
+            await self.publisher.connect()
+        
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        pending = deque()
+        try:
+            while True:
+                bookings, last_id = await asyncio.to_thread(
+                    cancel_bookings_page, self.event_id, after_id, self.chunk_size
+                )
+                if last_id is None:
+                    break
+                after_id = last_id
+                
+                await semaphore.acquire()
+                task = asyncio.create_task(self._publish_chunk(bookings))
+                task.add_done_callback(lambda _: semaphore.release())
+                pending.append((task, last_id, len(bookings)))
+                
+                cancelled = await self._checkpoint_completed(pending, cancelled)
+            
+            # Drain the remaining chunks in order
+            while pending:
+                await pending[0][0]
+                cancelled = await self._checkpoint_completed(pending, cancelled)
+        except Exception:
+            for task, _, _ in pending:
+                task.cancel()
+            await self.redis.hset(key, "status", "failed")
+            raise
+        
+        # The event is gone, so its whole reservation counter can go at once
+        await self.redis.delete(f"event:{self.event_id}:capacity")
+        await self.redis.hset(key, "status", "done")
+        logger.info(f"Cancelled {cancelled} bookings for event {self.event_id}")
+        return cancelled
+    
+    async def _checkpoint_completed(self, pending: deque, cancelled: int) -> int:
+        """Advance the checkpoint over the leading chunks whose events are published."""
+        last_done = None
+        while pending and pending[0][0].done():
+            task, last_id, count = pending.popleft()
+            # Surface publish failures; the checkpoint stays before this chunk
+            task.result()
+            cancelled += count
+            last_done = last_id
+        
+        if last_done is not None:
+            await self.redis.hset(checkpoint_key(self.event_id), mapping={"last_id": last_done, "cancelled": cancelled})
+        return cancelled
+    
+    async def _publish_chunk(self, bookings: List[Dict[str, Any]]):
+        """Emit a refund batch for the page's paid bookings and notification batches for all of them.
+        
+        Only users with a paid booking get the notification that promises a refund.
+        """
+        if not bookings:
+            return
+        paid_users = {booking["user_id"] for booking in bookings if booking["paid"]}
+        unpaid_users = {booking["user_id"] for booking in bookings} - paid_users
+        publishes = [
+            self.publisher.publish_notification_send({
+                "type": notification_type,
+                "channel": "email",
+                "event_id": self.event_id,
+                "user_ids": sorted(user_ids)
+            })
+            for notification_type, user_ids in (("event_cancelled", paid_users), ("event_cancelled_unpaid", unpaid_users))
+            if user_ids
+        ]
+        refunds = [
+            {key: value for key, value in booking.items() if key != "paid"}
+            for booking in bookings if booking["paid"]
+        ]
+        if refunds:
+            publishes.append(self.publisher.publish_refunds_requested({
+                "event_id": self.event_id,
+                "reason": "event_cancelled",
+                "bookings": refunds
+            }))
+        await asyncio.gather(*publishes)
+
+# Jobs running in this process, so a redelivered event does not start a second one
+_running_jobs: Dict[str, asyncio.Task] = {}
+
+async def register_cancellation(event_id: str, redis_client: aioredis.Redis):
+    """Record a cancellation to run before its event is acked, so a restart resumes it."""
+    await redis_client.hsetnx(checkpoint_key(event_id), "status", "pending")
+
+def start_cancellation(event_id: str, redis_client: aioredis.Redis, publisher: EventPublisher) -> asyncio.Task:
+    """Run a cancellation job in the background unless one is already running."""
+    task = _running_jobs.get(event_id)
+    if task is None or task.done():
+        task = asyncio.create_task(_run_logged(EventCancellationJob(event_id, redis_client, publisher)))
+        _running_jobs[event_id] = task
+    return task
+
+async def resume_cancellations(redis_client: aioredis.Redis, publisher: EventPublisher):
+    """Restart cancellation jobs that were interrupted by a crash or restart."""
+    async for key in redis_client.scan_iter(match=checkpoint_key("*")):
+        if await redis_client.hget(key, "status") == b"done":
+            continue
+        event_id = key.decode().split(":", 1)[1]
+        logger.info(f"Resuming cancellation of event {event_id}")
+        start_cancellation(event_id, redis_client, publisher)
+
+async def _run_logged(job: EventCancellationJob):
+    try:
+        await job.run()
+    except Exception as e:
+        logger.error(f"Cancellation of event {job.event_id} failed: {e}")
@@ -0,0 +1,103 @@
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from typing import List, Dict, Any, Optional, Tuple
+import os
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+# Create engine with connection pooling and retry mechanism
+engine = create_engine(
+    DATABASE_URL,
+    pool_size=5,
+    max_overflow=10,
+    pool_pre_ping=True,
+    pool_recycle=1800,  # 30 minutes
+    pool_timeout=30,
+    connect_args={
+        "connect_timeout": 10,
+        "application_name": "booking_service"
+    }
+)
+SessionLocal = sessionmaker(bind=engine)
+
+def update_bookings_status(booking_ids: List[str], status: str) -> int:
+    """Move many pending bookings to ``status`` in one set-based UPDATE.
+
+    Only pending bookings change, so a late payment event cannot revive a
+    cancelled booking or fail a confirmed one. Returns the number of rows
+    changed.
+    """
+    if not booking_ids:
+        return 0
+    
+    with engine.begin() as conn:
+        result = conn.execute(
+            text("UPDATE bookings SET status = :status WHERE id = ANY(CAST(:ids AS uuid[])) AND status = 'pending'"),
+            {"status": status, "ids": list(booking_ids)}
+        )
+        return result.rowcount
+
+def ensure_columns():
+    """Add columns introduced after the bookings table was first created."""
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE bookings ADD COLUMN IF NOT EXISTS cancelled_reason varchar"))
+
+def ensure_indexes(table):
+    """Create the table's declared indexes; create_all skips them on existing tables.
+    
+    Failures propagate and fail startup rather than leaving queries unindexed.
+    """
+    for index in table.indexes:
+        index.create(bind=engine, checkfirst=True)
+
+# Why the event cancellation job cancelled a booking; paid ones are refunded
+EVENT_CANCELLED = "event_cancelled"
+EVENT_CANCELLED_UNPAID = "event_cancelled_unpaid"
+
+def cancel_bookings_page(event_id: str, after_id: str, limit: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Cancel the next page of an event's bookings, keyset-paged by id.
+    
+    Pending and confirmed bookings are cancelled and tagged with a
+    cancelled_reason in the same transaction. Returns the bookings this job
+    cancelled, with ``paid`` set for the confirmed ones, and the last id of
+    the page (None when there are no more rows). Rows a previous run tagged
+    are returned again so a resumed job re-emits their events; bookings that
+    were already cancelled for another reason, or failed, are left out.
+    """
+    with engine.begin() as conn:
+        rows = conn.execute(
+            text(
+                "SELECT id, user_id, seats, status, cancelled_reason FROM bookings "
+                "WHERE event_id = :event_id AND id > :after_id "
+                "ORDER BY id LIMIT :limit FOR UPDATE"
+            ),
+            {"event_id": event_id, "after_id": after_id, "limit": limit}
+        ).mappings().all()
+        
+        reasons = {}
+        for row in rows:
+            if row["status"] in ("pending", "confirmed"):
+                reasons[str(row["id"])] = EVENT_CANCELLED if row["status"] == "confirmed" else EVENT_CANCELLED_UNPAID
+            elif row["status"] == "cancelled" and row["cancelled_reason"] in (EVENT_CANCELLED, EVENT_CANCELLED_UNPAID):
+                reasons[str(row["id"])] = row["cancelled_reason"]
+        
+        to_cancel = [str(row["id"]) for row in rows if row["status"] in ("pending", "confirmed")]
+        if to_cancel:
+            conn.execute(
+                text(
+                    "UPDATE bookings SET status = 'cancelled', cancelled_reason = CASE status "
+                    "WHEN 'confirmed' THEN :paid ELSE :unpaid END "
+                    "WHERE id = ANY(CAST(:ids AS uuid[]))"
+                ),
+                {"ids": to_cancel, "paid": EVENT_CANCELLED, "unpaid": EVENT_CANCELLED_UNPAID}
+            )
+    
+    return [
+        {
+            "booking_id": str(row["id"]),
+            "user_id": str(row["user_id"]),
+            "seats": row["seats"],
+            "paid": reasons[str(row["id"])] == EVENT_CANCELLED
+        }
+        for row in rows if str(row["id"]) in reasons
+    ], (str(rows[-1]["id"]) if rows else None)
@@ -0,0 +1,131 @@
+import hashlib
+import logging
+import math
+import os
+from typing import List, Optional
+import redis.asyncio as aioredis
+
+logger = logging.getLogger(__name__)
+
+class BloomFilter:
+    """Fixed-size Bloom filter over a bytearray."""
+    
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        # Standard sizing: m = -n ln(p) / ln(2)^2, k = m/n ln(2)
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+    
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        # Double hashing gives k independent-enough positions from one digest
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+    
+    def add(self, item: str):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+    
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+class EventDeduplicator:
+    """Drops redelivered events by event_id.
+    
+    An event is marked processed only after its handler succeeded, so a
+    delivery interrupted by a crash or a failed handler is handled again when
+    the broker redelivers it; delivery stays at-least-once and the handlers
+    are idempotent. Redis keys with a TTL are the shared source of truth
+    across consumer instances. A rotating pair of in-process Bloom filters
+    remembers the IDs processed locally, so dedup keeps working for them
+    while Redis is unreachable.
+    """
+    
+    def __init__(
+        self,
+        redis_client: aioredis.Redis,
+        namespace: str,
+        ttl_seconds: int = 86400,
+        capacity: int = 100000,
+        error_rate: float = 0.001
+    ):
+        self.redis = redis_client
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._current = BloomFilter(capacity, error_rate)
+        self._previous: Optional[BloomFilter] = None
+        self.duplicates = 0
+    
+    def _key(self, event_id: str) -> str:
+        return f"dedup:{self.namespace}:{event_id}"
+    
+    def _seen_locally(self, event_id: str) -> bool:
+        return event_id in self._current or (self._previous is not None and event_id in self._previous)
+    
+    def _remember(self, event_id: str):
+        if self._current.count >= self.capacity:
+            # Age out the older generation instead of letting the error rate grow
+            self._previous = self._current
+            self._current = BloomFilter(self.capacity, self.error_rate)
+        self._current.add(event_id)
+    
+    async def is_new(self, event_id: str) -> bool:
+        """Return True if the event has not been processed yet."""
+        return (await self.check_many([event_id]))[0]
+    
+    async def check_many(self, event_ids: List[str]) -> List[bool]:
+        """Check many event IDs in one Redis round trip; True means not processed yet.
+        
+        A repeat within the list counts as a duplicate.
+        """
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for event_id in event_ids:
+                pipe.exists(self._key(event_id))
+            processed = [bool(reply) for reply in await pipe.execute()]
+        except Exception as e:
+            logger.error(f"Dedup store unavailable, using local filter only: {e}")
+            # Bloom false positives drop an event here, which is the price of staying up
+            processed = [self._seen_locally(event_id) for event_id in event_ids]
+        
+        results = []
+        checked = set()
+        for event_id, seen in zip(event_ids, processed):
+            is_new = not seen and event_id not in checked
+            checked.add(event_id)
+            if not is_new:
+                self.duplicates += 1
+            results.append(is_new)
+        return results
+    
+    async def mark_processed(self, event_ids: List[str]):
+        """Remember events whose handler succeeded, so redeliveries are dropped."""
+        if not event_ids:
+            return
+        for event_id in event_ids:
+            self._remember(event_id)
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for event_id in event_ids:
+                pipe.set(self._key(event_id), 1, ex=self.ttl_seconds)
+            await pipe.execute()
+        except Exception as e:
+            logger.error(f"Failed to record processed events: {e}")
+
+def create_deduplicator(namespace: str) -> Optional[EventDeduplicator]:
+    """Build a deduplicator from REDIS_URL, or None if Redis is not configured."""
+    redis_url = os.getenv("REDIS_URL")
+    if not redis_url:
+        return None
+    return EventDeduplicator(
+        aioredis.from_url(redis_url),
+        namespace,
+        ttl_seconds=int(os.getenv("DEDUP_TTL_SECONDS", "86400")),
+        capacity=int(os.getenv("DEDUP_BLOOM_CAPACITY", "100000"))
+    )
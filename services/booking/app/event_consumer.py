@@ -1,18 +1,60 @@
 import asyncio
-import json
 import logging
 import os
-from typing import Dict, Any, Callable
+import time
+import uuid
+import zlib
+from typing import Dict, Any, Callable, List, Optional, Tuple
 from datetime import datetime
 import aio_pika
-from aio_pika import Message
+import redis.asyncio as aioredis
+from aio_pika import Message, DeliveryMode
+from .database import update_bookings_status
+from .dedup import EventDeduplicator, create_deduplicator
+from .serialization import decode_event
+from .event_publisher import event_publisher
+from .cancellation import register_cancellation, start_cancellation, resume_cancellations
+from . import metrics
 
 logger = logging.getLogger(__name__)
 
+# Exchange that routes exhausted messages to their parking queue
+DEAD_LETTER_EXCHANGE = "events.dlx"
+RETRY_COUNT_HEADER = "x-retry-count"
+
+def parking_queue_name(queue_name: str) -> str:
+    return f"{queue_name}.parking"
+
+def retry_queue_name(queue_name: str, delay_ms: int) -> str:
+    return f"{queue_name}.retry.{delay_ms}ms"
+
+# Fields looked up (in order) in the event payload to pick the ordering key
+DEFAULT_PARTITION_FIELDS = ("booking_id", "event_id", "user_id")
+
+def default_partition_key(event_data: Dict[str, Any]) -> str:
+    """Return the key whose events must be handled in order (e.g. booking_id)."""
+    data = event_data.get("data") or {}
+    for field in DEFAULT_PARTITION_FIELDS:
+        if data.get(field):
+            return str(data[field])
+    return str(event_data.get("event_id", ""))
+
 class EventConsumer:
-    """Consumer for asynchronous event-driven communication."""
+    """Consumer for asynchronous event-driven communication.
+
+    Messages are dispatched to a bounded pool of worker lanes. Each message is
+    routed to a lane by hashing its partition key, so events for the same
+    booking/event are handled in order while unrelated keys run concurrently.
+    """
     
-    def __init__(self, connection_string: str = None):
+    def __init__(
+        self,
+        connection_string: str = None,
+        prefetch_count: Optional[int] = None,
+        max_workers: Optional[int] = None,
+        partition_key: Callable[[Dict[str, Any]], str] = default_partition_key,
+        deduplicator: Optional[EventDeduplicator] = None
+    ):
         if connection_string is None:
             # Build connection string from environment variables
             rabbitmq_user = os.getenv("RABBITMQ_USER", "admin")
@@ -27,8 +69,38 @@ class EventConsumer:
             self.connection_string = connection_string
         self.connection: aio_pika.Connection = None
         self.channel: aio_pika.Channel = None
+        self.dead_letter_exchange: aio_pika.Exchange = None
         self.queues: Dict[str, aio_pika.Queue] = {}
         self.handlers: Dict[str, Callable] = {}
+        # event_type -> (handler, max batch size, max wait in seconds)
+        self.batch_handlers: Dict[str, Tuple[Callable, int, float]] = {}
+        self.queue_routing_keys: Dict[str, str] = {}
+        self._batch_channels: List[aio_pika.Channel] = []
+        self.prefetch_count = prefetch_count or int(os.getenv("CONSUMER_PREFETCH", "32"))
+        self.max_workers = max_workers or int(os.getenv("CONSUMER_WORKERS", "8"))
+        self.partition_key = partition_key
+        self.deduplicator = deduplicator
+        
+        # Escalating retry delays; a message is parked after max_retries attempts
+        self.retry_delays_ms = [
+            int(delay) for delay in os.getenv("CONSUMER_RETRY_DELAYS_MS", "1000,10000,60000").split(",")
+        ]
+        self.max_retries = int(os.getenv("CONSUMER_MAX_RETRIES", "5"))
+        
+        # One FIFO per worker lane; a key always hashes to the same lane
+        self._lanes: List[asyncio.Queue] = []
+        self._workers: List[asyncio.Task] = []
+        
+        # Gauges
+        self.in_flight = 0
+        self.processed = 0
+        self.failed = 0
+        self.retried = 0
+        self.parked = 0
+        
+        # Settled messages per queue, used to derive the per-second rate
+        self._settled: Dict[str, int] = {}
+        self.metrics_interval = float(os.getenv("CONSUMER_METRICS_INTERVAL", "15"))
     
     async def connect(self):
         """Establish connection to RabbitMQ."""
@@ -36,10 +108,12 @@ class EventConsumer:
             self.connection = await aio_pika.connect_robust(self.connection_string)
             self.channel = await self.connection.channel()
             
-            # Set QoS to process one message at a time
-            await self.channel.set_qos(prefetch_count=1)
+            # Allow several unacked messages so handlers overlap broker round trips
+            await self.channel.set_qos(prefetch_count=self.prefetch_count)
             
-            logger.info("Connected to RabbitMQ")
+            self._start_workers()
+            
+            logger.info(f"Connected to RabbitMQ (prefetch={self.prefetch_count}, workers={self.max_workers})")
         except Exception as e:
             logger.error(f"Failed to connect to RabbitMQ: {e}")
             raise
@@ -64,6 +138,9 @@ class EventConsumer:
             await queue.bind(exchange, routing_key)
             
             self.queues[queue_name] = queue
+            self.queue_routing_keys[queue_name] = routing_key
+            
+            await self._declare_retry_topology(queue_name)
             
             logger.info(f"Declared queue {queue_name} bound to {exchange_name} with key {routing_key}")
             
@@ -71,39 +148,384 @@ class EventConsumer:
             logger.error(f"Failed to declare queue {queue_name}: {e}")
             raise
     
+    async def _declare_retry_topology(self, queue_name: str):
+        """Declare the delayed-retry queues and parking queue for a queue.
+        
+        Retry queues hold a message for their TTL and then dead-letter it back
+        to the original queue through the default exchange.
+        """
+        for delay_ms in self.retry_delays_ms:
+            await self.channel.declare_queue(
+                retry_queue_name(queue_name, delay_ms),
+                durable=True,
+                arguments={
+                    "x-message-ttl": delay_ms,
+                    "x-dead-letter-exchange": "",
+                    "x-dead-letter-routing-key": queue_name
+                }
+            )
+        
+        self.dead_letter_exchange = await self.channel.declare_exchange(
+            DEAD_LETTER_EXCHANGE,
+            aio_pika.ExchangeType.DIRECT,
+            durable=True
+        )
+        parking_queue = await self.channel.declare_queue(parking_queue_name(queue_name), durable=True)
+        await parking_queue.bind(self.dead_letter_exchange, queue_name)
+    
+    async def _retry_or_park(self, queue_name: str, message: Message, error: Exception):
+        """Republish a failed message to the next retry tier or park it.
+        
+        The caller acks the original delivery once this returns.
+        """
+        headers = dict(message.headers or {})
+        retry_count = int(headers.get(RETRY_COUNT_HEADER, 0))
+        headers["x-original-queue"] = queue_name
+        headers["x-last-error"] = str(error)[:500]
+        
+        if retry_count < self.max_retries:
+            delay_ms = self.retry_delays_ms[min(retry_count, len(self.retry_delays_ms) - 1)]
+            headers[RETRY_COUNT_HEADER] = retry_count + 1
+            await self.channel.default_exchange.publish(
+                self._copy_message(message, headers),
+                routing_key=retry_queue_name(queue_name, delay_ms)
+            )
+            self.retried += 1
+            logger.warning(f"Retrying message from {queue_name} in {delay_ms}ms (attempt {retry_count + 1}/{self.max_retries})")
+        else:
+            await self.dead_letter_exchange.publish(self._copy_message(message, headers), routing_key=queue_name)
+            self.parked += 1
+            logger.error(f"Parked message from {queue_name} after {retry_count} retries: {error}")
+    
+    @staticmethod
+    def _copy_message(message: Message, headers: Dict[str, Any]) -> Message:
+        """Build a persistent copy of a delivered message with new headers."""
+        return Message(
+            message.body,
+            headers=headers,
+            content_type=message.content_type,
+            content_encoding=message.content_encoding,
+            message_id=message.message_id,
+            timestamp=message.timestamp,
+            delivery_mode=DeliveryMode.PERSISTENT
+        )
+    
     def register_handler(self, event_type: str, handler: Callable):
         """Register event handler for specific event type."""
         self.handlers[event_type] = handler
         logger.info(f"Registered handler for event type: {event_type}")
     
+    def register_batch_handler(
+        self,
+        event_type: str,
+        handler: Callable,
+        max_batch_size: Optional[int] = None,
+        max_wait_ms: Optional[int] = None
+    ):
+        """Register a handler that receives a list of events at once.
+        
+        Messages are accumulated until ``max_batch_size`` is reached or
+        ``max_wait_ms`` has passed since the first one arrived, then the whole
+        batch is acked with a single multiple-ack.
+        """
+        max_batch_size = max_batch_size or int(os.getenv("CONSUMER_BATCH_SIZE", "100"))
+        max_wait_ms = max_wait_ms or int(os.getenv("CONSUMER_BATCH_WAIT_MS", "50"))
+        self.batch_handlers[event_type] = (handler, max_batch_size, max_wait_ms / 1000)
+        logger.info(f"Registered batch handler for event type: {event_type} (size={max_batch_size}, wait={max_wait_ms}ms)")
+    
+    def _start_workers(self):
+        """Create the worker lanes (idempotent across reconnects)."""
+        if self._workers:
+            return
+        
+        for lane_id in range(self.max_workers):
+            lane: asyncio.Queue = asyncio.Queue(maxsize=self.prefetch_count)
+            self._lanes.append(lane)
+            self._workers.append(asyncio.create_task(self._run_lane(lane_id, lane)))
+        self._workers.append(asyncio.create_task(self._sample_metrics()))
+    
+    def _lane_for(self, key: str) -> asyncio.Queue:
+        """Pick the lane for a partition key using a stable hash."""
+        index = zlib.crc32(key.encode()) % len(self._lanes)
+        return self._lanes[index]
+    
+    async def _run_lane(self, lane_id: int, lane: asyncio.Queue):
+        """Process messages of one lane sequentially, preserving key order."""
+        while True:
+            queue_name, message, event_data = await lane.get()
+            try:
+                await self._handle(queue_name, message, event_data)
+            except Exception as e:
+                logger.error(f"Lane {lane_id} failed to process message: {e}")
+            finally:
+                lane.task_done()
+    
+    async def _handle(self, queue_name: str, message: Message, event_data: Dict[str, Any]):
+        """Run the handler for one message, retrying or parking it on failure."""
+        self.in_flight += 1
+        metrics.IN_FLIGHT.inc()
+        self._observe_delivery(queue_name, message)
+        started = time.perf_counter()
+        outcome = "processed"
+        event_id = event_data.get("event_id")
+        try:
+            if self.deduplicator and event_id and not await self.deduplicator.is_new(event_id):
+                logger.info(f"Dropping duplicate event {event_id}")
+                outcome = "duplicate"
+                await message.ack()
+                return
+            
+            try:
+                event_type = event_data.get("event_type")
+                
+                logger.info(f"Processing event: {event_type}")
+                
+                # Find and execute handler
+                if event_type in self.handlers:
+                    await self.handlers[event_type](event_data)
+                else:
+                    logger.warning(f"No handler found for event type: {event_type}")
+                
+                self.processed += 1
+                # Only now, so a delivery interrupted mid-handler is processed again
+                if self.deduplicator and event_id:
+                    await self.deduplicator.mark_processed([event_id])
+                
+            except Exception as e:
+                self.failed += 1
+                outcome = "failed"
+                logger.error(f"Error processing message: {e}")
+                try:
+                    await self._retry_or_park(queue_name, message, e)
+                except Exception as publish_error:
+                    # Could not hand the message off, let the broker redeliver it
+                    logger.error(f"Failed to dead-letter message: {publish_error}")
+                    await message.nack(requeue=True)
+                    return
+            
+            await message.ack()
+        finally:
+            self.in_flight -= 1
+            metrics.IN_FLIGHT.dec()
+            metrics.HANDLER_LATENCY.labels(queue_name).observe(time.perf_counter() - started)
+            self._count(queue_name, outcome)
+    
+    async def _start_batch_consuming(self, queue_name: str, event_type: str):
+        """Consume a queue in micro-batches on a dedicated channel.
+        
+        A channel of its own keeps multiple-acks from touching deliveries of
+        other queues.
+        """
+        handler, max_batch_size, max_wait = self.batch_handlers[event_type]
+        
+        channel = await self.connection.channel()
+        await channel.set_qos(prefetch_count=max(self.prefetch_count, max_batch_size))
+        self._batch_channels.append(channel)
+        queue = await channel.declare_queue(queue_name, durable=True)
+        
+        inbox: asyncio.Queue = asyncio.Queue()
+        
+        async def collect_message(message: Message):
+            """Parse incoming message and buffer it for the next batch."""
+            try:
+                event_data = decode_event(message.body, message.content_type, message.content_encoding)
+            except Exception as e:
+                logger.error(f"Error decoding message: {e}")
+                # Parked when its batch is settled, so it never races a multiple-ack
+                event_data = e
+            await inbox.put((queue_name, message, event_data))
+        
+        self._workers.append(asyncio.create_task(
+            self._run_batches(queue_name, inbox, handler, max_batch_size, max_wait)
+        ))
+        await queue.consume(collect_message)
+        logger.info(f"Started batch consuming from queue: {queue_name}")
+    
+    async def _run_batches(
+        self,
+        queue_name: str,
+        inbox: asyncio.Queue,
+        handler: Callable,
+        max_batch_size: int,
+        max_wait: float
+    ):
+        """Cut batches by size or age and hand them to the batch handler."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await inbox.get()]
+            deadline = loop.time() + max_wait
+            while len(batch) < max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(inbox.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            try:
+                await self._handle_batch(queue_name, batch, handler)
+            except Exception as e:
+                logger.error(f"Failed to settle batch from {queue_name}: {e}")
+    
+    async def _handle_batch(self, queue_name: str, batch: List[Tuple[str, Message, Dict[str, Any]]], handler: Callable):
+        """Run the batch handler and settle every message with one frame.
+        
+        ``batch`` holds the (queue name, message, event) items of the inbox;
+        the event is the decode error for a message that could not be parsed.
+        Those are parked before the multiple-ack. A failed batch is settled
+        message by message, each one acked as soon as its retry copy is
+        published.
+        """
+        decoded = [(message, event_data) for _, message, event_data in batch if not isinstance(event_data, Exception)]
+        self.in_flight += len(batch)
+        metrics.IN_FLIGHT.inc(len(batch))
+        for _, message, _ in batch:
+            self._observe_delivery(queue_name, message)
+        started = time.perf_counter()
+        outcome = "processed"
+        try:
+            events = [event_data for _, event_data in decoded]
+            if self.deduplicator:
+                events = await self._drop_duplicates(events)
+            
+            if events:
+                logger.info(f"Processing batch of {len(events)} events from {queue_name}")
+                await handler(events)
+            if self.deduplicator:
+                # Only now, so a batch interrupted mid-handler is processed again
+                await self.deduplicator.mark_processed([event_data["event_id"] for event_data in events if event_data.get("event_id")])
+        except Exception as e:
+            self.failed += len(decoded)
+            outcome = "failed"
+            logger.error(f"Error processing batch: {e}")
+            for index, (_, message, event_data) in enumerate(batch):
+                if isinstance(event_data, Exception):
+                    await self._park_undecodable(queue_name, message, event_data)
+                    continue
+                try:
+                    await self._retry_or_park(queue_name, message, e)
+                except Exception as publish_error:
+                    logger.error(f"Failed to dead-letter batch: {publish_error}")
+                    # Only the messages that were not republished go back to the queue
+                    for _, remaining, _ in batch[index:]:
+                        await remaining.nack(requeue=True)
+                    return
+                await message.ack()
+        else:
+            self.processed += len(decoded)
+            for _, message, event_data in batch:
+                if isinstance(event_data, Exception):
+                    await self._park_undecodable(queue_name, message, event_data)
+            if decoded:
+                # Deliveries arrive in tag order, so the last one covers the rest of the batch
+                await decoded[-1][0].ack(multiple=True)
+        finally:
+            self.in_flight -= len(batch)
+            metrics.IN_FLIGHT.dec(len(batch))
+            metrics.HANDLER_LATENCY.labels(queue_name).observe(time.perf_counter() - started)
+            self._count(queue_name, outcome, len(batch))
+    
+    async def _drop_duplicates(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Filter already-processed events out of a batch with one pipelined check."""
+        event_ids = [event_data.get("event_id") for event_data in events]
+        with_ids = [event_id for event_id in event_ids if event_id]
+        # A repeat inside the same batch is a duplicate too
+        new = iter(await self.deduplicator.check_many(with_ids))
+        fresh = [event_data for event_data, event_id in zip(events, event_ids) if not event_id or next(new)]
+        if len(fresh) < len(events):
+            logger.info(f"Dropped {len(events) - len(fresh)} duplicate events from batch")
+        return fresh
+    
+    async def _park_undecodable(self, queue_name: str, message: Message, error: Exception):
+        """Send a message that can never be parsed straight to parking."""
+        headers = dict(message.headers or {})
+        headers[RETRY_COUNT_HEADER] = self.max_retries
+        headers["x-original-queue"] = queue_name
+        headers["x-last-error"] = str(error)[:500]
+        try:
+            await self.dead_letter_exchange.publish(self._copy_message(message, headers), routing_key=queue_name)
+            self.parked += 1
+        except Exception as publish_error:
+            logger.error(f"Failed to park message: {publish_error}")
+            await message.reject(requeue=False)
+            return
+        await message.ack()
+    
+    @staticmethod
+    def _observe_delivery(queue_name: str, message: Message):
+        if message.redelivered or (message.headers or {}).get(RETRY_COUNT_HEADER):
+            metrics.REDELIVERIES.labels(queue_name).inc()
+    
+    def _count(self, queue_name: str, outcome: str, count: int = 1):
+        metrics.MESSAGES.labels(queue_name, outcome).inc(count)
+        self._settled[queue_name] = self._settled.get(queue_name, 0) + count
+    
+    async def _sample_metrics(self):
+        """Periodically refresh queue depth and message rate gauges."""
+        last_settled: Dict[str, int] = {}
+        last_sample = time.monotonic()
+        while True:
+            await asyncio.sleep(self.metrics_interval)
+            now = time.monotonic()
+            for queue_name, settled in self._settled.items():
+                rate = (settled - last_settled.get(queue_name, 0)) / (now - last_sample)
+                metrics.MESSAGE_RATE.labels(queue_name).set(rate)
+            last_settled = dict(self._settled)
+            last_sample = now
+            
+            try:
+                for queue_name, depth in (await self.get_queue_lag()).items():
+                    metrics.QUEUE_DEPTH.labels(queue_name).set(depth)
+            except Exception as e:
+                logger.error(f"Failed to sample queue depth: {e}")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Return in-flight and local backlog gauges."""
+        return {
+            "prefetch_count": self.prefetch_count,
+            "workers": self.max_workers,
+            "in_flight": self.in_flight,
+            "buffered": sum(lane.qsize() for lane in self._lanes),
+            "processed": self.processed,
+            "failed": self.failed,
+            "retried": self.retried,
+            "parked": self.parked
+        }
+    
+    async def get_queue_lag(self) -> Dict[str, int]:
+        """Return messages waiting on the broker for each consumed and parking queue."""
+        lag = {}
+        for queue_name in self.queues:
+            for name in (queue_name, parking_queue_name(queue_name)):
+                queue = await self.channel.declare_queue(name, passive=True)
+                lag[name] = queue.declaration_result.message_count
+        return lag
+    
     async def start_consuming(self, queue_name: str):
         """Start consuming messages from a queue."""
         if queue_name not in self.queues:
             logger.error(f"Queue {queue_name} not found")
             return
         
+        event_type = self.queue_routing_keys.get(queue_name)
+        if event_type in self.batch_handlers:
+            await self._start_batch_consuming(queue_name, event_type)
+            return
+        
         queue = self.queues[queue_name]
         
         async def process_message(message: Message):
-            """Process incoming message."""
-            async with message.process():
-                try:
-                    # Parse message
-                    event_data = json.loads(message.body.decode())
-                    event_type = event_data.get("event_type")
-                    
-                    logger.info(f"Processing event: {event_type}")
-                    
-                    # Find and execute handler
-                    if event_type in self.handlers:
-                        await self.handlers[event_type](event_data)
-                    else:
-                        logger.warning(f"No handler found for event type: {event_type}")
-                    
-                except Exception as e:
-                    logger.error(f"Error processing message: {e}")
-                    # In production, you might want to send to dead letter queue
-                    raise
+            """Parse incoming message and hand it to its partition lane."""
+            try:
+                event_data = decode_event(message.body, message.content_type, message.content_encoding)
+            except Exception as e:
+                logger.error(f"Error decoding message: {e}")
+                await self._park_undecodable(queue_name, message, e)
+                return
+            
+            # Blocks when the lane is full, which backpressures the broker via prefetch
+            await self._lane_for(self.partition_key(event_data)).put((queue_name, message, event_data))
         
         # Start consuming
         await queue.consume(process_message)
@@ -111,36 +533,49 @@ class EventConsumer:
     
     async def close(self):
         """Close connection to RabbitMQ."""
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+        self._lanes = []
+        self._batch_channels = []
+        
         if self.connection:
             await self.connection.close()
             logger.info("Disconnected from RabbitMQ")
 
 # Event handlers
+def _booking_ids(events: List[Dict[str, Any]]) -> List[str]:
+    """Collect the valid booking IDs referenced by a list of events."""
+    booking_ids = []
+    for event_data in events:
+        booking_id = (event_data.get("data") or {}).get("booking_id")
+        try:
+            booking_ids.append(str(uuid.UUID(str(booking_id))))
+        except (ValueError, TypeError):
+            logger.warning(f"Skipping event with invalid booking_id: {booking_id}")
+    return booking_ids
+
 async def handle_payment_completed(event_data: Dict[str, Any]):
     """Handle payment completed event."""
-    logger.info(f"Payment completed: {event_data}")
-    
-    # Update booking status to confirmed
-    booking_data = event_data.get("data", {})
-    booking_id = booking_data.get("booking_id")
-    
-    if booking_id:
-        # Here you would update the booking status in the database
-        logger.info(f"Updating booking {booking_id} status to confirmed")
-        # await update_booking_status(booking_id, "confirmed")
+    await handle_payment_completed_batch([event_data])
+
+async def handle_payment_completed_batch(events: List[Dict[str, Any]]):
+    """Confirm all bookings of a batch of payment completed events."""
+    booking_ids = _booking_ids(events)
+    if booking_ids:
+        updated = await asyncio.to_thread(update_bookings_status, booking_ids, "confirmed")
+        logger.info(f"Confirmed {updated} of {len(booking_ids)} bookings")
 
 async def handle_payment_failed(event_data: Dict[str, Any]):
     """Handle payment failed event."""
-    logger.info(f"Payment failed: {event_data}")
-    
-    # Update booking status to failed
-    booking_data = event_data.get("data", {})
-    booking_id = booking_data.get("booking_id")
-    
-    if booking_id:
-        # Here you would update the booking status in the database
-        logger.info(f"Updating booking {booking_id} status to failed")
-        # await update_booking_status(booking_id, "failed")
+    await handle_payment_failed_batch([event_data])
+
+async def handle_payment_failed_batch(events: List[Dict[str, Any]]):
+    """Fail all bookings of a batch of payment failed events."""
+    booking_ids = _booking_ids(events)
+    if booking_ids:
+        updated = await asyncio.to_thread(update_bookings_status, booking_ids, "failed")
+        logger.info(f"Marked {updated} of {len(booking_ids)} bookings as failed")
 
 async def handle_event_cancelled(event_data: Dict[str, Any]):
     """Handle event cancelled event."""
@@ -151,9 +586,10 @@ async def handle_event_cancelled(event_data: Dict[str, Any]):
     event_id = event_data_info.get("event_id")
     
     if event_id:
-        # Here you would cancel all bookings for this event
+        # Recorded before the message is acked; the job checkpoints itself from then on
+        await register_cancellation(str(event_id), cancellation_redis)
         logger.info(f"Cancelling all bookings for event {event_id}")
-        # await cancel_event_bookings(event_id)
+        start_cancellation(str(event_id), cancellation_redis, event_publisher)
 
 async def handle_user_registered(event_data: Dict[str, Any]):
     """Handle user registered event."""
@@ -168,7 +604,8 @@ async def handle_user_registered(event_data: Dict[str, Any]):
         # await send_welcome_email(user_id)
 
 # Global event consumer instance
-event_consumer = EventConsumer(os.getenv("RABBITMQ_URL"))
+event_consumer = EventConsumer(os.getenv("RABBITMQ_URL"), deduplicator=create_deduplicator("booking"))
+cancellation_redis = aioredis.from_url(os.getenv("REDIS_URL", "redis://redis:6379"))
 
 async def setup_event_consumers():
     """Setup all event consumers."""
@@ -200,8 +637,8 @@ async def setup_event_consumers():
     )
     
     # Register handlers
-    event_consumer.register_handler("payment.completed", handle_payment_completed)
-    event_consumer.register_handler("payment.failed", handle_payment_failed)
+    event_consumer.register_batch_handler("payment.completed", handle_payment_completed_batch)
+    event_consumer.register_batch_handler("payment.failed", handle_payment_failed_batch)
     event_consumer.register_handler("event.cancelled", handle_event_cancelled)
     event_consumer.register_handler("user.registered", handle_user_registered)
     
@@ -210,3 +647,9 @@ async def setup_event_consumers():
     await event_consumer.start_consuming("booking.payment.failed")
     await event_consumer.start_consuming("booking.event.cancelled")
     await event_consumer.start_consuming("booking.user.registered")
+    
+    # Pick up bulk cancellations interrupted by a restart
+    try:
+        await resume_cancellations(cancellation_redis, event_publisher)
+    except Exception as e:
+        logger.error(f"Failed to resume cancellation jobs: {e}")
@@ -1,18 +1,35 @@
 import asyncio
-import json
 import logging
 import os
+import secrets
+import time
+import uuid
 from typing import Dict, Any, Optional
 from datetime import datetime
 import aio_pika
 from aio_pika import Message, DeliveryMode
+from .serialization import EventSerializer
 
 logger = logging.getLogger(__name__)
 
+def new_event_id() -> str:
+    """Return a globally unique, time-ordered event ID (UUIDv7 layout).
+    
+    48 bits of millisecond timestamp followed by 74 random bits, so IDs from
+    different instances never collide and sort by creation time.
+    """
+    unix_ms = time.time_ns() // 1_000_000
+    value = (unix_ms & 0xFFFFFFFFFFFF) << 80
+    value |= 0x7 << 76  # version 7
+    value |= secrets.randbits(12) << 64
+    value |= 0b10 << 62  # RFC 4122 variant
+    value |= secrets.randbits(62)
+    return str(uuid.UUID(int=value))
+
 class EventPublisher:
     """Publisher for asynchronous event-driven communication."""
     
-    def __init__(self, connection_string: str = None):
+    def __init__(self, connection_string: str = None, serializer: Optional[EventSerializer] = None):
         if connection_string is None:
             # Build connection string from environment variables
             rabbitmq_user = os.getenv("RABBITMQ_USER", "admin")
@@ -28,6 +45,7 @@ class EventPublisher:
         self.connection: Optional[aio_pika.Connection] = None
         self.channel: Optional[aio_pika.Channel] = None
         self.exchanges: Dict[str, aio_pika.Exchange] = {}
+        self.serializer = serializer or EventSerializer()
     
     async def connect(self):
         """Establish connection to RabbitMQ."""
@@ -64,7 +82,7 @@ class EventPublisher:
         """Publish booking created event."""
         event = {
             "event_type": "booking.created",
-            "event_id": f"booking_created_{datetime.now().timestamp()}",
+            "event_id": new_event_id(),
             "timestamp": datetime.now().isoformat(),
             "data": booking_data,
             "version": "1.0"
@@ -76,7 +94,7 @@ class EventPublisher:
         """Publish booking cancelled event."""
         event = {
             "event_type": "booking.cancelled",
-            "event_id": f"booking_cancelled_{datetime.now().timestamp()}",
+            "event_id": new_event_id(),
             "timestamp": datetime.now().isoformat(),
             "data": booking_data,
             "version": "1.0"
@@ -88,7 +106,7 @@ class EventPublisher:
         """Publish booking confirmed event."""
         event = {
             "event_type": "booking.confirmed",
-            "event_id": f"booking_confirmed_{datetime.now().timestamp()}",
+            "event_id": new_event_id(),
             "timestamp": datetime.now().isoformat(),
             "data": booking_data,
             "version": "1.0"
@@ -100,7 +118,7 @@ class EventPublisher:
         """Publish payment required event."""
         event = {
             "event_type": "payment.required",
-            "event_id": f"payment_required_{datetime.now().timestamp()}",
+            "event_id": new_event_id(),
             "timestamp": datetime.now().isoformat(),
             "data": payment_data,
             "version": "1.0"
@@ -108,11 +126,23 @@ class EventPublisher:
         
         await self._publish_event("payment.events", "payment.required", event)
     
+    async def publish_refunds_requested(self, refund_data: Dict[str, Any]):
+        """Publish a batch of refund requests."""
+        event = {
+            "event_type": "payment.refund.requested",
+            "event_id": new_event_id(),
+            "timestamp": datetime.now().isoformat(),
+            "data": refund_data,
+            "version": "1.0"
+        }
+        
+        await self._publish_event("payment.events", "payment.refund.requested", event)
+    
     async def publish_notification_send(self, notification_data: Dict[str, Any]):
         """Publish notification send event."""
         event = {
             "event_type": "notification.send",
-            "event_id": f"notification_send_{datetime.now().timestamp()}",
+            "event_id": new_event_id(),
             "timestamp": datetime.now().isoformat(),
             "data": notification_data,
             "version": "1.0"
@@ -124,7 +154,7 @@ class EventPublisher:
         """Publish audit event."""
         event = {
             "event_type": "audit.log",
-            "event_id": f"audit_log_{datetime.now().timestamp()}",
+            "event_id": new_event_id(),
             "timestamp": datetime.now().isoformat(),
             "data": audit_data,
             "version": "1.0"
@@ -139,10 +169,13 @@ class EventPublisher:
                 logger.error(f"Exchange {exchange_name} not found")
                 return
             
+            body, content_type, content_encoding = self.serializer.encode(event)
             message = Message(
-                json.dumps(event).encode(),
+                body,
                 delivery_mode=DeliveryMode.PERSISTENT,
-                content_type="application/json",
+                content_type=content_type,
+                content_encoding=content_encoding,
+                message_id=event["event_id"],
                 timestamp=datetime.now()
             )
             
@@ -1,7 +1,7 @@
 from fastapi import FastAPI, HTTPException, Depends, Header
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, Session
+from prometheus_client import make_asgi_app
+from sqlalchemy.orm import Session
 import os
 from .models import Base, Booking
 from .schemas import BookingRequest, BookingOut
@@ -19,33 +19,23 @@ REDIS_URL = os.getenv("REDIS_URL")
 RABBITMQ_URL = os.getenv("RABBITMQ_URL")
 
 from .event_publisher import EventPublisher
-from .event_consumer import setup_event_consumers
+from .event_consumer import setup_event_consumers, event_consumer
 
 # Create event publisher with RABBITMQ_URL
 event_publisher = EventPublisher(RABBITMQ_URL)
 CATALOG_URL = os.getenv("CATALOG_URL")
 AUTH_URL = os.getenv("AUTH_URL")
 
-# Create engine with connection pooling and retry mechanism
-engine = create_engine(
-    DATABASE_URL,
-    pool_size=5,
-    max_overflow=10,
-    pool_pre_ping=True,
-    pool_recycle=1800,  # 30 minutes
-    pool_timeout=30,
-    connect_args={
-        "connect_timeout": 10,
-        "application_name": "booking_service"
-    }
-)
-SessionLocal = sessionmaker(bind=engine)
+from .database import engine, SessionLocal, ensure_columns, ensure_indexes
 
 r = redis.from_url(REDIS_URL, decode_responses=True)
 
 # Create FastAPI app
 app = FastAPI(title="Booking Service")
 
+# Prometheus metrics (consumer lag, throughput and latency)
+app.mount("/metrics", make_asgi_app())
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -76,6 +66,8 @@ async def startup():
         for attempt in range(max_retries):
             try:
                 Base.metadata.create_all(bind=engine)
+                ensure_columns()
+                ensure_indexes(Booking.__table__)
                 print("Database tables created successfully")
                 break
             except Exception as e:
@@ -105,6 +97,17 @@ async def shutdown():
 def health_check():
     return {"status": "healthy", "service": "booking"}
 
+@app.get("/consumer/stats")
+async def consumer_stats():
+    """In-flight, buffered and broker lag gauges for the event consumer."""
+    stats = event_consumer.get_stats()
+    try:
+        stats["queue_lag"] = await event_consumer.get_queue_lag()
+    except Exception as e:
+        print(f"Error reading queue lag: {e}")
+        stats["queue_lag"] = None
+    return stats
+
 @app.get("/test")
 def test_endpoint():
     return {"message": "Test endpoint working"}
@@ -200,11 +203,11 @@ async def create_booking(req: BookingRequest, authorization: str = Header(None),
     try:
         print(f"[{time.time():.3f}] Fetching event details from catalog service...")
         async with httpx.AsyncClient(timeout=5.0) as client:
-            resp = await client.get(f"{CATALOG_URL}/events/{req.event_id}")
-            if resp.status_code != 200:
+            # Only the seat count is needed, which catalog serves from Redis
+            resp = await client.get(f"{CATALOG_URL}/events/availability", params={"ids": str(req.event_id)})
+            capacity = resp.json()["availability"].get(str(req.event_id)) if resp.status_code == 200 else None
+            if capacity is None:
                 raise HTTPException(400, "Event not found")
-            event = resp.json()
-        capacity = event.get("capacity", 0)
         print(f"[{time.time():.3f}] Event details fetched, capacity: {capacity}")
     except httpx.TimeoutException:
         print(f"[{time.time():.3f}] Catalog service timeout")
@@ -213,6 +216,8 @@ async def create_booking(req: BookingRequest, authorization: str = Header(None),
         print(f"[{time.time():.3f}] Error fetching event: {e}")
         raise HTTPException(500, "Error fetching event details")
 
+    # Set once seats are reserved in Redis; the outer handler releases them exactly once
+    reserved_seats = False
     # Optimize Redis operations using pipeline
     try:
         print(f"[{time.time():.3f}] Starting Redis operations...")
@@ -235,12 +240,12 @@ async def create_booking(req: BookingRequest, authorization: str = Header(None),
 
         # Reserve seats in Redis (atomic operation)
         new_reserved = r.incrby(event_key, req.seats)
+        reserved_seats = True
         print(f"[{time.time():.3f}] Reserved {req.seats} seats, new total: {new_reserved}")
         
         # Verify the reservation was successful
         if new_reserved > capacity:
             print(f"[{time.time():.3f}] Reservation exceeded capacity, rolling back...")
-            r.decrby(event_key, req.seats)
             raise HTTPException(400, "Not enough seats available")
 
         # Update event capacity in catalog service with timeout
@@ -248,15 +253,17 @@ async def create_booking(req: BookingRequest, authorization: str = Header(None),
         try:
             async with httpx.AsyncClient(timeout=5.0) as client:
                 resp = await client.put(f"{CATALOG_URL}/events/{req.event_id}/capacity?seats={req.seats}")
+                if resp.status_code == 409:
+                    # The outer handler rolls back the Redis reservation
+                    print(f"[{time.time():.3f}] Event sold out in catalog")
+                    raise HTTPException(400, "Not enough seats available")
                 if resp.status_code != 200:
                     print(f"[{time.time():.3f}] Failed to update event capacity: {resp.text}")
-                    # Rollback Redis reservation
-                    r.decrby(event_key, req.seats)
                     raise HTTPException(500, "Failed to update event capacity")
+        except HTTPException:
+            raise
         except Exception as e:
             print(f"[{time.time():.3f}] Error updating event capacity: {e}")
-            # Rollback Redis reservation
-            r.decrby(event_key, req.seats)
             raise HTTPException(500, "Error updating event capacity")
         
         print(f"[{time.time():.3f}] Event capacity updated successfully")
@@ -298,14 +305,19 @@ async def create_booking(req: BookingRequest, authorization: str = Header(None),
     except Exception as e:
         print(f"[{time.time():.3f}] Booking failed with error: {e}")
         # Rollback: decrement the reserved count in Redis if it was incremented
-        try:
-            r.decrby(event_key, req.seats)
-            print(f"[{time.time():.3f}] Rolled back Redis reservation")
-        except:
-            pass
+        if reserved_seats:
+            try:
+                r.decrby(event_key, req.seats)
+                print(f"[{time.time():.3f}] Rolled back Redis reservation")
+            except:
+                pass
         raise e
 
 # Background task for RabbitMQ publishing
+BOOKING_SHARD_EXCHANGE = "booking.shards"
+# Drained by worker shard 0; takes the bookings no shard queue is bound for yet
+BOOKING_QUEUE = "booking_queue"
+
 async def publish_booking_to_rabbitmq(booking, user_id, event_id, seats):
     """Publish booking to RabbitMQ as a background task"""
     import time
@@ -313,13 +325,28 @@ async def publish_booking_to_rabbitmq(booking, user_id, event_id, seats):
         print(f"[{time.time():.3f}] Background: Starting RabbitMQ publish for booking {booking.id}")
         connection = await aio_pika.connect_robust(RABBITMQ_URL, timeout=2.0)
         async with connection:
-            channel = await connection.channel()
-            queue = await channel.declare_queue("booking_queue", durable=True)
+            # Returned (unroutable) messages raise instead of being dropped
+            channel = await connection.channel(on_return_raises=True)
+            # Worker shards are fed by a consistent-hash exchange keyed on event_id
+            exchange = await channel.declare_exchange(
+                BOOKING_SHARD_EXCHANGE,
+                aio_pika.ExchangeType.X_CONSISTENT_HASH,
+                durable=True
+            )
             payload = {"booking_id": str(booking.id), "user_id": user_id, "event_id": str(event_id), "seats": seats}
-            await channel.default_exchange.publish(
-                aio_pika.Message(body=json.dumps(payload).encode()),
-                routing_key="booking_queue"
+            message = aio_pika.Message(
+                body=json.dumps(payload).encode(),
+                delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                # Returns are matched to their publish by message_id
+                message_id=str(booking.id)
             )
+            try:
+                await exchange.publish(message, routing_key=str(event_id), mandatory=True)
+            except aio_pika.exceptions.PublishError:
+                # No shard queue is bound yet (the worker has not started), so park it where shard 0 looks
+                await channel.declare_queue(BOOKING_QUEUE, durable=True)
+                await channel.default_exchange.publish(message, routing_key=BOOKING_QUEUE, mandatory=True)
+                print(f"[{time.time():.3f}] Background: No shard bound, queued booking {booking.id} on {BOOKING_QUEUE}")
             print(f"[{time.time():.3f}] Background: Published booking message to RabbitMQ: {payload}")
     except Exception as e:
         print(f"[{time.time():.3f}] Background: Failed to publish to RabbitMQ: {e}")
@@ -331,6 +358,38 @@ async def get_user_bookings(authorization: str = Header(None), db: Session = Dep
     bookings = db.query(Booking).filter(Booking.user_id == user_id).all()
     return bookings
 
+# Matches the payment service's per-request limit
+PAYMENT_LOOKUP_BATCH = 500
+
+@app.get("/my-bookings/payments")
+async def get_user_booking_payments(authorization: str = Header(None), db: Session = Depends(get_db)):
+    """Payments of all the user's bookings, keyed by booking id, from one payment call."""
+    user_id = await get_current_user(authorization)
+    booking_ids = [str(booking_id) for (booking_id,) in db.query(Booking.id).filter(Booking.user_id == user_id).all()]
+    if not booking_ids:
+        return {"payments": {}}
+    
+    payments = {}
+    try:
+        async with httpx.AsyncClient(timeout=5.0) as client:
+            payment_url = os.getenv("PAYMENT_URL", "http://payment:8000")
+            for start in range(0, len(booking_ids), PAYMENT_LOOKUP_BATCH):
+                resp = await client.post(
+                    f"{payment_url}/payments/by-bookings",
+                    json={"booking_ids": booking_ids[start:start + PAYMENT_LOOKUP_BATCH]},
+                    headers={"Authorization": authorization}
+                )
+                if resp.status_code != 200:
+                    print(f"Failed to fetch payments: {resp.status_code} {resp.text}")
+                    raise HTTPException(502, "Payment service unavailable")
+                payments.update(resp.json()["payments"])
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error getting payment info: {e}")
+        raise HTTPException(502, "Payment service unavailable")
+    return {"payments": payments}
+
 @app.put("/confirm-booking/{booking_id}")
 async def confirm_booking(booking_id: str, db: Session = Depends(get_db)):
     booking = db.query(Booking).filter(Booking.id == booking_id).first()
@@ -0,0 +1,33 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+# Consumer metrics used to autoscale on backlog instead of CPU
+QUEUE_DEPTH = Gauge(
+    "booking_consumer_queue_depth",
+    "Messages ready on the broker, from passive queue declares",
+    ["queue"]
+)
+MESSAGES = Counter(
+    "booking_consumer_messages_total",
+    "Messages settled by the consumer",
+    ["queue", "outcome"]
+)
+MESSAGE_RATE = Gauge(
+    "booking_consumer_messages_per_second",
+    "Messages settled per second over the last sampling interval",
+    ["queue"]
+)
+HANDLER_LATENCY = Histogram(
+    "booking_consumer_handler_seconds",
+    "Handler latency per message or batch",
+    ["queue"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+REDELIVERIES = Counter(
+    "booking_consumer_redeliveries_total",
+    "Messages received again after a broker redelivery or a delayed retry",
+    ["queue"]
+)
+IN_FLIGHT = Gauge(
+    "booking_consumer_in_flight",
+    "Messages currently being handled"
+)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, DateTime, ForeignKey
+from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import declarative_base
 import uuid
@@ -14,3 +14,10 @@ class Booking(Base):
     seats = Column(Integer, default=1)
     status = Column(String, default="pending")
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    # Set when a cancelled event's job cancels the booking: event_cancelled (paid) or event_cancelled_unpaid
+    cancelled_reason = Column(String, nullable=True)
+    
+    __table_args__ = (
+        # Keyset paging over one event's bookings (bulk cancellation)
+        Index("ix_bookings_event_id_id", "event_id", "id"),
+    )
@@ -0,0 +1,79 @@
+"""Stream parked messages back to their original queue in batches.
+
+Usage:
+    python -m app.replay_parked booking.payment.completed --batch-size 100 --limit 1000
+"""
+import argparse
+import asyncio
+import logging
+import os
+import aio_pika
+from aio_pika import Message, DeliveryMode
+from .event_consumer import parking_queue_name, RETRY_COUNT_HEADER
+
+logger = logging.getLogger(__name__)
+
+async def replay_parked(queue_name: str, batch_size: int = 100, limit: int = None, connection_string: str = None) -> int:
+    """Move up to ``limit`` parked messages back onto ``queue_name``.
+    
+    Each batch is republished with publisher confirms and then acked on the
+    parking queue with one multiple-ack, so a crash mid-batch only causes
+    duplicates, never loss. Returns the number of replayed messages.
+    """
+    connection = await aio_pika.connect_robust(connection_string or os.getenv("RABBITMQ_URL"))
+    replayed = 0
+    async with connection:
+        channel = await connection.channel(publisher_confirms=True)
+        await channel.set_qos(prefetch_count=batch_size)
+        parking_queue = await channel.declare_queue(parking_queue_name(queue_name), durable=True, passive=True)
+        
+        while limit is None or replayed < limit:
+            size = batch_size if limit is None else min(batch_size, limit - replayed)
+            batch = []
+            for _ in range(size):
+                message = await parking_queue.get(no_ack=False, fail=False)
+                if message is None:
+                    break
+                batch.append(message)
+            
+            if not batch:
+                break
+            
+            publishes = []
+            for message in batch:
+                headers = dict(message.headers or {})
+                # Give the message a fresh set of retries
+                headers[RETRY_COUNT_HEADER] = 0
+                publishes.append(channel.default_exchange.publish(
+                    Message(
+                        message.body,
+                        headers=headers,
+                        content_type=message.content_type,
+                        content_encoding=message.content_encoding,
+                        message_id=message.message_id,
+                        timestamp=message.timestamp,
+                        delivery_mode=DeliveryMode.PERSISTENT
+                    ),
+                    routing_key=queue_name
+                ))
+            await asyncio.gather(*publishes)
+            await batch[-1].ack(multiple=True)
+            
+            replayed += len(batch)
+            logger.info(f"Replayed {replayed} messages to {queue_name}")
+    
+    return replayed
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay parked messages to their original queue")
+    parser.add_argument("queue", help="Original queue name, e.g. booking.payment.completed")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--limit", type=int, default=None, help="Stop after this many messages")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO)
+    replayed = asyncio.run(replay_parked(args.queue, args.batch_size, args.limit))
+    print(f"Replayed {replayed} messages from {parking_queue_name(args.queue)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import json
+import logging
+import os
+import zlib
+from datetime import datetime
+from typing import Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+PROTOBUF = "application/x-protobuf"
+DEFLATE = "deflate"
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+try:
+    from google.protobuf import json_format
+    from . import event_schemas_pb2
+except ImportError:  # pragma: no cover - generated at image build time
+    json_format = None
+    event_schemas_pb2 = None
+
+class EventSerializer:
+    """Encodes events for the broker and decodes whatever format arrives.
+    
+    The publisher picks one content type; consumers dispatch on the message's
+    ``content_type``/``content_encoding`` so producers can be switched to a
+    new format one at a time.
+    """
+    
+    def __init__(self, content_type: Optional[str] = None, compression_threshold: Optional[int] = None):
+        self.content_type = content_type or os.getenv("EVENT_CONTENT_TYPE", JSON)
+        if self.content_type == MSGPACK and msgpack is None:
+            logger.warning("msgpack is not installed, publishing events as JSON")
+            self.content_type = JSON
+        if self.content_type == PROTOBUF and event_schemas_pb2 is None:
+            logger.warning("event_schemas_pb2 is not generated, publishing events as JSON")
+            self.content_type = JSON
+        
+        # Bodies at least this large are deflated; negative disables compression
+        if compression_threshold is None:
+            compression_threshold = int(os.getenv("EVENT_COMPRESSION_THRESHOLD", "1024"))
+        self.compression_threshold = compression_threshold
+    
+    def encode(self, event: Dict[str, Any]) -> Tuple[bytes, str, Optional[str]]:
+        """Return (body, content_type, content_encoding) for an event."""
+        if self.content_type == MSGPACK:
+            body = msgpack.packb(event, use_bin_type=True)
+        elif self.content_type == PROTOBUF:
+            body = _to_protobuf(event).SerializeToString()
+        else:
+            body = json.dumps(event, separators=(",", ":")).encode()
+        
+        if 0 <= self.compression_threshold <= len(body):
+            return zlib.compress(body), self.content_type, DEFLATE
+        return body, self.content_type, None
+    
+    @staticmethod
+    def decode(body: bytes, content_type: Optional[str] = None, content_encoding: Optional[str] = None) -> Dict[str, Any]:
+        """Decode a message body produced by any supported serializer."""
+        if content_encoding == DEFLATE:
+            body = zlib.decompress(body)
+        elif content_encoding:
+            raise ValueError(f"Unsupported content encoding: {content_encoding}")
+        
+        if content_type == MSGPACK:
+            if msgpack is None:
+                raise ValueError("msgpack is not installed")
+            return msgpack.unpackb(body, raw=False)
+        if content_type == PROTOBUF:
+            if event_schemas_pb2 is None:
+                raise ValueError("event_schemas_pb2 is not generated")
+            envelope = event_schemas_pb2.EventEnvelope()
+            envelope.ParseFromString(body)
+            return _from_protobuf(envelope)
+        # Messages without a content type predate this module and are JSON
+        return json.loads(body.decode())
+
+# Payload schema per event type prefix
+_PAYLOAD_FIELDS = {
+    "booking.": "booking",
+    "payment.": "payment",
+    "audit.": "audit"
+}
+
+def _payload_field(event_type: str) -> str:
+    for prefix, field in _PAYLOAD_FIELDS.items():
+        if event_type.startswith(prefix):
+            return field
+    return "data"
+
+def _to_protobuf(event: Dict[str, Any]):
+    envelope = event_schemas_pb2.EventEnvelope(
+        event_type=event.get("event_type", ""),
+        event_id=event.get("event_id", ""),
+        version=event.get("version", "")
+    )
+    if event.get("timestamp"):
+        envelope.timestamp_ms = int(datetime.fromisoformat(event["timestamp"]).timestamp() * 1000)
+    
+    data = event.get("data") or {}
+    field = _payload_field(envelope.event_type)
+    if field == "data":
+        envelope.data.update(data)
+        return envelope
+    
+    payload = getattr(envelope, field)
+    known = payload.DESCRIPTOR.fields_by_name
+    extra = {}
+    for key, value in data.items():
+        if key in known and key != "extra" and value is not None:
+            setattr(payload, key, value)
+        else:
+            extra[key] = value
+    if extra:
+        payload.extra.update(extra)
+    # Make sure an empty payload still selects the oneof branch
+    payload.SetInParent()
+    return envelope
+
+def _from_protobuf(envelope) -> Dict[str, Any]:
+    event = {
+        "event_type": envelope.event_type,
+        "event_id": envelope.event_id,
+        "timestamp": datetime.fromtimestamp(envelope.timestamp_ms / 1000).isoformat() if envelope.timestamp_ms else None,
+        "version": envelope.version
+    }
+    field = envelope.WhichOneof("payload")
+    if field is None:
+        event["data"] = {}
+    elif field == "data":
+        event["data"] = json_format.MessageToDict(envelope.data)
+    else:
+        payload = getattr(envelope, field)
+        data = json_format.MessageToDict(payload, preserving_proto_field_name=True)
+        data.update(data.pop("extra", {}))
+        event["data"] = data
+    return event
+
+def decode_event(body: bytes, content_type: Optional[str] = None, content_encoding: Optional[str] = None) -> Dict[str, Any]:
+    return EventSerializer.decode(body, content_type, content_encoding)
@@ -0,0 +1,44 @@
+import asyncio
+import uuid
+from app.event_consumer import _booking_ids, handle_payment_completed_batch, handle_payment_failed_batch
+from app.models import Booking
+
+def payment_event(booking_id):
+    return {"event_type": "payment.completed", "data": {"booking_id": booking_id}}
+
+def test_invalid_booking_ids_are_skipped():
+    booking_id = uuid.uuid4()
+    events = [payment_event(str(booking_id)), payment_event("not-a-uuid"), payment_event(None), {"data": None}]
+    assert _booking_ids(events) == [str(booking_id)]
+
+def add_booking(db, status="pending") -> uuid.UUID:
+    booking = Booking(user_id=uuid.uuid4(), event_id=uuid.uuid4(), seats=1, status=status)
+    db.add(booking)
+    db.commit()
+    return booking.id
+
+def statuses(db, *booking_ids):
+    db.expire_all()
+    return [db.get(Booking, booking_id).status for booking_id in booking_ids]
+
+def test_batch_confirms_every_booking_with_one_update(db):
+    first, second, untouched = add_booking(db), add_booking(db), add_booking(db)
+
+    asyncio.run(handle_payment_completed_batch([payment_event(str(first)), payment_event(str(second)), payment_event("bad")]))
+
+    assert statuses(db, first, second, untouched) == ["confirmed", "confirmed", "pending"]
+
+def test_batch_marks_bookings_failed(db):
+    booking_id = add_booking(db)
+
+    asyncio.run(handle_payment_failed_batch([payment_event(str(booking_id))]))
+
+    assert statuses(db, booking_id) == ["failed"]
+
+def test_late_payment_events_leave_settled_bookings_alone(db):
+    cancelled, confirmed = add_booking(db, "cancelled"), add_booking(db, "confirmed")
+
+    asyncio.run(handle_payment_completed_batch([payment_event(str(cancelled))]))
+    asyncio.run(handle_payment_failed_batch([payment_event(str(confirmed))]))
+
+    assert statuses(db, cancelled, confirmed) == ["cancelled", "confirmed"]
@@ -0,0 +1,93 @@
+import asyncio
+import uuid
+import fakeredis.aioredis
+from app import cancellation
+from app.cancellation import EventCancellationJob, FIRST_ID, checkpoint_key, register_cancellation, resume_cancellations
+from app.database import cancel_bookings_page, EVENT_CANCELLED, EVENT_CANCELLED_UNPAID
+from app.models import Booking
+
+class StubPublisher:
+    def __init__(self):
+        self.channel = object()
+        self.refunds = []
+        self.notifications = []
+
+    async def publish_refunds_requested(self, data):
+        self.refunds.append(data)
+
+    async def publish_notification_send(self, data):
+        self.notifications.append(data)
+
+def test_refunds_only_cover_paid_bookings():
+    publisher = StubPublisher()
+    job = EventCancellationJob("event-1", redis_client=None, publisher=publisher, chunk_size=10, max_concurrency=1)
+    bookings = [
+        {"booking_id": "b1", "user_id": "u1", "seats": 2, "paid": True},
+        {"booking_id": "b2", "user_id": "u2", "seats": 1, "paid": False}
+    ]
+
+    asyncio.run(job._publish_chunk(bookings))
+
+    assert [refund["bookings"] for refund in publisher.refunds] == [[{"booking_id": "b1", "user_id": "u1", "seats": 2}]]
+    assert [(notification["type"], notification["user_ids"]) for notification in publisher.notifications] == [
+        ("event_cancelled", ["u1"]), ("event_cancelled_unpaid", ["u2"])
+    ]
+
+def test_unpaid_page_publishes_no_refunds():
+    publisher = StubPublisher()
+    job = EventCancellationJob("event-1", redis_client=None, publisher=publisher, chunk_size=10, max_concurrency=1)
+
+    asyncio.run(job._publish_chunk([{"booking_id": "b2", "user_id": "u2", "seats": 1, "paid": False}]))
+
+    assert publisher.refunds == []
+    assert [notification["type"] for notification in publisher.notifications] == ["event_cancelled_unpaid"]
+
+def test_registered_cancellation_is_resumed_after_a_restart(monkeypatch):
+    redis_client = fakeredis.aioredis.FakeRedis()
+    started = []
+    monkeypatch.setattr(cancellation, "start_cancellation", lambda event_id, *_: started.append(event_id))
+
+    async def scenario():
+        await register_cancellation("event-1", redis_client)
+        await register_cancellation("event-2", redis_client)
+        await redis_client.hset(checkpoint_key("event-2"), "status", "done")
+        # A redelivered event must not reopen a finished job
+        await register_cancellation("event-2", redis_client)
+        await resume_cancellations(redis_client, StubPublisher())
+
+    asyncio.run(scenario())
+    assert started == ["event-1"]
+
+def add_bookings(db, event_id, **statuses):
+    ids = {}
+    for name, status in statuses.items():
+        booking = Booking(user_id=uuid.uuid4(), event_id=event_id, seats=1, status=status)
+        db.add(booking)
+        ids[name] = booking
+    db.commit()
+    return {name: str(booking.id) for name, booking in ids.items()}
+
+def test_page_only_returns_bookings_the_job_cancels(db):
+    event_id = uuid.uuid4()
+    ids = add_bookings(db, event_id, confirmed="confirmed", pending="pending", cancelled="cancelled", failed="failed")
+
+    bookings, last_id = cancel_bookings_page(str(event_id), FIRST_ID, 10)
+
+    assert {booking["booking_id"]: booking["paid"] for booking in bookings} == {ids["confirmed"]: True, ids["pending"]: False}
+    assert last_id == max(ids.values())
+    reasons = {str(booking.id): (booking.status, booking.cancelled_reason) for booking in db.query(Booking).all()}
+    assert reasons == {
+        ids["confirmed"]: ("cancelled", EVENT_CANCELLED),
+        ids["pending"]: ("cancelled", EVENT_CANCELLED_UNPAID),
+        ids["cancelled"]: ("cancelled", None),
+        ids["failed"]: ("failed", None)
+    }
+
+def test_resumed_page_returns_the_same_bookings(db):
+    event_id = uuid.uuid4()
+    add_bookings(db, event_id, confirmed="confirmed", pending="pending", cancelled="cancelled")
+
+    first, _ = cancel_bookings_page(str(event_id), FIRST_ID, 10)
+    again, _ = cancel_bookings_page(str(event_id), FIRST_ID, 10)
+
+    assert sorted(first, key=lambda booking: booking["booking_id"]) == sorted(again, key=lambda booking: booking["booking_id"])
@@ -0,0 +1,55 @@
+import asyncio
+import fakeredis.aioredis
+import redis
+from app.dedup import BloomFilter, EventDeduplicator
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000, 0.01)
+    for index in range(1000):
+        bloom.add(f"event-{index}")
+    assert all(f"event-{index}" in bloom for index in range(1000))
+    false_positives = sum(f"other-{index}" in bloom for index in range(10000))
+    # Sized for 1%; allow generous slack
+    assert false_positives < 300
+
+def test_events_are_new_until_marked_processed():
+    deduplicator = EventDeduplicator(fakeredis.aioredis.FakeRedis(), "test")
+
+    async def scenario():
+        before = await deduplicator.check_many(["a", "b", "a"])
+        # Checking does not claim: an unprocessed event stays new
+        again = await deduplicator.check_many(["a"])
+        await deduplicator.mark_processed(["a", "b"])
+        return before, again, await deduplicator.check_many(["a", "c", "b"])
+
+    assert asyncio.run(scenario()) == ([True, True, False], [True], [False, True, False])
+
+def test_processed_ids_are_shared_through_redis():
+    client = fakeredis.aioredis.FakeRedis()
+    first, second = EventDeduplicator(client, "test"), EventDeduplicator(client, "test")
+
+    async def scenario():
+        await first.mark_processed(["a"])
+        return await second.is_new("a")
+
+    assert asyncio.run(scenario()) is False
+
+class DownRedis:
+    def pipeline(self, transaction: bool = True):
+        raise redis.ConnectionError("down")
+
+def test_local_filter_keeps_deduplicating_without_redis():
+    deduplicator = EventDeduplicator(DownRedis(), "test")
+
+    async def scenario():
+        first = await deduplicator.check_many(["a", "a"])
+        await deduplicator.mark_processed(["a"])
+        return first, await deduplicator.is_new("a")
+
+    assert asyncio.run(scenario()) == ([True, False], False)
+
+def test_filters_rotate_at_capacity():
+    deduplicator = EventDeduplicator(fakeredis.aioredis.FakeRedis(), "test", capacity=2)
+
+    asyncio.run(deduplicator.mark_processed(["a", "b", "c"]))
+    assert "a" in deduplicator._previous and "c" in deduplicator._current
@@ -0,0 +1,251 @@
+import asyncio
+import fakeredis.aioredis
+from prometheus_client import REGISTRY
+from app.dedup import EventDeduplicator
+from app.event_consumer import EventConsumer, RETRY_COUNT_HEADER
+
+QUEUE = "booking.payment.completed"
+
+class StubMessage:
+    """Records how a delivery was settled."""
+
+    def __init__(self, delivery_tag: int):
+        self.delivery_tag = delivery_tag
+        self.body = b"{}"
+        self.headers = {}
+        self.content_type = "application/json"
+        self.content_encoding = None
+        self.message_id = str(delivery_tag)
+        self.timestamp = None
+        self.redelivered = False
+        self.settled = []
+
+    async def ack(self, multiple: bool = False):
+        self.settled.append(("ack", multiple))
+
+    async def nack(self, multiple: bool = False, requeue: bool = True):
+        self.settled.append(("nack", multiple))
+
+    async def reject(self, requeue: bool = False):
+        self.settled.append(("reject", False))
+
+class StubExchange:
+    def __init__(self, fail_after=None):
+        self.published = []
+        self.fail_after = fail_after
+
+    async def publish(self, message, routing_key: str):
+        if self.fail_after is not None and len(self.published) >= self.fail_after:
+            raise ConnectionError("channel closed")
+        self.published.append((routing_key, message))
+
+class StubChannel:
+    def __init__(self):
+        self.default_exchange = StubExchange()
+
+def make_batch(count: int, event_ids=None):
+    """Inbox items as the batch collector queues them: (queue name, message, event)."""
+    event_ids = event_ids or [f"event-{index}" for index in range(count)]
+    return [
+        (QUEUE, StubMessage(index + 1), {"event_type": "payment.completed", "event_id": event_id, "data": {"booking_id": str(index)}})
+        for index, event_id in enumerate(event_ids)
+    ]
+
+def make_consumer(deduplicator=None) -> EventConsumer:
+    consumer = EventConsumer("amqp://unused", deduplicator=deduplicator)
+    consumer.channel = StubChannel()
+    consumer.dead_letter_exchange = StubExchange()
+    return consumer
+
+def test_batch_is_handled_and_acked_with_one_multiple_ack():
+    consumer = make_consumer()
+    batch = make_batch(3)
+    received = []
+
+    async def handler(events):
+        received.extend(events)
+
+    asyncio.run(consumer._handle_batch(QUEUE, batch, handler))
+
+    assert [event["event_id"] for event in received] == ["event-0", "event-1", "event-2"]
+    assert batch[-1][1].settled == [("ack", True)]
+    assert all(message.settled == [] for _, message, _ in batch[:-1])
+    assert consumer.processed == 3
+    assert consumer.in_flight == 0
+
+def test_failed_batch_is_sent_to_retry_and_acked():
+    consumer = make_consumer()
+    batch = make_batch(2)
+
+    async def handler(events):
+        raise RuntimeError("database down")
+
+    asyncio.run(consumer._handle_batch(QUEUE, batch, handler))
+
+    published = consumer.channel.default_exchange.published
+    assert [routing_key for routing_key, _ in published] == [f"{QUEUE}.retry.1000ms"] * 2
+    assert all(message.headers[RETRY_COUNT_HEADER] == 1 for _, message in published)
+    assert [message.settled for _, message, _ in batch] == [[("ack", False)]] * 2
+    assert consumer.failed == 2
+
+def test_publish_failure_only_requeues_what_was_not_republished():
+    consumer = make_consumer()
+    consumer.channel.default_exchange = StubExchange(fail_after=1)
+    batch = make_batch(3)
+
+    async def handler(events):
+        raise RuntimeError("database down")
+
+    asyncio.run(consumer._handle_batch(QUEUE, batch, handler))
+
+    assert [message.settled for _, message, _ in batch] == [[("ack", False)], [("nack", False)], [("nack", False)]]
+
+def test_undecodable_messages_are_parked_before_the_multiple_ack():
+    consumer = make_consumer()
+    batch = make_batch(3)
+    batch[1] = (QUEUE, batch[1][1], ValueError("bad protobuf"))
+    batch.append((QUEUE, StubMessage(4), ValueError("bad json")))
+    received = []
+
+    async def handler(events):
+        received.extend(event["event_id"] for event in events)
+
+    asyncio.run(consumer._handle_batch(QUEUE, batch, handler))
+
+    assert received == ["event-0", "event-2"]
+    assert [message.settled for _, message, _ in batch] == [[], [("ack", False)], [("ack", True)], [("ack", False)]]
+    assert len(consumer.dead_letter_exchange.published) == 2
+    assert consumer.processed == 2
+
+def test_undecodable_messages_are_parked_when_the_batch_fails():
+    consumer = make_consumer()
+    batch = make_batch(2)
+    batch[0] = (QUEUE, batch[0][1], ValueError("bad json"))
+
+    async def handler(events):
+        raise RuntimeError("database down")
+
+    asyncio.run(consumer._handle_batch(QUEUE, batch, handler))
+
+    assert [routing_key for routing_key, _ in consumer.dead_letter_exchange.published] == [QUEUE]
+    assert [routing_key for routing_key, _ in consumer.channel.default_exchange.published] == [f"{QUEUE}.retry.1000ms"]
+    assert [message.settled for _, message, _ in batch] == [[("ack", False)], [("ack", False)]]
+
+def test_exhausted_batch_is_parked():
+    consumer = make_consumer()
+    batch = make_batch(1)
+    batch[0][1].headers = {RETRY_COUNT_HEADER: consumer.max_retries}
+
+    async def handler(events):
+        raise RuntimeError("still broken")
+
+    asyncio.run(consumer._handle_batch(QUEUE, batch, handler))
+
+    assert [routing_key for routing_key, _ in consumer.dead_letter_exchange.published] == [QUEUE]
+    assert consumer.parked == 1
+
+def test_duplicates_are_dropped_before_the_handler():
+    deduplicator = EventDeduplicator(fakeredis.aioredis.FakeRedis(), "test")
+    consumer = make_consumer(deduplicator)
+    received = []
+
+    async def handler(events):
+        received.extend(event["event_id"] for event in events)
+
+    async def scenario():
+        await consumer._handle_batch(QUEUE, make_batch(3, ["a", "b", "a"]), handler)
+        # A redelivery of the whole batch is a duplicate as well
+        await consumer._handle_batch(QUEUE, make_batch(2, ["a", "b"]), handler)
+
+    asyncio.run(scenario())
+    assert received == ["a", "b"]
+
+def test_run_batches_settles_what_the_inbox_collected():
+    consumer = make_consumer()
+    batch = make_batch(4)
+    received = []
+
+    async def handler(events):
+        received.append(len(events))
+
+    async def scenario():
+        inbox = asyncio.Queue()
+        for item in batch:
+            inbox.put_nowait(item)
+        task = asyncio.create_task(consumer._run_batches(QUEUE, inbox, handler, max_batch_size=3, max_wait=0.01))
+        await asyncio.sleep(0.1)
+        task.cancel()
+
+    asyncio.run(scenario())
+    assert received == [3, 1]
+    assert batch[2][1].settled == [("ack", True)]
+    assert batch[3][1].settled == [("ack", True)]
+
+def test_batch_interrupted_mid_handler_is_processed_on_redelivery():
+    deduplicator = EventDeduplicator(fakeredis.aioredis.FakeRedis(), "test")
+    consumer = make_consumer(deduplicator)
+    received = []
+    crashed = []
+
+    async def handler(events):
+        if not crashed:
+            crashed.append(True)
+            # The process dies here: nothing is acked and nothing handled
+            raise asyncio.CancelledError()
+        received.extend(event["event_id"] for event in events)
+
+    async def scenario():
+        first = make_batch(2, ["a", "b"])
+        try:
+            await consumer._handle_batch(QUEUE, first, handler)
+        except asyncio.CancelledError:
+            pass
+        assert all(message.settled == [] for _, message, _ in first)
+        # The broker redelivers both messages
+        await consumer._handle_batch(QUEUE, make_batch(2, ["a", "b"]), handler)
+
+    asyncio.run(scenario())
+    assert received == ["a", "b"]
+
+def test_failed_batch_is_not_marked_processed():
+    deduplicator = EventDeduplicator(fakeredis.aioredis.FakeRedis(), "test")
+    consumer = make_consumer(deduplicator)
+    attempts = []
+
+    async def handler(events):
+        attempts.append([event["event_id"] for event in events])
+        if len(attempts) == 1:
+            raise RuntimeError("database down")
+
+    async def scenario():
+        await consumer._handle_batch(QUEUE, make_batch(1, ["a"]), handler)
+        # The retry tier brings it back
+        await consumer._handle_batch(QUEUE, make_batch(1, ["a"]), handler)
+
+    asyncio.run(scenario())
+    assert attempts == [["a"], ["a"]]
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+def test_batches_are_counted_for_the_autoscaling_metrics():
+    consumer = make_consumer()
+    batch = make_batch(3)
+    batch[0][1].redelivered = True
+    before = (
+        sample("booking_consumer_messages_total", queue=QUEUE, outcome="processed"),
+        sample("booking_consumer_redeliveries_total", queue=QUEUE)
+    )
+
+    async def handler(events):
+        pass
+
+    asyncio.run(consumer._handle_batch(QUEUE, batch, handler))
+
+    after = (
+        sample("booking_consumer_messages_total", queue=QUEUE, outcome="processed"),
+        sample("booking_consumer_redeliveries_total", queue=QUEUE)
+    )
+    assert (after[0] - before[0], after[1] - before[1]) == (3, 1)
+    assert sample("booking_consumer_in_flight") == 0
+    assert consumer._settled[QUEUE] == 3
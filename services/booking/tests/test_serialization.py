@@ -0,0 +1,56 @@
+import json
+import zlib
+import pytest
+from app import serialization
+from app.serialization import EventSerializer, decode_event, DEFLATE, JSON, MSGPACK, PROTOBUF
+
+BOOKING_EVENT = {
+    "event_type": "booking.created",
+    "event_id": "0190a0b0-0000-7000-8000-000000000001",
+    "timestamp": "2024-06-01T12:00:00",
+    "version": "1.0",
+    "data": {
+        "booking_id": "b-1",
+        "user_id": "u-1",
+        "event_id": "e-1",
+        "seats": 2,
+        "status": "pending",
+        "created_at": "2024-06-01T12:00:00",
+        "source": "web"
+    }
+}
+
+requires_protobuf = pytest.mark.skipif(serialization.event_schemas_pb2 is None, reason="grpcio-tools not installed")
+
+@pytest.mark.parametrize("content_type", [JSON, MSGPACK])
+def test_round_trip(content_type):
+    serializer = EventSerializer(content_type, compression_threshold=-1)
+    body, sent_type, encoding = serializer.encode(BOOKING_EVENT)
+    assert (sent_type, encoding) == (content_type, None)
+    assert decode_event(body, sent_type, encoding) == BOOKING_EVENT
+
+@requires_protobuf
+def test_protobuf_round_trip_keeps_fields_outside_the_schema():
+    body, content_type, encoding = EventSerializer(PROTOBUF, compression_threshold=-1).encode(BOOKING_EVENT)
+    assert content_type == PROTOBUF
+    assert decode_event(body, content_type, encoding) == BOOKING_EVENT
+
+@requires_protobuf
+def test_protobuf_untyped_events_use_the_struct_payload():
+    event = {**BOOKING_EVENT, "event_type": "notification.send", "data": {"type": "reminder", "user_ids": ["u-1"]}}
+    body, content_type, encoding = EventSerializer(PROTOBUF, compression_threshold=-1).encode(event)
+    assert decode_event(body, content_type, encoding)["data"] == event["data"]
+
+def test_large_bodies_are_deflated():
+    serializer = EventSerializer(JSON, compression_threshold=64)
+    body, content_type, encoding = serializer.encode(BOOKING_EVENT)
+    assert encoding == DEFLATE
+    assert json.loads(zlib.decompress(body)) == BOOKING_EVENT
+    assert decode_event(body, content_type, encoding) == BOOKING_EVENT
+
+def test_messages_without_a_content_type_are_json():
+    assert decode_event(json.dumps(BOOKING_EVENT).encode()) == BOOKING_EVENT
+
+def test_unknown_encoding_is_an_error():
+    with pytest.raises(ValueError):
+        decode_event(b"{}", JSON, "br")
@@ -0,0 +1,86 @@
+"""Live seat availability fan-out.
+
+Capacity changes are published on one Redis channel. Each catalog process
+holds a single subscription to it and fans updates out to its connected
+clients. Updates are coalesced: a client receives at most one value per
+event every AVAILABILITY_PUSH_INTERVAL, always the latest.
+"""
+import asyncio
+import json
+import os
+from typing import Dict, Optional, Set
+import redis
+import redis.asyncio as aioredis
+from .cache import AVAILABILITY_CHANNEL
+
+REDIS_URL = os.getenv("REDIS_URL")
+AVAILABILITY_PUSH_INTERVAL = float(os.getenv("CATALOG_AVAILABILITY_PUSH_INTERVAL", "1.0"))
+
+class Subscriber:
+    """A client's latest unsent value; a slow client skips intermediate values."""
+
+    def __init__(self):
+        self.capacity: Optional[int] = None
+        self._changed = asyncio.Event()
+
+    def offer(self, capacity: int):
+        self.capacity = capacity
+        self._changed.set()
+
+    async def next(self) -> int:
+        await self._changed.wait()
+        self._changed.clear()
+        return self.capacity
+
+class AvailabilityHub:
+    """One Redis subscription per process serving every connected client."""
+
+    def __init__(self, redis_url: Optional[str]):
+        self.redis_url = redis_url
+        self.subscribers: Dict[str, Set[Subscriber]] = {}
+        self._pending: Dict[str, int] = {}
+        self._tasks = []
+
+    def subscribe(self, event_id: str) -> Subscriber:
+        if not self._tasks and self.redis_url:
+            self._tasks = [asyncio.create_task(self._listen()), asyncio.create_task(self._flush())]
+        subscriber = Subscriber()
+        self.subscribers.setdefault(event_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, event_id: str, subscriber: Subscriber):
+        subscribers = self.subscribers.get(event_id)
+        if subscribers is None:
+            return
+        subscribers.discard(subscriber)
+        if not subscribers:
+            del self.subscribers[event_id]
+
+    async def _listen(self):
+        while True:
+            client = aioredis.from_url(self.redis_url)
+            try:
+                pubsub = client.pubsub()
+                await pubsub.subscribe(AVAILABILITY_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    update = json.loads(message["data"])
+                    # Only the latest value per event survives until the next flush
+                    if update["event_id"] in self.subscribers:
+                        self._pending[update["event_id"]] = update["capacity"]
+            except (redis.RedisError, OSError) as e:
+                print(f"Availability subscription lost, reconnecting: {e}")
+                await asyncio.sleep(1)
+            finally:
+                await client.aclose()
+
+    async def _flush(self):
+        while True:
+            await asyncio.sleep(AVAILABILITY_PUSH_INTERVAL)
+            pending, self._pending = self._pending, {}
+            for event_id, capacity in pending.items():
+                for subscriber in self.subscribers.get(event_id, ()):
+                    subscriber.offer(capacity)
+
+availability_hub = AvailabilityHub(REDIS_URL)
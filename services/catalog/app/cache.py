@@ -0,0 +1,262 @@
+import asyncio
+import json
+import math
+import os
+import random
+import time
+import hashlib
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import orjson
+import redis
+import redis.asyncio as aioredis
+
+REDIS_URL = os.getenv("REDIS_URL")
+CACHE_TTL = int(os.getenv("CATALOG_CACHE_TTL", "300"))
+# Higher beta refreshes earlier; 1.0 is the XFetch default
+EARLY_REFRESH_BETA = float(os.getenv("CATALOG_CACHE_BETA", "1.0"))
+LOCK_TTL_MS = 5000
+# How long a request without a cached value waits for another one's recompute
+LOCK_WAIT_SECONDS = 0.5
+# Remaining-seat counters are written through on every capacity change; the TTL only bounds drift
+AVAILABILITY_TTL = int(os.getenv("CATALOG_AVAILABILITY_TTL", "60"))
+
+GLOBAL_VERSION_KEY = "catalog:version"
+# Pub/sub channel carrying {"event_id", "capacity"} on every capacity change
+AVAILABILITY_CHANNEL = "catalog:availability"
+
+# Versions are "<epoch>.<counter>". A counter that is missing (never bumped, evicted, or
+# lost in a Redis restart) starts over under a fresh random epoch, so a version handed
+# out before, and the ETags built from it, never come back for different data
+_VERSION = """
+local function version(counter_key, nonce)
+    local epoch_key = counter_key .. ':epoch'
+    local counter = redis.call('GET', counter_key)
+    local epoch = redis.call('GET', epoch_key)
+    if not counter then
+        counter = '0'
+        redis.call('SET', counter_key, counter)
+        epoch = false
+    end
+    if not epoch then
+        epoch = nonce
+        redis.call('SET', epoch_key, epoch)
+    end
+    return epoch .. '.' .. counter
+end
+"""
+
+# Reads the version and the entry stored under that version in one round trip
+_READ_VERSIONED = _VERSION + """
+local current = version(KEYS[1], ARGV[2])
+return {current, redis.call('GET', ARGV[1] .. current)}
+"""
+
+_GET_VERSION = _VERSION + """
+return version(KEYS[1], ARGV[1])
+"""
+
+# Returns the new version of every counter
+_BUMP = _VERSION + """
+local versions = {}
+for i, counter_key in ipairs(KEYS) do
+    version(counter_key, ARGV[i])
+    redis.call('INCR', counter_key)
+    versions[i] = version(counter_key, ARGV[i])
+end
+return versions
+"""
+
+# Deletes a lock only while it still holds our token; after its TTL it may belong to someone else
+_RELEASE_LOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+def new_epoch() -> str:
+    return uuid.uuid4().hex[:12]
+
+class CatalogCache:
+    """Redis cache of serialized catalog responses.
+
+    Keys embed a version counter, so invalidating is a single INCR: readers
+    move to a new key and stale entries simply expire. Each counter is paired
+    with a random epoch, which also makes the version safe to use as an ETag. Recomputes are
+    single-flight (one request holds a short lock while the others serve the
+    stale value or wait briefly) and entries are refreshed probabilistically
+    before they expire (XFetch), so hot keys do not stampede the database.
+    Any Redis failure falls back to computing the response directly.
+    """
+
+    def __init__(self, client: Optional[aioredis.Redis]):
+        self.redis = client
+        self._read_versioned = client.register_script(_READ_VERSIONED) if client else None
+        self._get_version = client.register_script(_GET_VERSION) if client else None
+        self._bump = client.register_script(_BUMP) if client else None
+        self._release = client.register_script(_RELEASE_LOCK) if client else None
+
+    @staticmethod
+    def events_key_prefix(params: Dict) -> str:
+        digest = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+        return f"catalog:events:{digest}:v"
+
+    @staticmethod
+    def event_version_key(event_id: str) -> str:
+        return f"catalog:event:{event_id}:version"
+
+    @staticmethod
+    def event_key_prefix(event_id: str) -> str:
+        return f"catalog:event:{event_id}:v"
+
+    @staticmethod
+    def availability_key(event_id: str) -> str:
+        return f"catalog:event:{event_id}:available"
+
+    async def get_availability(self, event_ids: List[str]) -> Dict[str, Optional[int]]:
+        """Remaining seats per event from one MGET; missing or unreadable entries are None."""
+        if self.redis is None or not event_ids:
+            return {}
+        try:
+            values = await self.redis.mget([self.availability_key(event_id) for event_id in event_ids])
+        except redis.RedisError as e:
+            print(f"Catalog availability cache unavailable: {e}")
+            return {}
+        return {event_id: int(value) if value is not None else None for event_id, value in zip(event_ids, values)}
+
+    async def set_availability(self, seats: Dict[str, int], publish: bool = False):
+        """Store remaining-seat counters; ``publish`` also announces them as changes to live streams."""
+        if self.redis is None or not seats:
+            return
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for event_id, capacity in seats.items():
+                pipe.set(self.availability_key(event_id), capacity, ex=AVAILABILITY_TTL)
+                if publish:
+                    pipe.publish(AVAILABILITY_CHANNEL, orjson.dumps({"event_id": event_id, "capacity": capacity}))
+            await pipe.execute()
+        except redis.RedisError as e:
+            print(f"Failed to write catalog availability: {e}")
+
+    async def delete_availability(self, event_ids: List[str]):
+        if self.redis is None or not event_ids:
+            return
+        try:
+            await self.redis.delete(*[self.availability_key(event_id) for event_id in event_ids])
+        except redis.RedisError as e:
+            print(f"Failed to invalidate catalog availability: {e}")
+
+    async def get_or_compute(
+        self,
+        version_key: str,
+        key_prefix: str,
+        compute: Callable[[], Awaitable[Tuple[bytes, Dict[str, str]]]]
+    ) -> Tuple[bytes, Dict[str, str], Optional[str]]:
+        """Return (body, headers, version) for a versioned cache entry.
+        
+        The version is None when the cache is unavailable.
+        """
+        if self.redis is None:
+            body, headers = await compute()
+            return body, headers, None
+
+        try:
+            version, raw = await self._read_versioned(keys=[version_key], args=[key_prefix, new_epoch()])
+            version = version.decode()
+        except redis.RedisError as e:
+            print(f"Catalog cache unavailable: {e}")
+            body, headers = await compute()
+            return body, headers, None
+
+        key = key_prefix + version
+        entry = orjson.loads(raw) if raw else None
+        if entry and not self._should_refresh_early(entry):
+            return entry["body"].encode(), entry["headers"], version
+
+        token = uuid.uuid4().hex
+        locked = await self._acquire_lock(key, token)
+        if not locked:
+            if entry:
+                # Someone else is refreshing; the current value is still valid
+                return entry["body"].encode(), entry["headers"], version
+            entry = await self._wait_for(key)
+            if entry:
+                return entry["body"].encode(), entry["headers"], version
+            # The holder is slow or gone: compute without the lock, and leave its lock alone
+
+        try:
+            started = time.monotonic()
+            body, headers = await compute()
+            await self._store(key, body, headers, time.monotonic() - started)
+        finally:
+            if locked:
+                await self._release_lock(key, token)
+        return body, headers, version
+
+    async def put(self, key: str, body: bytes, headers: Optional[Dict[str, str]] = None):
+        """Write a freshly computed entry (write-through)."""
+        if self.redis is None:
+            return
+        await self._store(key, body, headers or {}, 0.0)
+
+    async def get_version(self, version_key: str) -> Optional[str]:
+        """Current version of a counter, or None when Redis is unavailable."""
+        if self.redis is None:
+            return None
+        try:
+            return (await self._get_version(keys=[version_key], args=[new_epoch()])).decode()
+        except redis.RedisError:
+            return None
+
+    async def bump(self, *version_keys: str) -> Dict[str, str]:
+        """Invalidate everything cached under the given version counters."""
+        if self.redis is None or not version_keys:
+            return {}
+        try:
+            versions = await self._bump(keys=list(version_keys), args=[new_epoch() for _ in version_keys])
+            return {version_key: version.decode() for version_key, version in zip(version_keys, versions)}
+        except redis.RedisError as e:
+            print(f"Failed to invalidate catalog cache: {e}")
+            return {}
+
+    @staticmethod
+    def _should_refresh_early(entry: Dict) -> bool:
+        # XFetch: refresh with a probability that rises as expiry approaches,
+        # scaled by how long the value took to compute
+        delta = max(entry["delta"], 0.001)
+        return time.time() - delta * EARLY_REFRESH_BETA * math.log(random.random() or 1e-12) >= entry["expiry"]
+
+    async def _store(self, key: str, body: bytes, headers: Dict[str, str], delta: float):
+        entry = {"body": body.decode(), "headers": headers, "delta": delta, "expiry": time.time() + CACHE_TTL}
+        try:
+            # Keep the entry a little past its logical expiry so it can be served stale during a refresh
+            await self.redis.set(key, orjson.dumps(entry), ex=CACHE_TTL * 2)
+        except redis.RedisError as e:
+            print(f"Failed to write catalog cache: {e}")
+
+    async def _acquire_lock(self, key: str, token: str) -> bool:
+        try:
+            return bool(await self.redis.set(f"lock:{key}", token, nx=True, px=LOCK_TTL_MS))
+        except redis.RedisError:
+            return False
+
+    async def _release_lock(self, key: str, token: str):
+        try:
+            await self._release(keys=[f"lock:{key}"], args=[token])
+        except redis.RedisError:
+            pass
+
+    async def _wait_for(self, key: str) -> Optional[Dict]:
+        deadline = time.monotonic() + LOCK_WAIT_SECONDS
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.02)
+            try:
+                raw = await self.redis.get(key)
+            except redis.RedisError:
+                return None
+            if raw:
+                return orjson.loads(raw)
+        return None
+
+catalog_cache = CatalogCache(aioredis.from_url(REDIS_URL) if REDIS_URL else None)
@@ -0,0 +1,174 @@
+"""Bulk event import.
+
+Rows are validated in batches, COPYed into a temporary staging table and
+merged into events with one INSERT ... ON CONFLICT per batch. A bad row is
+reported with its line number and skipped; a batch the database rejects is
+reported as a whole and the import carries on with the next one.
+"""
+import csv
+import io
+import json
+import os
+import uuid
+from datetime import datetime, timezone
+from typing import IO, Callable, Iterator, List, Tuple
+from pydantic import ValidationError
+from .schemas import EventCreate
+
+IMPORT_BATCH_SIZE = int(os.getenv("CATALOG_IMPORT_BATCH_SIZE", "5000"))
+# Per-row errors returned in the response; the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+
+STAGING_COLUMNS = ["line", "id", "title", "description", "date", "venue", "capacity", "created_at"]
+
+CREATE_STAGING_SQL = """
+CREATE TEMP TABLE IF NOT EXISTS events_import (
+    line integer,
+    id uuid,
+    title text,
+    description text,
+    date timestamp,
+    venue text,
+    capacity integer,
+    created_at timestamp
+) ON COMMIT DELETE ROWS
+"""
+
+COPY_SQL = f"COPY events_import ({', '.join(STAGING_COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+
+# The last occurrence of an id in a batch wins; existing events are updated in place
+MERGE_SQL = """
+INSERT INTO events (id, title, description, date, venue, capacity, created_at)
+SELECT DISTINCT ON (id) id, title, description, date, venue, capacity, created_at
+FROM events_import
+ORDER BY id, line DESC
+ON CONFLICT (id) DO UPDATE SET
+    title = EXCLUDED.title,
+    description = EXCLUDED.description,
+    date = EXCLUDED.date,
+    venue = EXCLUDED.venue,
+    capacity = EXCLUDED.capacity
+RETURNING id, (xmax = 0) AS inserted
+"""
+
+def read_rows(source: IO[bytes], format: str) -> Iterator[Tuple[int, object]]:
+    """Yield (line number, raw row) pairs; undecodable lines yield the exception."""
+    text = io.TextIOWrapper(source, encoding="utf-8", newline="")
+    if format == "csv":
+        reader = csv.DictReader(text)
+        for row in reader:
+            # Empty CSV cells mean "not set"
+            yield reader.line_num, {key: value for key, value in row.items() if value not in ("", None)}
+        return
+    for line_number, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as e:
+            yield line_number, e
+
+def validate_row(row) -> Tuple[uuid.UUID, EventCreate]:
+    if isinstance(row, Exception):
+        raise ValueError(f"Invalid JSON: {row}")
+    if not isinstance(row, dict):
+        raise ValueError("Row must be an object")
+    row = dict(row)
+    event_id = uuid.UUID(str(row.pop("id"))) if row.get("id") else uuid.uuid4()
+    row.setdefault("description", None)
+    row.setdefault("date", None)
+    row.setdefault("venue", None)
+    event = EventCreate(**row)
+    # COPY reads empty CSV fields as NULL, which title does not allow
+    if not event.title:
+        raise ValueError("title must not be empty")
+    if event.capacity < 0:
+        raise ValueError("capacity must not be negative")
+    return event_id, event
+
+def error_message(error: Exception) -> str:
+    if isinstance(error, ValidationError):
+        return "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in error.errors())
+    return str(error)
+
+def write_staging_csv(batch, created_at: datetime) -> io.StringIO:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for line_number, event_id, event in batch:
+        writer.writerow([
+            line_number, event_id, event.title, event.description,
+            event.date.isoformat() if event.date else None, event.venue, event.capacity, created_at.isoformat()
+        ])
+    buffer.seek(0)
+    return buffer
+
+class EventImport:
+    """One import run over a single raw psycopg2 connection.
+
+    ``on_updated`` is called after each batch with the IDs of existing events
+    it changed, so their cached copies can be invalidated.
+    """
+
+    def __init__(self, engine, on_updated: Callable[[List[str]], None]):
+        self.engine = engine
+        self.on_updated = on_updated
+        self.inserted = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+
+    def record_error(self, line_number: int, message: str):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line_number, "error": message})
+
+    def run(self, source: IO[bytes], format: str) -> dict:
+        conn = self.engine.raw_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(CREATE_STAGING_SQL)
+            conn.commit()
+
+            batch = []
+            for line_number, row in read_rows(source, format):
+                try:
+                    event_id, event = validate_row(row)
+                except (ValidationError, ValueError, TypeError, KeyError) as e:
+                    self.record_error(line_number, error_message(e))
+                    continue
+                batch.append((line_number, event_id, event))
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    self.load_batch(conn, batch)
+                    batch = []
+            if batch:
+                self.load_batch(conn, batch)
+        finally:
+            conn.close()
+
+        return {
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "failed": self.failed,
+            "errors": self.errors
+        }
+
+    def load_batch(self, conn, batch):
+        """COPY one validated batch into staging and merge it; staging empties on commit."""
+        try:
+            with conn.cursor() as cursor:
+                cursor.copy_expert(COPY_SQL, write_staging_csv(batch, datetime.now(timezone.utc)))
+                cursor.execute(MERGE_SQL)
+                merged = cursor.fetchall()
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"Import batch of {len(batch)} rows failed: {e}")
+            for line_number, _, _ in batch:
+                self.record_error(line_number, f"Batch rejected by the database: {e}")
+            return
+
+        updated_ids = [str(event_id) for event_id, inserted in merged if not inserted]
+        self.inserted += len(merged) - len(updated_ids)
+        self.updated += len(updated_ids)
+        if updated_ids:
+            self.on_updated(updated_ids)
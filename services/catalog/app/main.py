@@ -1,12 +1,28 @@
-from fastapi import FastAPI, HTTPException, Depends, Header
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import create_engine
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from sqlalchemy import create_engine, select, insert, or_, and_, tuple_, func, text, update
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.orm import sessionmaker, Session
 import os
 import time
+import json
+import orjson
+import asyncio
+import base64
+import csv
+import io
+import hashlib
+import re
+import tempfile
+import uuid
 from datetime import datetime
-from .models import Base, Event
-from .schemas import EventCreate, EventUpdate, EventOut
+from typing import Optional, Literal
+from .models import Base, Event, SEARCH_VECTOR_SQL
+from .schemas import EventCreate, EventUpdate, EventOut, CapacityChange
+from .cache import catalog_cache, CatalogCache, GLOBAL_VERSION_KEY
+from .importer import EventImport
+from .availability_stream import availability_hub
 
 # ------------------------------------------------------------------------------
 # Database Configuration
@@ -24,6 +40,23 @@ engine = create_engine(
 
 SessionLocal = sessionmaker(bind=engine)
 
+def async_database_url(url: str) -> str:
+    """Point a postgresql:// URL at the asyncpg driver."""
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+# Request handlers use the async engine; the sync one runs DDL at startup and COPY imports
+async_engine = create_async_engine(
+    async_database_url(DATABASE_URL),
+    pool_size=10,
+    max_overflow=20,
+    pool_pre_ping=True,
+    pool_recycle=3600,
+    connect_args={"timeout": 10}
+)
+
 # Dependency: Database session
 def get_db():
     db = SessionLocal()
@@ -39,7 +72,8 @@ def get_db():
 # ------------------------------------------------------------------------------
 # FastAPI Application Setup
 # ------------------------------------------------------------------------------
-app = FastAPI(title="Catalog Service")
+# orjson serializes UUIDs and datetimes natively and is several times faster than json
+app = FastAPI(title="Catalog Service", default_response_class=ORJSONResponse)
 
 # CORS Middleware
 app.add_middleware(
@@ -53,6 +87,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 # ------------------------------------------------------------------------------
@@ -66,6 +101,13 @@ def startup():
     for attempt in range(max_retries):
         try:
             Base.metadata.create_all(bind=engine)
+            # create_all skips columns and indexes added to a table that already exists
+            with engine.begin() as conn:
+                conn.execute(text(
+                    "ALTER TABLE events ADD COLUMN IF NOT EXISTS search_vector tsvector "
+                    f"GENERATED ALWAYS AS ({SEARCH_VECTOR_SQL}) STORED"
+                ))
+            ensure_indexes(Event.__table__)
             print("Database tables created successfully")
             break
         except Exception as e:
@@ -77,6 +119,14 @@ def startup():
                 print(f"Failed to connect to database after {max_retries} attempts")
                 raise e
 
+def ensure_indexes(table):
+    """Create the table's declared indexes; create_all skips them on existing tables.
+    
+    Failures propagate and fail startup; search and paging depend on them.
+    """
+    for index in table.indexes:
+        index.create(bind=engine, checkfirst=True)
+
 # ------------------------------------------------------------------------------
 # Health Check
 # ------------------------------------------------------------------------------
@@ -87,69 +137,563 @@ def health_check():
 # ------------------------------------------------------------------------------
 # Event Routes
 # ------------------------------------------------------------------------------
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# sort option -> (column, descending)
+SORT_COLUMNS = {
+    "date": (Event.date, False),
+    "-date": (Event.date, True),
+    "created_at": (Event.created_at, False),
+    "-created_at": (Event.created_at, True),
+}
+
+def encode_cursor(sort_value: Optional[datetime], event_id: uuid.UUID) -> str:
+    payload = [sort_value.isoformat() if sort_value else None, str(event_id)]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        sort_value, event_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return (datetime.fromisoformat(sort_value) if sort_value else None), uuid.UUID(event_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_after(column, descending: bool, sort_value: Optional[datetime], event_id: uuid.UUID):
+    """Rows strictly after the cursor in (column, id) order.
+    
+    Ascending puts NULLs last and descending puts them first, which is how a
+    (column, id) btree index is scanned forwards and backwards.
+    """
+    if descending:
+        if sort_value is None:
+            return or_(and_(column.is_(None), Event.id < event_id), column.isnot(None))
+        return tuple_(column, Event.id) < (sort_value, event_id)
+    if sort_value is None:
+        return and_(column.is_(None), Event.id > event_id)
+    return or_(tuple_(column, Event.id) > (sort_value, event_id), column.is_(None))
+
+# Every EventOut field; selecting these skips the deferred search vector and ORM identity overhead
+EVENT_COLUMNS = [Event.id, Event.title, Event.description, Event.date, Event.venue, Event.capacity, Event.created_at]
+
+def event_filters(
+    date_from: Optional[datetime],
+    date_to: Optional[datetime],
+    venue: Optional[str],
+    available: Optional[bool],
+    event_ids: Optional[list[uuid.UUID]] = None
+) -> list:
+    """WHERE conditions shared by the list and export endpoints."""
+    conditions = []
+    if event_ids is not None:
+        conditions.append(Event.id.in_(event_ids))
+    if date_from is not None:
+        conditions.append(Event.date >= date_from)
+    if date_to is not None:
+        conditions.append(Event.date < date_to)
+    if venue is not None:
+        conditions.append(Event.venue == venue)
+    if available is True:
+        conditions.append(Event.capacity > 0)
+    elif available is False:
+        conditions.append(Event.capacity <= 0)
+    return conditions
+
+def dump_events(rows) -> bytes:
+    """Serialize EVENT_COLUMNS rows straight to EventOut JSON, without model instances."""
+    return orjson.dumps([row._asdict() for row in rows], default=str)
+
+def dump_event(row) -> bytes:
+    return orjson.dumps(row._asdict(), default=str)
+
+def dump_event_fields(row) -> bytes:
+    """Serialize only the EventOut fields of a row that carries extra columns."""
+    return orjson.dumps({column.key: getattr(row, column.key) for column in EVENT_COLUMNS}, default=str)
+
+# Most event ids accepted by one ids= request (list and availability endpoints)
+MAX_EVENT_IDS = 200
+
+def parse_event_ids(ids: list[str]) -> list[str]:
+    """Normalize repeated and/or comma-separated ``ids`` values, dropping repeats."""
+    try:
+        event_ids = list(dict.fromkeys(
+            str(uuid.UUID(event_id.strip())) for value in ids for event_id in value.split(",") if event_id.strip()
+        ))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid event id")
+    if len(event_ids) > MAX_EVENT_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_EVENT_IDS} event ids per request")
+    return event_ids
+
+# Browsers and nginx may reuse a response this long before revalidating with If-None-Match
+CATALOG_MAX_AGE = int(os.getenv("CATALOG_MAX_AGE", "5"))
+
+def json_response(body: bytes, headers: dict) -> Response:
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def make_etag(tag: str) -> str:
+    return f'"{tag}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether the request's If-None-Match covers the given (strong) ETag."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    return "*" in candidates or any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+def caching_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": f"public, max-age={CATALOG_MAX_AGE}, must-revalidate"}
+
+def cached_json_response(request: Request, tag_prefix: str, body: bytes, headers: dict, version: Optional[str]) -> Response:
+    """Attach an ETag (the cache version, or a body hash without a cache) and honour If-None-Match."""
+    if version is not None:
+        etag = make_etag(f"{tag_prefix}-v{version}")
+    else:
+        etag = make_etag(f"{tag_prefix}-{hashlib.sha1(body).hexdigest()}")
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=caching_headers(etag))
+    return json_response(body, {**headers, **caching_headers(etag)})
+
+async def not_modified(request: Request, tag_prefix: str, version_key: str) -> Optional[Response]:
+    """A 304 answered from the version counter alone, without touching the DB or the cached body."""
+    if not request.headers.get("if-none-match"):
+        return None
+    version = await catalog_cache.get_version(version_key)
+    if version is None:
+        return None
+    etag = make_etag(f"{tag_prefix}-v{version}")
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=caching_headers(etag))
+    return None
+
 @app.get("/events", response_model=list[EventOut])
-def get_events(db: Session = Depends(get_db)):
-    """Get all events"""
+async def get_events(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    sort: Literal["date", "-date", "created_at", "-created_at"] = "date",
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    venue: Optional[str] = None,
+    available: Optional[bool] = None,
+    ids: Optional[list[str]] = Query(None)
+):
+    """Get one page of events.
+    
+    Pages are keyset-paginated: pass the X-Next-Cursor header of a response
+    as ``cursor`` to get the next page. The header is absent on the last page.
+    ``ids`` (repeated or comma-separated) restricts the list to those events.
+    Pages are served from the catalog cache when possible.
+    """
+    column, descending = SORT_COLUMNS[sort]
+    after = decode_cursor(cursor) if cursor else None
+    event_ids = sorted(parse_event_ids(ids)) if ids else None
+    
+    async def load_page():
+        conditions = event_filters(
+            date_from, date_to, venue, available, [uuid.UUID(event_id) for event_id in event_ids] if event_ids else None
+        )
+        query = select(*EVENT_COLUMNS).where(*conditions)
+        if after:
+            query = query.where(keyset_after(column, descending, *after))
+        
+        if descending:
+            query = query.order_by(column.desc().nulls_first(), Event.id.desc())
+        else:
+            query = query.order_by(column.asc().nulls_last(), Event.id.asc())
+        
+        try:
+            async with async_engine.connect() as conn:
+                # One extra row tells whether there is a next page
+                events = (await conn.execute(query.limit(limit + 1))).all()
+        except Exception as e:
+            print(f"Error fetching events: {e}")
+            raise HTTPException(status_code=500, detail="Failed to fetch events")
+        
+        headers = {}
+        if len(events) > limit:
+            events = events[:limit]
+            last = events[-1]
+            headers["X-Next-Cursor"] = encode_cursor(getattr(last, column.key), last.id)
+        return dump_events(events), headers
+    
+    params = {
+        "limit": limit, "cursor": cursor, "sort": sort, "date_from": date_from,
+        "date_to": date_to, "venue": venue, "available": available, "ids": event_ids
+    }
+    key_prefix = CatalogCache.events_key_prefix(params)
+    # The ETag names the page (query hash) and the catalog version
+    tag_prefix = "events-" + key_prefix.split(":")[2][:16]
+    
+    unchanged = await not_modified(request, tag_prefix, GLOBAL_VERSION_KEY)
+    if unchanged is not None:
+        return unchanged
+    
+    body, headers, version = await catalog_cache.get_or_compute(GLOBAL_VERSION_KEY, key_prefix, load_page)
+    return cached_json_response(request, tag_prefix, body, headers, version)
+
+# Rows fetched per round trip from the server-side cursor
+EXPORT_CHUNK_SIZE = int(os.getenv("CATALOG_EXPORT_CHUNK_SIZE", "2000"))
+CSV_FIELDS = ["id", "title", "description", "date", "venue", "capacity", "created_at"]
+
+async def stream_event_rows(conditions):
+    """Yield chunks of event rows from a server-side cursor, in (created_at, id) order."""
+    statement = select(*EVENT_COLUMNS).where(*conditions).order_by(Event.created_at, Event.id)
+    async with async_engine.connect() as conn:
+        result = await conn.stream(statement)
+        async for rows in result.partitions(EXPORT_CHUNK_SIZE):
+            yield rows
+
+async def export_ndjson(conditions):
+    async for rows in stream_event_rows(conditions):
+        yield b"".join(dump_event(row) + b"\n" for row in rows)
+
+def csv_row(row) -> dict:
+    # ISO timestamps so an export can be fed back to POST /events/import
+    return {
+        **row._asdict(),
+        "date": row.date.isoformat() if row.date else None,
+        "created_at": row.created_at.isoformat() if row.created_at else None
+    }
+
+async def export_csv(conditions):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDS)
+    writer.writeheader()
+    async for rows in stream_event_rows(conditions):
+        writer.writerows(csv_row(row) for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    # An empty catalog still gets its header line
+    if buffer.getvalue():
+        yield buffer.getvalue()
+
+@app.get("/events/export")
+async def export_events(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    venue: Optional[str] = None,
+    available: Optional[bool] = None
+):
+    """Stream the whole (filtered) catalog as NDJSON or CSV.
+    
+    Rows come from a server-side cursor in chunks of EXPORT_CHUNK_SIZE and
+    are written out as they arrive, so memory stays flat however large the
+    catalog is. The generator owns its connection because the response
+    outlives the request handler.
+    """
+    conditions = event_filters(date_from, date_to, venue, available)
+    if format == "csv":
+        content, media_type = export_csv(conditions), "text/csv"
+    else:
+        content, media_type = export_ndjson(conditions), "application/x-ndjson"
+    return StreamingResponse(
+        content,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="events.{format}"'}
+    )
+
+@app.get("/events/availability")
+async def get_availability(ids: list[str] = Query(...)):
+    """Remaining seats for many events in one call.
+    
+    ``ids`` may be repeated or comma-separated. Counts come from Redis where
+    possible; the rest are read with one ``id = ANY(...)`` query and written
+    back. Unknown events map to null.
+    """
+    event_ids = parse_event_ids(ids)
+    
+    availability = {event_id: None for event_id in event_ids}
+    availability.update(await catalog_cache.get_availability(event_ids))
+    missing = [uuid.UUID(event_id) for event_id, seats in availability.items() if seats is None]
+    if missing:
+        try:
+            async with async_engine.connect() as conn:
+                rows = (await conn.execute(
+                    text("SELECT id, capacity FROM events WHERE id = ANY(CAST(:event_ids AS uuid[]))"),
+                    {"event_ids": missing}
+                )).all()
+        except Exception as e:
+            print(f"Error fetching availability: {e}")
+            raise HTTPException(status_code=500, detail="Failed to fetch availability")
+        found = {str(row.id): row.capacity for row in rows}
+        await catalog_cache.set_availability(found)
+        availability.update(found)
+    return {"availability": availability}
+
+MAX_SEARCH_RESULTS = 50
+
+def build_prefix_tsquery(q: str) -> Optional[str]:
+    """Turn user input into a tsquery where the last word is a prefix match.
+    
+    Only word characters survive, so the input cannot inject tsquery operators.
+    """
+    words = re.findall(r"\w+", q.lower())
+    if not words:
+        return None
+    return " & ".join(words[:-1] + [f"{words[-1]}:*"])
+
+@app.get("/events/search", response_model=list[EventOut])
+async def search_events(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(10, ge=1, le=MAX_SEARCH_RESULTS)
+):
+    """Full-text search over title, venue and description, best matches first.
+    
+    The last word matches as a prefix, so the endpoint can back a typeahead.
+    """
+    tsquery = build_prefix_tsquery(q)
+    if tsquery is None:
+        return json_response(b"[]", {})
+    
+    query = func.to_tsquery("english", tsquery)
+    rank = func.ts_rank_cd(Event.search_vector, query)
+    statement = (
+        select(*EVENT_COLUMNS)
+        .where(Event.search_vector.op("@@")(query))
+        .order_by(rank.desc(), Event.id)
+        .limit(limit)
+    )
+    try:
+        async with async_engine.connect() as conn:
+            rows = (await conn.execute(statement)).all()
+    except Exception as e:
+        print(f"Error searching events: {e}")
+        raise HTTPException(status_code=500, detail="Failed to search events")
+    return json_response(dump_events(rows), {})
+
+# Comment lines sent while idle keep proxies from closing the stream
+STREAM_KEEPALIVE_SECONDS = 15
+
+def availability_event(event_id: str, capacity: Optional[int]) -> bytes:
+    return b"event: availability\ndata: " + orjson.dumps({"event_id": event_id, "capacity": capacity}) + b"\n\n"
+
+async def read_availability(event_id: str) -> Optional[int]:
+    cached = (await catalog_cache.get_availability([event_id])).get(event_id)
+    if cached is not None:
+        return cached
+    async with async_engine.connect() as conn:
+        capacity = await conn.scalar(select(Event.capacity).where(Event.id == uuid.UUID(event_id)))
+    if capacity is not None:
+        await catalog_cache.set_availability({event_id: capacity})
+    return capacity
+
+@app.get("/events/{event_id}/availability/stream")
+async def stream_availability(event_id: uuid.UUID):
+    """Server-Sent Events stream of an event's remaining seats.
+    
+    Sends the current count first, then at most one update per
+    CATALOG_AVAILABILITY_PUSH_INTERVAL while it changes.
+    """
+    event_id = str(event_id)
     try:
-        return db.query(Event).all()
+        capacity = await read_availability(event_id)
     except Exception as e:
-        print(f"Error fetching events: {e}")
-        raise HTTPException(status_code=500, detail="Failed to fetch events")
+        print(f"Error fetching availability: {e}")
+        raise HTTPException(status_code=500, detail="Failed to fetch availability")
+    if capacity is None:
+        raise HTTPException(status_code=404, detail="Event not found")
+    
+    async def events():
+        subscriber = availability_hub.subscribe(event_id)
+        try:
+            yield availability_event(event_id, capacity)
+            while True:
+                try:
+                    latest = await asyncio.wait_for(subscriber.next(), STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield availability_event(event_id, latest)
+        finally:
+            availability_hub.unsubscribe(event_id, subscriber)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.get("/events/{event_id}", response_model=EventOut)
-def get_event(event_id: str, db: Session = Depends(get_db)):
+async def get_event(event_id: uuid.UUID, request: Request):
     """Get a specific event by ID"""
-    try:
-        event = db.query(Event).filter(Event.id == event_id).first()
+    tag_prefix = f"event-{event_id}"
+    version_key = CatalogCache.event_version_key(str(event_id))
+    unchanged = await not_modified(request, tag_prefix, version_key)
+    if unchanged is not None:
+        return unchanged
+    
+    async def load_event():
+        try:
+            async with async_engine.connect() as conn:
+                event = (await conn.execute(select(*EVENT_COLUMNS).where(Event.id == event_id))).first()
+        except Exception as e:
+            print(f"Error fetching event {event_id}: {e}")
+            raise HTTPException(status_code=500, detail="Failed to fetch event")
         if not event:
             raise HTTPException(status_code=404, detail="Event not found")
-        return event
-    except HTTPException:
-        raise
-    except Exception as e:
-        print(f"Error fetching event {event_id}: {e}")
-        raise HTTPException(status_code=500, detail="Failed to fetch event")
+        return dump_event(event), {}
+    
+    body, headers, version = await catalog_cache.get_or_compute(
+        version_key, CatalogCache.event_key_prefix(str(event_id)), load_event
+    )
+    return cached_json_response(request, tag_prefix, body, headers, version)
 
 @app.post("/events", response_model=EventOut)
-def create_event(event: EventCreate, db: Session = Depends(get_db)):
+async def create_event(event: EventCreate):
     """Create a new event"""
     try:
-        db_event = Event(
-            title=event.title,
-            description=event.description,
-            date=event.date,
-            venue=event.venue,
-            capacity=event.capacity
-        )
-        db.add(db_event)
-        db.commit()
-        db.refresh(db_event)
-        return db_event
+        async with async_engine.begin() as conn:
+            created = (await conn.execute(
+                insert(Event)
+                .values(
+                    title=event.title,
+                    description=event.description,
+                    date=event.date,
+                    venue=event.venue,
+                    capacity=event.capacity
+                )
+                .returning(*EVENT_COLUMNS)
+            )).one()
     except Exception as e:
         print(f"Error creating event: {e}")
-        db.rollback()
         raise HTTPException(status_code=500, detail="Failed to create event")
+    # New event shows up in lists: move every list page to a new version
+    await catalog_cache.bump(GLOBAL_VERSION_KEY)
+    return json_response(dump_event(created), {})
+
+async def write_through(events):
+    """Invalidate list pages and the given events, then cache their fresh detail bodies."""
+    version_keys = [CatalogCache.event_version_key(str(event.id)) for event in events]
+    versions = await catalog_cache.bump(GLOBAL_VERSION_KEY, *version_keys)
+    await catalog_cache.set_availability({str(event.id): event.capacity for event in events}, publish=True)
+    for event, version_key in zip(events, version_keys):
+        event_version = versions.get(version_key)
+        if event_version:
+            # Write-through: the next read of this event is already warm
+            await catalog_cache.put(CatalogCache.event_key_prefix(str(event.id)) + event_version, dump_event_fields(event))
+
+# Uploads larger than this spill from memory to a temporary file
+IMPORT_SPOOL_BYTES = 8 * 1024 * 1024
+
+async def invalidate_events(event_ids):
+    await catalog_cache.bump(*[CatalogCache.event_version_key(event_id) for event_id in event_ids])
+    # Imported capacities replace the old ones; read them back on the next availability lookup
+    await catalog_cache.delete_availability(event_ids)
+
+@app.post("/events/import")
+async def import_events(request: Request, format: Optional[Literal["ndjson", "csv"]] = None):
+    """Bulk-import events from a streamed NDJSON or CSV upload.
+    
+    The format comes from ``format`` or the Content-Type (text/csv means CSV).
+    Rows with an ``id`` update that event, the others create new ones. Bad
+    rows are reported by line number without aborting the import.
+    """
+    if format is None:
+        format = "csv" if request.headers.get("content-type", "").startswith("text/csv") else "ndjson"
+    
+    loop = asyncio.get_running_loop()
+    
+    def on_updated(event_ids):
+        # Called from the import thread
+        asyncio.run_coroutine_threadsafe(invalidate_events(event_ids), loop).result()
+    
+    upload = tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_BYTES)
+    try:
+        async for chunk in request.stream():
+            upload.write(chunk)
+        upload.seek(0)
+        # COPY goes through psycopg2, so the import runs on the sync engine in a thread
+        result = await asyncio.to_thread(EventImport(engine, on_updated).run, upload, format)
+    except Exception as e:
+        print(f"Error importing events: {e}")
+        raise HTTPException(status_code=500, detail="Failed to import events")
+    finally:
+        upload.close()
+    
+    if result["inserted"] or result["updated"]:
+        await catalog_cache.bump(GLOBAL_VERSION_KEY)
+    return result
+
+@app.put("/events/capacity")
+async def update_capacities(changes: list[CapacityChange]):
+    """Apply many (event_id, seats) decrements in one statement.
+    
+    Each event is updated only if it has enough seats for the sum of its
+    changes; negative seats release capacity. Every event gets a status of
+    updated, sold_out or not_found.
+    """
+    if not changes:
+        return {"results": []}
+    statement = text("""
+        WITH deltas AS (
+            SELECT id, sum(seats) AS seats
+            FROM unnest(CAST(:event_ids AS uuid[]), CAST(:seats AS integer[])) AS d(id, seats)
+            GROUP BY id
+        ), updated AS (
+            UPDATE events e SET capacity = e.capacity - d.seats
+            FROM deltas d
+            WHERE e.id = d.id AND e.capacity >= d.seats
+            RETURNING e.id, e.title, e.description, e.date, e.venue, e.capacity, e.created_at
+        )
+        SELECT d.id, d.seats, u.title, u.description, u.date, u.venue, u.created_at,
+               u.id IS NOT NULL AS applied,
+               coalesce(u.capacity, existing.capacity) AS capacity,
+               existing.id IS NOT NULL AS found
+        FROM deltas d
+        LEFT JOIN updated u ON u.id = d.id
+        LEFT JOIN events existing ON existing.id = d.id
+    """)
+    try:
+        async with async_engine.begin() as conn:
+            rows = (await conn.execute(statement, {
+                "event_ids": [change.event_id for change in changes],
+                "seats": [change.seats for change in changes]
+            })).all()
+    except Exception as e:
+        print(f"Error updating event capacities: {e}")
+        raise HTTPException(status_code=500, detail="Failed to update event capacities")
+    
+    await write_through([row for row in rows if row.applied])
+    results = []
+    for row in rows:
+        status = "updated" if row.applied else "sold_out" if row.found else "not_found"
+        results.append({"event_id": str(row.id), "status": status, "capacity": row.capacity if row.found else None})
+    return {"results": results}
 
 @app.put("/events/{event_id}/capacity")
-def update_event_capacity(event_id: str, seats: int = None, db: Session = Depends(get_db)):
-    """Update event capacity (used by booking service)"""
+async def update_event_capacity(event_id: uuid.UUID, seats: int = None):
+    """Update event capacity (used by booking service)
+    
+    The decrement is a single conditional UPDATE, so concurrent bookings
+    cannot oversell or lose updates; 409 means not enough seats are left.
+    """
     try:
-        event = db.query(Event).filter(Event.id == event_id).first()
-        if not event:
-            raise HTTPException(status_code=404, detail="Event not found")
-        
-        if seats is not None:
-            event.capacity = max(0, event.capacity - seats)
-            db.commit()
-            db.refresh(event)
-        
-        return {"message": "Capacity updated successfully", "event": event}
-    except HTTPException:
-        raise
+        async with async_engine.begin() as conn:
+            if seats is None:
+                event = (await conn.execute(select(*EVENT_COLUMNS).where(Event.id == event_id))).first()
+            else:
+                event = (await conn.execute(
+                    update(Event)
+                    .where(Event.id == event_id, Event.capacity >= seats)
+                    .values(capacity=Event.capacity - seats)
+                    .returning(*EVENT_COLUMNS)
+                )).first()
+                exists = event is not None or await conn.scalar(select(Event.id).where(Event.id == event_id)) is not None
     except Exception as e:
         print(f"Error updating event capacity: {e}")
-        db.rollback()
         raise HTTPException(status_code=500, detail="Failed to update event capacity")
+    
+    if event is None:
+        if seats is not None and exists:
+            raise HTTPException(status_code=409, detail="Not enough seats available")
+        raise HTTPException(status_code=404, detail="Event not found")
+    if seats is not None:
+        await write_through([event])
+    return {"message": "Capacity updated successfully", "event": event._asdict()}
 
 # ------------------------------------------------------------------------------
 # Booking Cleanup Route (Example)
@@ -1,11 +1,18 @@
-from sqlalchemy import Column, String, Integer, DateTime, Text
-from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import declarative_base
+from sqlalchemy import Column, String, Integer, DateTime, Text, Index, Computed, text
+from sqlalchemy.dialects.postgresql import UUID, TSVECTOR
+from sqlalchemy.orm import declarative_base, deferred
 import uuid
 from datetime import datetime, timezone
 
 Base = declarative_base()
 
+# Weighted document for full-text search: title > venue > description
+SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(venue, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'C')"
+)
+
 class Event(Base):
     __tablename__ = "events"
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -15,3 +22,14 @@ class Event(Base):
     venue = Column(String, nullable=True)
     capacity = Column(Integer, default=0)
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    # Maintained by Postgres; deferred so regular reads do not fetch it
+    search_vector = deferred(Column(TSVECTOR, Computed(SEARCH_VECTOR_SQL, persisted=True)))
+    
+    __table_args__ = (
+        # Keyset pagination for each sort order / filter of GET /events
+        Index("ix_events_date_id", "date", "id"),
+        Index("ix_events_created_at_id", "created_at", "id"),
+        Index("ix_events_venue_date_id", "venue", "date", "id"),
+        Index("ix_events_available_date_id", "date", "id", postgresql_where=text("capacity > 0")),
+        Index("ix_events_search_vector", "search_vector", postgresql_using="gin"),
+    )
@@ -23,3 +23,7 @@ class EventUpdate(BaseModel):
     date: Optional[datetime] = None
     venue: Optional[str] = None
     capacity: Optional[int] = None
+
+class CapacityChange(BaseModel):
+    event_id: uuid.UUID
+    seats: int
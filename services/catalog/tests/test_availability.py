@@ -0,0 +1,30 @@
+import os
+import uuid
+import pytest
+from sqlalchemy import insert
+from app.main import engine
+from app.models import Base, Event
+
+pytestmark = pytest.mark.skipif(not os.getenv("TEST_DATABASE_URL"), reason="TEST_DATABASE_URL (PostgreSQL) not set")
+
+@pytest.fixture
+def events():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    rows = [{"id": uuid.uuid4(), "title": f"Event {index}", "capacity": index * 10} for index in range(3)]
+    with engine.begin() as conn:
+        conn.execute(insert(Event), rows)
+    yield rows
+    Base.metadata.drop_all(bind=engine)
+
+def test_availability_of_many_events_in_one_call(client, events):
+    unknown = str(uuid.uuid4())
+    ids = [str(row["id"]) for row in events[:2]]
+
+    response = client.get("/events/availability", params={"ids": [ids[0], f"{ids[1]},{unknown}"]})
+
+    assert response.status_code == 200
+    assert response.json() == {"availability": {ids[0]: 0, ids[1]: 10, unknown: None}}
+
+def test_availability_rejects_bad_ids(client):
+    assert client.get("/events/availability", params={"ids": "nope"}).status_code == 400
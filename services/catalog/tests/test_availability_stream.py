@@ -0,0 +1,37 @@
+import asyncio
+import fakeredis
+import fakeredis.aioredis
+from app import availability_stream
+from app.availability_stream import AvailabilityHub, Subscriber
+from app.cache import AVAILABILITY_CHANNEL
+
+def test_slow_subscriber_only_gets_the_latest_value():
+    subscriber = Subscriber()
+
+    async def scenario():
+        subscriber.offer(5)
+        subscriber.offer(4)
+        return await subscriber.next()
+
+    assert asyncio.run(scenario()) == 4
+
+def test_hub_coalesces_updates_for_subscribed_events(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(availability_stream.aioredis, "from_url", lambda url: fakeredis.aioredis.FakeRedis(server=server))
+    monkeypatch.setattr(availability_stream, "AVAILABILITY_PUSH_INTERVAL", 0.2)
+    hub = AvailabilityHub("redis://unused")
+
+    async def scenario():
+        subscriber = hub.subscribe("e1")
+        publisher = fakeredis.aioredis.FakeRedis(server=server)
+        await asyncio.sleep(0.05)
+        for event_id, capacity in (("e1", 3), ("e2", 9), ("e1", 2)):
+            await publisher.publish(AVAILABILITY_CHANNEL, f'{{"event_id": "{event_id}", "capacity": {capacity}}}')
+        latest = await asyncio.wait_for(subscriber.next(), 1)
+        hub.unsubscribe("e1", subscriber)
+        for task in hub._tasks:
+            task.cancel()
+        return latest
+
+    assert asyncio.run(scenario()) == 2
+    assert hub.subscribers == {}
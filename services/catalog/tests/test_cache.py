@@ -0,0 +1,97 @@
+import asyncio
+import fakeredis.aioredis
+import pytest
+from app import cache
+from app.cache import CatalogCache
+
+pytest.importorskip("lupa", reason="fakeredis needs lupa to run Lua scripts")
+
+VERSION_KEY = "catalog:version"
+PREFIX = "catalog:events:test:v"
+
+def make_cache() -> CatalogCache:
+    return CatalogCache(fakeredis.aioredis.FakeRedis())
+
+async def compute():
+    return b"[]", {"X-Total-Count": "0"}
+
+def test_recompute_releases_its_lock():
+    catalog_cache = make_cache()
+
+    async def scenario():
+        body, _, version = await catalog_cache.get_or_compute(VERSION_KEY, PREFIX, compute)
+        return body, version, await catalog_cache.redis.exists(f"lock:{PREFIX}{version}")
+
+    body, version, locked = asyncio.run(scenario())
+    assert (body, version.split(".")[1], locked) == (b"[]", "0", 0)
+
+def test_wait_timeout_leaves_the_holders_lock_alone(monkeypatch):
+    monkeypatch.setattr(cache, "LOCK_WAIT_SECONDS", 0.05)
+    catalog_cache = make_cache()
+
+    async def scenario():
+        await catalog_cache.redis.set(f"lock:{PREFIX}0", "someone-else")
+        body, _, _ = await catalog_cache.get_or_compute(VERSION_KEY, PREFIX, compute)
+        return body, await catalog_cache.redis.get(f"lock:{PREFIX}0")
+
+    assert asyncio.run(scenario()) == (b"[]", b"someone-else")
+
+def test_release_only_deletes_a_lock_it_still_holds():
+    catalog_cache = make_cache()
+
+    async def scenario():
+        assert await catalog_cache._acquire_lock("key", "mine")
+        assert not await catalog_cache._acquire_lock("key", "theirs")
+        # Our lock expired and another request took it
+        await catalog_cache.redis.set("lock:key", "theirs")
+        await catalog_cache._release_lock("key", "mine")
+        held_by = await catalog_cache.redis.get("lock:key")
+        await catalog_cache._release_lock("key", "theirs")
+        return held_by, await catalog_cache.redis.exists("lock:key")
+
+    assert asyncio.run(scenario()) == (b"theirs", 0)
+
+def test_bump_moves_to_the_next_version_of_the_same_epoch():
+    catalog_cache = make_cache()
+
+    async def scenario():
+        before = await catalog_cache.get_version(VERSION_KEY)
+        bumped = await catalog_cache.bump(VERSION_KEY)
+        return before, bumped[VERSION_KEY], await catalog_cache.get_version(VERSION_KEY)
+
+    before, bumped, after = asyncio.run(scenario())
+    epoch = before.split(".")[0]
+    assert (before, bumped, after) == (f"{epoch}.0", f"{epoch}.1", f"{epoch}.1")
+
+def test_versions_are_not_reused_after_redis_loses_its_counters():
+    catalog_cache = make_cache()
+
+    async def scenario():
+        await catalog_cache.bump(VERSION_KEY)
+        old = await catalog_cache.get_version(VERSION_KEY)
+        # A restart without persistence, or eviction of the counter alone
+        await catalog_cache.redis.delete(VERSION_KEY)
+        await catalog_cache.bump(VERSION_KEY)
+        return old, await catalog_cache.get_version(VERSION_KEY)
+
+    old, new = asyncio.run(scenario())
+    assert old.split(".")[1] == new.split(".")[1] == "1"
+    assert old != new
+
+def test_availability_round_trips_and_announces_changes():
+    catalog_cache = make_cache()
+
+    async def scenario():
+        pubsub = catalog_cache.redis.pubsub()
+        await pubsub.subscribe(cache.AVAILABILITY_CHANNEL)
+        await pubsub.get_message(timeout=1)
+        await catalog_cache.set_availability({"e1": 5, "e2": 0}, publish=True)
+        announced = [await pubsub.get_message(timeout=1), await pubsub.get_message(timeout=1)]
+        return await catalog_cache.get_availability(["e1", "e2", "e3"]), [message["data"] for message in announced]
+
+    availability, announced = asyncio.run(scenario())
+    assert availability == {"e1": 5, "e2": 0, "e3": None}
+    assert announced == [b'{"event_id":"e1","capacity":5}', b'{"event_id":"e2","capacity":0}']
+
+def test_availability_is_empty_without_redis():
+    assert asyncio.run(CatalogCache(None).get_availability(["e1"])) == {}
@@ -0,0 +1,42 @@
+import os
+import uuid
+import pytest
+from sqlalchemy import insert
+from app.main import engine
+from app.models import Base, Event
+
+pytestmark = pytest.mark.skipif(not os.getenv("TEST_DATABASE_URL"), reason="TEST_DATABASE_URL (PostgreSQL) not set")
+
+@pytest.fixture
+def events():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    rows = [{"id": uuid.uuid4(), "title": f"Event {index}", "capacity": 5} for index in range(2)]
+    with engine.begin() as conn:
+        conn.execute(insert(Event), rows)
+    yield [str(row["id"]) for row in rows]
+    Base.metadata.drop_all(bind=engine)
+
+def test_batch_reports_updated_sold_out_and_not_found(client, events):
+    plenty, scarce = events
+    missing = str(uuid.uuid4())
+    response = client.put("/events/capacity", json=[
+        {"event_id": plenty, "seats": 2},
+        {"event_id": plenty, "seats": 1},
+        # Changes to one event are summed, so together these need 6 of 5 seats
+        {"event_id": scarce, "seats": 3},
+        {"event_id": scarce, "seats": 3},
+        {"event_id": missing, "seats": 1}
+    ])
+    assert response.status_code == 200
+    results = {result["event_id"]: (result["status"], result["capacity"]) for result in response.json()["results"]}
+    assert results == {plenty: ("updated", 2), scarce: ("sold_out", 5), missing: ("not_found", None)}
+
+def test_negative_seats_release_capacity(client, events):
+    response = client.put("/events/capacity", json=[{"event_id": events[0], "seats": -2}])
+    assert response.json()["results"] == [{"event_id": events[0], "status": "updated", "capacity": 7}]
+
+def test_single_decrement_never_oversells(client, events):
+    assert client.put(f"/events/{events[0]}/capacity", params={"seats": 5}).json()["event"]["capacity"] == 0
+    assert client.put(f"/events/{events[0]}/capacity", params={"seats": 1}).status_code == 409
+    assert client.put(f"/events/{uuid.uuid4()}/capacity", params={"seats": 1}).status_code == 404
@@ -0,0 +1,51 @@
+import csv
+import io
+import json
+import os
+import uuid
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import insert
+from app import main
+from app.main import engine
+from app.models import Base, Event
+
+pytestmark = pytest.mark.skipif(not os.getenv("TEST_DATABASE_URL"), reason="TEST_DATABASE_URL (PostgreSQL) not set")
+
+@pytest.fixture
+def events():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    start = datetime(2024, 1, 1)
+    rows = [
+        {"id": uuid.uuid4(), "title": f"Event {index}", "venue": "Hall" if index % 2 else "Park", "capacity": index,
+         "date": start + timedelta(days=index), "created_at": start + timedelta(hours=index)}
+        for index in range(5)
+    ]
+    with engine.begin() as conn:
+        conn.execute(insert(Event), rows)
+    yield rows
+    Base.metadata.drop_all(bind=engine)
+
+def test_ndjson_export_streams_every_event_in_chunks(client, events, monkeypatch):
+    monkeypatch.setattr(main, "EXPORT_CHUNK_SIZE", 2)
+
+    response = client.get("/events/export")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    exported = [json.loads(line) for line in response.text.splitlines()]
+    assert [event["id"] for event in exported] == [str(row["id"]) for row in events]
+
+def test_csv_export_applies_filters(client, events):
+    response = client.get("/events/export", params={"format": "csv", "venue": "Hall"})
+
+    assert response.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row["id"] for row in rows] == [str(row["id"]) for row in events if row["venue"] == "Hall"]
+    assert rows[0]["date"] == events[1]["date"].isoformat()
+
+def test_csv_export_of_an_empty_catalog_has_a_header(client, events):
+    response = client.get("/events/export", params={"format": "csv", "venue": "Nowhere"})
+
+    assert response.text.splitlines() == [",".join(main.CSV_FIELDS)]
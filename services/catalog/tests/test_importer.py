@@ -0,0 +1,57 @@
+import io
+import os
+import uuid
+import pytest
+from pydantic import ValidationError
+from app.importer import read_rows, validate_row
+from app.main import engine
+from app.models import Base, Event
+
+def rows(text: str, format: str):
+    return list(read_rows(io.BytesIO(text.encode()), format))
+
+def test_ndjson_rows_keep_their_line_numbers():
+    parsed = rows('{"title": "A", "capacity": 1}\n\n{broken\n{"title": "B", "capacity": 2}\n', "ndjson")
+    assert [line_number for line_number, _ in parsed] == [1, 3, 4]
+    assert isinstance(parsed[1][1], ValueError)
+    assert parsed[2][1] == {"title": "B", "capacity": 2}
+
+def test_empty_csv_cells_are_left_out():
+    parsed = rows("title,venue,capacity\nA,,10\nB,Hall,5\n", "csv")
+    assert parsed == [(2, {"title": "A", "capacity": "10"}), (3, {"title": "B", "venue": "Hall", "capacity": "5"})]
+
+def test_validate_row_keeps_a_given_id():
+    event_id = uuid.uuid4()
+    assert validate_row({"id": str(event_id), "title": "A", "capacity": "3"}) == (event_id, validate_row({"title": "A", "capacity": 3})[1])
+
+@pytest.mark.parametrize("row, error", [
+    (ValueError("bad json"), ValueError),
+    (["not", "an", "object"], ValueError),
+    ({"title": "", "capacity": 1}, ValueError),
+    ({"title": "A", "capacity": -1}, ValueError),
+    ({"title": "A", "capacity": "many"}, ValidationError),
+    ({"title": "A", "capacity": 1, "id": "not-a-uuid"}, ValueError)
+])
+def test_validate_row_rejects_bad_rows(row, error):
+    with pytest.raises(error):
+        validate_row(row)
+
+requires_db = pytest.mark.skipif(not os.getenv("TEST_DATABASE_URL"), reason="TEST_DATABASE_URL (PostgreSQL) not set")
+
+@pytest.fixture
+def empty_catalog():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+@requires_db
+def test_import_reports_bad_lines_and_updates_existing_events(client, empty_catalog):
+    event_id = str(uuid.uuid4())
+    first = client.post("/events/import", content=f'{{"id": "{event_id}", "title": "A", "capacity": 1}}\n{{"title": ""}}\n')
+    assert first.json()["inserted"] == 1
+    assert first.json()["errors"][0]["line"] == 2
+
+    second = client.post("/events/import", content=f"id,title,capacity\n{event_id},A renamed,4\n", headers={"content-type": "text/csv"})
+    assert (second.json()["inserted"], second.json()["updated"], second.json()["failed"]) == (0, 1, 0)
+    assert client.get(f"/events/{event_id}").json()["title"] == "A renamed"
@@ -0,0 +1,77 @@
+import os
+import uuid
+from datetime import datetime, timedelta
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import insert
+from app.main import decode_cursor, encode_cursor, engine, parse_event_ids
+from app.models import Base, Event
+
+def test_cursor_round_trip():
+    event_id = uuid.uuid4()
+    assert decode_cursor(encode_cursor(datetime(2024, 6, 1, 20, 30), event_id)) == (datetime(2024, 6, 1, 20, 30), event_id)
+    # Events without a date sort last (or first, descending) and still page
+    assert decode_cursor(encode_cursor(None, event_id)) == (None, event_id)
+
+def test_invalid_cursor_is_a_400():
+    with pytest.raises(HTTPException) as error:
+        decode_cursor("not-a-cursor")
+    assert error.value.status_code == 400
+
+def test_parse_event_ids_accepts_repeated_and_comma_separated_values():
+    first, second = uuid.uuid4(), uuid.uuid4()
+    assert parse_event_ids([f"{first},{second}", str(first), ""]) == [str(first), str(second)]
+
+def test_parse_event_ids_rejects_bad_and_too_many_ids():
+    with pytest.raises(HTTPException):
+        parse_event_ids(["nope"])
+    with pytest.raises(HTTPException):
+        parse_event_ids([",".join(str(uuid.uuid4()) for _ in range(201))])
+
+requires_db = pytest.mark.skipif(not os.getenv("TEST_DATABASE_URL"), reason="TEST_DATABASE_URL (PostgreSQL) not set")
+
+@pytest.fixture
+def events():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    start = datetime(2024, 1, 1)
+    rows = [
+        {"id": uuid.uuid4(), "title": f"Event {index}", "capacity": index,
+         # Two events share a date and two have none, to exercise the id tie-breaker and NULL handling
+         "date": None if index >= 7 else start + timedelta(days=min(index, 5)),
+         "created_at": start + timedelta(hours=index)}
+        for index in range(9)
+    ]
+    with engine.begin() as conn:
+        conn.execute(insert(Event), rows)
+    yield rows
+    Base.metadata.drop_all(bind=engine)
+
+def fetch_all(client, **params):
+    ids, cursor = [], None
+    while True:
+        response = client.get("/events", params={**params, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        ids.extend(event["id"] for event in response.json())
+        cursor = response.headers.get("x-next-cursor")
+        if not cursor:
+            return ids
+
+@requires_db
+@pytest.mark.parametrize("sort", ["date", "-date", "created_at", "-created_at"])
+def test_pages_cover_every_event_once_in_order(client, events, sort):
+    column = sort.lstrip("-")
+    descending = sort.startswith("-")
+
+    def order(row):
+        # Ascending puts NULLs last, descending first, ties broken by id
+        value = row[column]
+        return (value is None, value or datetime.min, str(row["id"]))
+
+    expected = [str(row["id"]) for row in sorted(events, key=order, reverse=descending)]
+    assert fetch_all(client, sort=sort, limit=2) == expected
+
+@requires_db
+def test_ids_filter_returns_only_those_events(client, events):
+    wanted = sorted(str(row["id"]) for row in events[:3])
+    assert sorted(fetch_all(client, ids=",".join(wanted), limit=2)) == wanted
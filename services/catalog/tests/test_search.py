@@ -0,0 +1,42 @@
+import os
+import uuid
+import pytest
+from sqlalchemy import insert
+from app.main import build_prefix_tsquery, engine
+from app.models import Base, Event
+
+def test_last_word_is_a_prefix():
+    assert build_prefix_tsquery("Jazz Fest") == "jazz & fest:*"
+    assert build_prefix_tsquery("roc") == "roc:*"
+
+def test_operators_and_punctuation_are_dropped():
+    assert build_prefix_tsquery("rock & !roll | (live):*") == "rock & roll & live:*"
+    assert build_prefix_tsquery("  &|!  ") is None
+
+requires_db = pytest.mark.skipif(not os.getenv("TEST_DATABASE_URL"), reason="TEST_DATABASE_URL (PostgreSQL) not set")
+
+@pytest.fixture
+def events():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    rows = [
+        {"id": uuid.uuid4(), "title": "Jazz Festival", "venue": "Harbour Hall", "description": "Three nights of jazz", "capacity": 10},
+        {"id": uuid.uuid4(), "title": "Rock Night", "venue": "Jazz Cellar", "description": "Loud guitars", "capacity": 10},
+        {"id": uuid.uuid4(), "title": "Poetry Reading", "venue": "Library", "description": "Quiet evening", "capacity": 10}
+    ]
+    with engine.begin() as conn:
+        conn.execute(insert(Event), rows)
+    yield rows
+    Base.metadata.drop_all(bind=engine)
+
+@requires_db
+def test_title_matches_rank_above_venue_matches(client, events):
+    response = client.get("/events/search", params={"q": "jaz"})
+    assert response.status_code == 200
+    assert [event["title"] for event in response.json()] == ["Jazz Festival", "Rock Night"]
+
+@requires_db
+def test_input_without_words_returns_nothing(client, events):
+    response = client.get("/events/search", params={"q": "&&"})
+    assert response.status_code == 200
+    assert response.json() == []
@@ -0,0 +1,142 @@
+"""Local stand-in for a payment processor, for load-testing payments offline.
+
+POST /charges answers 202 and reports the outcome to the charge's
+callback_url after a sampled latency (SIM_MODE=async), or waits that latency
+and answers with the outcome directly (SIM_MODE=sync). Latency is lognormal
+around SIM_LATENCY_MEDIAN_MS; a share of charges is declined, fails with a
+503, or hangs past any reasonable client timeout. GET /charges/{reference}
+reports how a charge ended, so callers can settle charges whose response or
+webhook was lost; charges that failed with a 503 were never taken and are
+unknown there.
+"""
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from collections import OrderedDict
+from typing import Optional
+import asyncio
+import hashlib
+import hmac
+import json
+import math
+import os
+import random
+import uuid
+import httpx
+
+SIM_MODE = os.getenv("SIM_MODE", "async")
+SIM_LATENCY_MEDIAN_MS = float(os.getenv("SIM_LATENCY_MEDIAN_MS", "300"))
+SIM_LATENCY_SIGMA = float(os.getenv("SIM_LATENCY_SIGMA", "0.5"))
+SIM_LATENCY_MAX_MS = float(os.getenv("SIM_LATENCY_MAX_MS", "10000"))
+SIM_DECLINE_RATE = float(os.getenv("SIM_DECLINE_RATE", "0.05"))
+SIM_ERROR_RATE = float(os.getenv("SIM_ERROR_RATE", "0.01"))
+SIM_TIMEOUT_RATE = float(os.getenv("SIM_TIMEOUT_RATE", "0"))
+SIM_TIMEOUT_SECONDS = float(os.getenv("SIM_TIMEOUT_SECONDS", "60"))
+SIM_WEBHOOK_RETRIES = int(os.getenv("SIM_WEBHOOK_RETRIES", "5"))
+SIM_CHARGE_HISTORY = int(os.getenv("SIM_CHARGE_HISTORY", "100000"))
+PAYMENT_WEBHOOK_SECRET = os.getenv("PAYMENT_WEBHOOK_SECRET", "")
+
+DECLINE_REASONS = ["Insufficient funds", "Card declined", "Do not honor"]
+
+app = FastAPI(title="Payment Simulator")
+
+stats = {"charges": 0, "succeeded": 0, "declined": 0, "errors": 0, "timeouts": 0, "webhooks_failed": 0}
+webhook_client: Optional[httpx.AsyncClient] = None
+# Pending settlements; the event loop only keeps weak references to tasks
+settlements = set()
+# Latest state per charge reference, oldest dropped past SIM_CHARGE_HISTORY
+charges: "OrderedDict[str, dict]" = OrderedDict()
+
+class Charge(BaseModel):
+    reference: str
+    amount: float
+    phone_number: Optional[str] = None
+    callback_url: Optional[str] = None
+
+@app.on_event("startup")
+async def startup():
+    global webhook_client
+    webhook_client = httpx.AsyncClient(timeout=5.0)
+
+@app.on_event("shutdown")
+async def shutdown():
+    await webhook_client.aclose()
+
+@app.get("/health")
+def health_check():
+    return {"status": "healthy", "service": "payment-simulator"}
+
+@app.get("/stats")
+def get_stats():
+    return stats
+
+def record_charge(reference: str, state: dict):
+    charges[reference] = state
+    charges.move_to_end(reference)
+    while len(charges) > SIM_CHARGE_HISTORY:
+        charges.popitem(last=False)
+
+@app.get("/charges/{reference}")
+def get_charge(reference: str):
+    if reference not in charges:
+        return JSONResponse({"detail": "Charge not found"}, status_code=404)
+    return charges[reference]
+
+def sample_latency() -> float:
+    """Processing time in seconds: lognormal, so most charges are quick and a few are very slow."""
+    latency_ms = random.lognormvariate(math.log(SIM_LATENCY_MEDIAN_MS), SIM_LATENCY_SIGMA)
+    return min(latency_ms, SIM_LATENCY_MAX_MS) / 1000
+
+def sample_outcome() -> dict:
+    if random.random() < SIM_DECLINE_RATE:
+        stats["declined"] += 1
+        return {"status": "failed", "reason": random.choice(DECLINE_REASONS)}
+    stats["succeeded"] += 1
+    return {"status": "succeeded"}
+
+@app.post("/charges")
+async def create_charge(charge: Charge):
+    stats["charges"] += 1
+    charge_id = str(uuid.uuid4())
+
+    roll = random.random()
+    if roll < SIM_ERROR_RATE:
+        stats["errors"] += 1
+        return JSONResponse({"detail": "Processor unavailable"}, status_code=503)
+    record_charge(charge.reference, {"id": charge_id, "reference": charge.reference, "status": "pending"})
+    if roll < SIM_ERROR_RATE + SIM_TIMEOUT_RATE:
+        # The charge still goes through; only the response is lost to the caller's timeout
+        stats["timeouts"] += 1
+        await asyncio.sleep(SIM_TIMEOUT_SECONDS)
+
+    if SIM_MODE == "sync" or not charge.callback_url:
+        await asyncio.sleep(sample_latency())
+        outcome = {"id": charge_id, "reference": charge.reference, **sample_outcome()}
+        record_charge(charge.reference, outcome)
+        return outcome
+
+    task = asyncio.create_task(settle_later(charge, charge_id))
+    settlements.add(task)
+    task.add_done_callback(settlements.discard)
+    return JSONResponse({"id": charge_id, "reference": charge.reference, "status": "pending"}, status_code=202)
+
+async def settle_later(charge: Charge, charge_id: str):
+    await asyncio.sleep(sample_latency())
+    outcome = {"id": charge_id, "reference": charge.reference, **sample_outcome()}
+    record_charge(charge.reference, outcome)
+    body = json.dumps(outcome).encode()
+    headers = {"Content-Type": "application/json"}
+    if PAYMENT_WEBHOOK_SECRET:
+        headers["X-Signature"] = hmac.new(PAYMENT_WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+
+    # Retried with backoff like a real processor; the receiver must treat repeats as no-ops
+    for attempt in range(SIM_WEBHOOK_RETRIES):
+        try:
+            resp = await webhook_client.post(charge.callback_url, content=body, headers=headers)
+            if resp.status_code < 500:
+                return
+        except httpx.HTTPError as e:
+            print(f"Webhook for {charge.reference} failed: {e}")
+        await asyncio.sleep(min(2 ** attempt, 30))
+    stats["webhooks_failed"] += 1
+    print(f"Giving up on webhook for {charge.reference}")
@@ -0,0 +1,187 @@
+"""Payment gateway adapters.
+
+A gateway either settles a charge in its response or accepts it and reports
+the outcome later through the payment webhook. Each gateway owns a pooled
+HTTP client, and a semaphore bounds the charges in flight so that a slow
+processor queues requests here instead of opening unbounded connections.
+
+PAYMENT_GATEWAY selects the adapter: "none" (the default) completes every
+payment immediately without calling out; "simulator" talks to the local
+payment-simulator service, or any processor speaking the same API.
+
+A charge is only reported failed when it certainly was not taken. When the
+outcome is unknown (a timeout, a dropped connection, a 5xx) it stays pending
+until the webhook arrives or a later lookup at the processor settles it.
+"""
+import asyncio
+import hashlib
+import hmac
+import os
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Optional
+import httpx
+
+PAYMENT_GATEWAY = os.getenv("PAYMENT_GATEWAY", "none")
+PAYMENT_GATEWAY_URL = os.getenv("PAYMENT_GATEWAY_URL", "http://payment-simulator:8000")
+PAYMENT_GATEWAY_MAX_CONNECTIONS = int(os.getenv("PAYMENT_GATEWAY_MAX_CONNECTIONS", "100"))
+PAYMENT_GATEWAY_CONCURRENCY = int(os.getenv("PAYMENT_GATEWAY_CONCURRENCY", "50"))
+PAYMENT_GATEWAY_TIMEOUT = float(os.getenv("PAYMENT_GATEWAY_TIMEOUT", "10"))
+# How long a charge may wait for a free slot before the request is turned away
+PAYMENT_GATEWAY_QUEUE_TIMEOUT = float(os.getenv("PAYMENT_GATEWAY_QUEUE_TIMEOUT", "5"))
+PAYMENT_WEBHOOK_URL = os.getenv("PAYMENT_WEBHOOK_URL", "http://payment:8000/payments/webhook")
+PAYMENT_WEBHOOK_SECRET = os.getenv("PAYMENT_WEBHOOK_SECRET", "")
+# Local development only: accept unsigned webhooks when no secret is set
+PAYMENT_WEBHOOK_ALLOW_UNSIGNED = os.getenv("PAYMENT_WEBHOOK_ALLOW_UNSIGNED", "false").lower() == "true"
+
+COMPLETED = "completed"
+PENDING = "pending"
+FAILED = "failed"
+
+class GatewayBusy(Exception):
+    """Every concurrency slot stayed taken for PAYMENT_GATEWAY_QUEUE_TIMEOUT."""
+
+@dataclass
+class ChargeResult:
+    status: str  # completed, pending or failed
+    reference: Optional[str] = None
+    reason: Optional[str] = None
+
+def sign_webhook(body: bytes, secret: str = PAYMENT_WEBHOOK_SECRET) -> str:
+    return hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+def verify_webhook(body: bytes, signature: Optional[str], secret: str = PAYMENT_WEBHOOK_SECRET,
+                   allow_unsigned: bool = PAYMENT_WEBHOOK_ALLOW_UNSIGNED) -> bool:
+    if not secret:
+        return allow_unsigned
+    return signature is not None and hmac.compare_digest(sign_webhook(body, secret), signature)
+
+class PaymentGateway(ABC):
+    name = "abstract"
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    @abstractmethod
+    async def charge(self, payment_id: str, amount: float, phone_number: str) -> ChargeResult:
+        """Start a charge; a pending result is settled later by the webhook."""
+
+    async def lookup(self, payment_id: str) -> Optional[ChargeResult]:
+        """Ask the processor how a charge ended; None when it cannot tell (yet)."""
+        return None
+
+class NoGateway(PaymentGateway):
+    """Completes every payment on the spot, as before any processor was wired in."""
+    name = "none"
+
+    async def charge(self, payment_id: str, amount: float, phone_number: str) -> ChargeResult:
+        return ChargeResult(COMPLETED)
+
+class SimulatorGateway(PaymentGateway):
+    """Client for the payment-simulator API: POST /charges, answered 200 or 202."""
+    name = "simulator"
+
+    def __init__(self, base_url: str, max_connections: int, concurrency: int, timeout: float, webhook_url: str):
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.webhook_url = webhook_url
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.client: Optional[httpx.AsyncClient] = None
+
+    async def start(self):
+        # One pooled client per gateway, so a slow processor cannot starve other outbound calls
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+            timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 3.0))
+        )
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def charge(self, payment_id: str, amount: float, phone_number: str) -> ChargeResult:
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), PAYMENT_GATEWAY_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise GatewayBusy(f"{self.name} gateway has {PAYMENT_GATEWAY_CONCURRENCY} charges in flight")
+        try:
+            resp = await self.client.post("/charges", json={
+                "reference": payment_id,
+                "amount": amount,
+                "phone_number": phone_number,
+                "callback_url": self.webhook_url
+            })
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+            # The request never reached the processor, so nothing was charged
+            print(f"Gateway unreachable charging payment {payment_id}: {e}")
+            return ChargeResult(FAILED, reason="Payment gateway unavailable")
+        except httpx.HTTPError as e:
+            # The charge may have gone through before the response was lost; the webhook or a lookup settles it
+            print(f"Gateway error charging payment {payment_id}, outcome unknown: {e}")
+            return ChargeResult(PENDING)
+        finally:
+            self.semaphore.release()
+
+        if resp.status_code >= 500:
+            print(f"Gateway answered {resp.status_code} charging payment {payment_id}, outcome unknown")
+            return ChargeResult(PENDING)
+        body = response_json(resp)
+        if body is None:
+            print(f"Gateway sent an unreadable {resp.status_code} response charging payment {payment_id}")
+            # Only a rejection is known not to have charged
+            return ChargeResult(FAILED, reason="Payment declined") if resp.status_code >= 400 else ChargeResult(PENDING)
+        if resp.status_code == 202:
+            return ChargeResult(PENDING, body.get("id"))
+        if resp.status_code == 200 and body.get("status") == "succeeded":
+            return ChargeResult(COMPLETED, body.get("id"))
+        return ChargeResult(FAILED, body.get("id"), body.get("reason") or "Payment declined")
+
+    async def lookup(self, payment_id: str) -> Optional[ChargeResult]:
+        try:
+            resp = await self.client.get(f"/charges/{payment_id}")
+        except httpx.HTTPError as e:
+            print(f"Gateway error looking up payment {payment_id}: {e}")
+            return None
+        if resp.status_code == 404:
+            # The processor has no record of it, so the charge never arrived
+            return ChargeResult(FAILED, reason="Charge not received by the payment gateway")
+        body = response_json(resp) if resp.status_code == 200 else None
+        if body is None:
+            return None
+        if body.get("status") == "succeeded":
+            return ChargeResult(COMPLETED, body.get("id"))
+        if body.get("status") == "failed":
+            return ChargeResult(FAILED, body.get("id"), body.get("reason") or "Payment declined")
+        return None
+
+def response_json(resp: httpx.Response) -> Optional[dict]:
+    try:
+        body = resp.json()
+    except ValueError:
+        return None
+    return body if isinstance(body, dict) else None
+
+def create_gateway(name: str = PAYMENT_GATEWAY) -> PaymentGateway:
+    if name == "none":
+        return NoGateway()
+    # A webhook settles payments, so an unauthenticated one would let anyone mark them paid
+    if not PAYMENT_WEBHOOK_SECRET and not PAYMENT_WEBHOOK_ALLOW_UNSIGNED:
+        raise RuntimeError(
+            f"PAYMENT_GATEWAY={name} requires PAYMENT_WEBHOOK_SECRET "
+            "(or PAYMENT_WEBHOOK_ALLOW_UNSIGNED=true for local development)"
+        )
+    if name == "simulator":
+        return SimulatorGateway(
+            PAYMENT_GATEWAY_URL,
+            PAYMENT_GATEWAY_MAX_CONNECTIONS,
+            PAYMENT_GATEWAY_CONCURRENCY,
+            PAYMENT_GATEWAY_TIMEOUT,
+            PAYMENT_WEBHOOK_URL
+        )
+    raise ValueError(f"Unknown PAYMENT_GATEWAY: {name}")
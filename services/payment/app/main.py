@@ -1,19 +1,23 @@
-from fastapi import FastAPI, HTTPException, Depends, Header
+from fastapi import FastAPI, HTTPException, Depends, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import sessionmaker, Session
+import asyncio
 import os
 import json
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from .models import Base, Payment
-from .schemas import PaymentRequest, PaymentResponse
+from .schemas import PaymentRequest, PaymentResponse, PaymentsByBookingsRequest
+from .outbox import OutboxRelay, outbox_event, RABBITMQ_URL
+from .gateway import create_gateway, verify_webhook, GatewayBusy, NoGateway, COMPLETED, PENDING, FAILED
 import httpx
 import uuid
 import time
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 AUTH_URL = os.getenv("AUTH_URL")
-BOOKING_URL = os.getenv("BOOKING_URL")
 
 # Create engine with connection pooling and retry mechanism
 engine = create_engine(
@@ -26,6 +30,17 @@ engine = create_engine(
 )
 SessionLocal = sessionmaker(bind=engine)
 
+# Publishes payment events committed through the outbox
+outbox_relay = OutboxRelay(engine, RABBITMQ_URL)
+
+# Processor that charges payments (PAYMENT_GATEWAY, "none" completes them immediately)
+gateway = create_gateway()
+
+# Pending payments older than this are looked up at the gateway, for outcomes whose webhook never came
+PAYMENT_RECHECK_AFTER_SECONDS = int(os.getenv("PAYMENT_RECHECK_AFTER_SECONDS", "300"))
+PAYMENT_RECHECK_INTERVAL = float(os.getenv("PAYMENT_RECHECK_INTERVAL", "60"))
+recheck_task = None
+
 # Create FastAPI app
 app = FastAPI(title="Payment Service")
 
@@ -39,7 +54,7 @@ app.add_middleware(
 )
 
 @app.on_event("startup")
-def startup():
+async def startup():
     # Add retry mechanism for database connection
     max_retries = 5
     retry_delay = 5
@@ -47,6 +62,8 @@ def startup():
     for attempt in range(max_retries):
         try:
             Base.metadata.create_all(bind=engine)
+            retire_duplicate_completed_payments()
+            ensure_indexes(Payment.__table__)
             print("Database tables created successfully")
             break
         except Exception as e:
@@ -57,6 +74,50 @@ def startup():
             else:
                 print(f"Failed to connect to database after {max_retries} attempts")
                 raise e
+    
+    await gateway.start()
+    outbox_relay.start()
+    global recheck_task
+    if not isinstance(gateway, NoGateway):
+        recheck_task = asyncio.create_task(run_pending_rechecks())
+
+@app.on_event("shutdown")
+async def shutdown():
+    if recheck_task is not None:
+        recheck_task.cancel()
+    await outbox_relay.stop()
+    await gateway.close()
+
+def retire_duplicate_completed_payments():
+    """Keep one open payment per booking and mark the rest "duplicate".
+    
+    The completed one (or else the oldest pending one) is kept.
+    uq_payments_completed_booking_id and uq_payments_open_booking_id cannot
+    be built over tables that predate them while they hold duplicates, and
+    the ON CONFLICT inserts depend on those indexes. Once both exist there
+    can be no duplicates, so the table scan is skipped.
+    """
+    existing = {index["name"] for index in inspect(engine).get_indexes("payments")}
+    if {"uq_payments_completed_booking_id", "uq_payments_open_booking_id"} <= existing:
+        return
+    with engine.begin() as conn:
+        retired = conn.execute(text(
+            "UPDATE payments SET status = 'duplicate' WHERE id IN ("
+            "SELECT id FROM (SELECT id, row_number() OVER ("
+            "PARTITION BY booking_id ORDER BY status = 'completed' DESC, created_at, id) AS n "
+            "FROM payments WHERE status IN ('pending', 'completed')) ranked WHERE n > 1)"
+        )).rowcount
+    if retired:
+        print(f"Marked {retired} duplicate open payments as 'duplicate'; they need a review and possibly a refund")
+
+def ensure_indexes(table):
+    """Create the table's declared indexes; create_all skips them on existing tables.
+    
+    Failures propagate, so the service does not start without an index the
+    write path relies on.
+    """
+    for index in table.indexes:
+        index.create(bind=engine, checkfirst=True)
 
 @app.get("/health")
 def health_check():
@@ -91,34 +152,222 @@ async def get_current_user(authorization: str = Header(None)):
 async def process_payment(payment_req: PaymentRequest, authorization: str = Header(None), db: Session = Depends(get_db)):
     user_id = await get_current_user(authorization)
     
-    # Create payment record
-    payment = Payment(
-        user_id=user_id,
-        booking_id=payment_req.booking_id,
-        amount=payment_req.amount,
-        phone_number=payment_req.phone_number,
-        status="completed"
-    )
-    db.add(payment)
-    db.commit()
-    db.refresh(payment)
+    if isinstance(gateway, NoGateway):
+        return complete_instantly(payment_req, user_id, db)
+    
+    # A resubmission while the first charge is still open must not charge twice:
+    # only the request whose insert creates the open payment goes on to charge
+    payment_id = open_payment(db, payment_req, user_id)
+    if payment_id is None:
+        existing = db.query(Payment.id, Payment.user_id, Payment.status).filter(
+            Payment.booking_id == payment_req.booking_id,
+            Payment.status.in_(OPEN_STATUSES)
+        ).first()
+        if existing is None:
+            # The other attempt settled as failed in between
+            raise HTTPException(409, "Another payment for this booking just finished, please retry")
+        if str(existing.user_id) != str(user_id):
+            raise HTTPException(409, "Booking already paid")
+        return payment_response(existing.id, existing.status)
     
-    # Update booking status to confirmed with reduced timeout
     try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.put(f"{BOOKING_URL}/confirm-booking/{payment_req.booking_id}", timeout=2.0)
-            if resp.status_code != 200:
-                print(f"Failed to confirm booking: {resp.text}")
-    except Exception as e:
-        print(f"Error confirming booking: {e}")
-        # Don't fail the payment if booking confirmation fails
+        result = await gateway.charge(str(payment_id), payment_req.amount, payment_req.phone_number)
+    except GatewayBusy as e:
+        print(f"Payment {payment_id} not charged: {e}")
+        # Nothing was charged, so the booking stays payable
+        db.execute(update(Payment).where(Payment.id == payment_id).values(status=FAILED))
+        db.commit()
+        raise HTTPException(503, "Payment gateway busy, please retry")
+    
+    if result.status == PENDING:
+        return payment_response(payment_id, PENDING)
+    status = settle_payment(db, payment_id, result.status == COMPLETED, result.reason)
+    if status is None:
+        # The webhook got there first
+        status = db.query(Payment.status).filter(Payment.id == payment_id).scalar()
+    if status != COMPLETED:
+        raise HTTPException(402, result.reason or "Payment declined")
+    return payment_response(payment_id, COMPLETED)
+
+# Statuses covered by uq_payments_open_booking_id
+OPEN_STATUSES = [PENDING, COMPLETED]
+
+def open_payment(db: Session, payment_req: PaymentRequest, user_id):
+    """Insert the booking's pending payment; None if it already has an open one."""
+    payment_id = db.execute(
+        insert(Payment)
+        .values(
+            user_id=user_id,
+            booking_id=payment_req.booking_id,
+            amount=payment_req.amount,
+            phone_number=payment_req.phone_number,
+            status=PENDING
+        )
+        .on_conflict_do_nothing(index_elements=["booking_id"], index_where=Payment.status.in_(OPEN_STATUSES))
+        .returning(Payment.id)
+    ).scalar()
+    db.commit()
+    return payment_id
+
+def complete_instantly(payment_req: PaymentRequest, user_id, db: Session) -> PaymentResponse:
+    """Record a completed payment without a processor (PAYMENT_GATEWAY=none)."""
+    # A booking has at most one completed payment: a duplicate submission
+    # inserts nothing and is answered with the payment that already exists
+    payment_id = db.execute(
+        insert(Payment)
+        .values(
+            user_id=user_id,
+            booking_id=payment_req.booking_id,
+            amount=payment_req.amount,
+            phone_number=payment_req.phone_number,
+            status=COMPLETED
+        )
+        .on_conflict_do_nothing(index_elements=["booking_id"], index_where=Payment.status == "completed")
+        .returning(Payment.id)
+    ).scalar()
+    
+    if payment_id is None:
+        db.rollback()
+        # The completed payment, or one still open from before the gateway was switched off
+        existing = db.query(Payment.id, Payment.user_id, Payment.status).filter(
+            Payment.booking_id == payment_req.booking_id,
+            Payment.status.in_(OPEN_STATUSES)
+        ).first()
+        if existing is None or str(existing.user_id) != str(user_id):
+            raise HTTPException(409, "Booking already paid")
+        if existing.status != COMPLETED:
+            return payment_response(existing.id, existing.status)
+        return PaymentResponse(
+            payment_id=str(existing.id),
+            message="Payment already processed",
+            requires_verification=False
+        )
+    
+    # Booking confirms the booking when it consumes this event; committing it
+    # with the payment means neither can exist without the other
+    db.add(outbox_event("payment.events", "payment.completed", {
+        "booking_id": str(payment_req.booking_id),
+        "payment_id": str(payment_id),
+        "user_id": str(user_id),
+        "amount": payment_req.amount
+    }))
+    db.commit()
+    outbox_relay.wake()
     
+    return payment_response(payment_id, COMPLETED)
+
+def payment_response(payment_id, status: str) -> PaymentResponse:
+    message = "Payment processed successfully" if status == COMPLETED else "Payment is being processed"
     return PaymentResponse(
-        payment_id=str(payment.id),
-        message="Payment processed successfully",
-        requires_verification=False
+        payment_id=str(payment_id),
+        message=message,
+        requires_verification=False,
+        status=status
     )
 
+def settle_payment(db: Session, payment_id, succeeded: bool, reason: str = None):
+    """Move a pending payment to completed or failed and queue its event.
+    
+    Returns the new status, or None when the payment was no longer pending
+    (a repeated webhook, or the charge response and webhook racing).
+    """
+    status = COMPLETED if succeeded else FAILED
+    try:
+        row = db.execute(
+            update(Payment)
+            .where(Payment.id == payment_id, Payment.status == PENDING)
+            .values(status=status)
+            .returning(Payment.booking_id, Payment.user_id, Payment.amount)
+        ).first()
+    except IntegrityError:
+        # Another payment for the booking completed first (uq_payments_completed_booking_id)
+        db.rollback()
+        db.execute(update(Payment).where(Payment.id == payment_id, Payment.status == PENDING).values(status="duplicate"))
+        db.commit()
+        print(f"Payment {payment_id} succeeded for an already paid booking; it needs a refund")
+        return "duplicate"
+    if row is None:
+        db.rollback()
+        return None
+    
+    data = {
+        "booking_id": str(row.booking_id),
+        "payment_id": str(payment_id),
+        "user_id": str(row.user_id),
+        "amount": row.amount
+    }
+    if succeeded:
+        db.add(outbox_event("payment.events", "payment.completed", data))
+    else:
+        already_paid = db.query(Payment.id).filter(
+            Payment.booking_id == row.booking_id,
+            Payment.status == COMPLETED
+        ).first()
+        # A declined retry must not fail a booking another payment already confirmed
+        if already_paid is None:
+            db.add(outbox_event("payment.events", "payment.failed", {**data, "reason": reason or "Payment declined"}))
+    db.commit()
+    outbox_relay.wake()
+    return status
+
+async def recheck_pending_payments(db: Session, older_than: float = PAYMENT_RECHECK_AFTER_SECONDS) -> int:
+    """Settle stale pending payments from the gateway's record of the charge.
+    
+    Covers charges whose outcome was lost (a timeout, a 5xx) and whose
+    webhook never arrived. Returns the number of payments settled.
+    """
+    # created_at is stored as naive UTC
+    cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=older_than)
+    payment_ids = [
+        payment_id for (payment_id,) in
+        db.query(Payment.id).filter(Payment.status == PENDING, Payment.created_at < cutoff).order_by(Payment.created_at)
+    ]
+    db.rollback()
+    settled = 0
+    for payment_id in payment_ids:
+        result = await gateway.lookup(str(payment_id))
+        if result is None or result.status == PENDING:
+            continue
+        if settle_payment(db, payment_id, result.status == COMPLETED, result.reason) is not None:
+            settled += 1
+    return settled
+
+async def run_pending_rechecks():
+    while True:
+        await asyncio.sleep(PAYMENT_RECHECK_INTERVAL)
+        db = SessionLocal()
+        try:
+            settled = await recheck_pending_payments(db)
+            if settled:
+                print(f"Settled {settled} stale pending payments from the gateway")
+        except Exception as e:
+            print(f"Pending payment recheck failed: {e}")
+        finally:
+            db.close()
+
+@app.post("/payments/webhook")
+async def payment_webhook(request: Request, x_signature: str = Header(None), db: Session = Depends(get_db)):
+    """Final outcome of a charge the gateway accepted as pending; safe to deliver more than once."""
+    body = await request.body()
+    if not verify_webhook(body, x_signature):
+        raise HTTPException(401, "Invalid signature")
+    try:
+        notification = json.loads(body)
+        payment_id = uuid.UUID(str(notification["reference"]))
+        outcome = notification["status"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(400, "Invalid webhook payload")
+    if outcome not in ("succeeded", "failed"):
+        raise HTTPException(400, f"Unknown status: {outcome}")
+    
+    status = settle_payment(db, payment_id, outcome == "succeeded", notification.get("reason"))
+    if status is None:
+        current = db.query(Payment.status).filter(Payment.id == payment_id).scalar()
+        if current is None:
+            raise HTTPException(404, "Payment not found")
+        return {"payment_id": str(payment_id), "status": current}
+    return {"payment_id": str(payment_id), "status": status}
+
 @app.get("/payment-receipt/{payment_id}")
 async def get_payment_receipt(payment_id: str, authorization: str = Header(None), db: Session = Depends(get_db)):
     user_id = await get_current_user(authorization)
@@ -143,10 +392,11 @@ async def get_payment_receipt(payment_id: str, authorization: str = Header(None)
 async def get_payment_by_booking(booking_id: str, authorization: str = Header(None), db: Session = Depends(get_db)):
     user_id = await get_current_user(authorization)
     
+    # A booking can have several attempts: report the completed one, else the latest
     payment = db.query(Payment).filter(
         Payment.booking_id == booking_id,
         Payment.user_id == user_id
-    ).first()
+    ).order_by((Payment.status == COMPLETED).desc(), Payment.created_at.desc()).first()
     
     if not payment:
         raise HTTPException(404, "Payment not found for this booking")
@@ -157,4 +407,42 @@ async def get_payment_by_booking(booking_id: str, authorization: str = Header(No
         "status": payment.status,
         "created_at": payment.created_at,
         "phone_number": payment.phone_number
-    } 
\ No newline at end of file
+    }
+
+MAX_BATCH_BOOKINGS = 500
+
+def payment_to_dict(payment: Payment) -> dict:
+    return {
+        "payment_id": str(payment.id),
+        "booking_id": str(payment.booking_id),
+        "amount": payment.amount,
+        "status": payment.status,
+        "created_at": payment.created_at,
+        "phone_number": payment.phone_number
+    }
+
+@app.post("/payments/by-bookings")
+async def get_payments_by_bookings(
+    req: PaymentsByBookingsRequest,
+    authorization: str = Header(None),
+    db: Session = Depends(get_db)
+):
+    """The current user's payment for each of many bookings, in one query.
+    
+    Bookings without a payment are left out. If a booking has several
+    payments, the completed one (else the latest) is returned.
+    """
+    user_id = await get_current_user(authorization)
+    if len(req.booking_ids) > MAX_BATCH_BOOKINGS:
+        raise HTTPException(400, f"At most {MAX_BATCH_BOOKINGS} bookings per request")
+    if not req.booking_ids:
+        return {"payments": {}}
+    
+    payments = (
+        db.query(Payment)
+        .filter(Payment.booking_id.in_(req.booking_ids), Payment.user_id == user_id)
+        .distinct(Payment.booking_id)
+        .order_by(Payment.booking_id, (Payment.status == "completed").desc(), Payment.created_at.desc())
+        .all()
+    )
+    return {"payments": {str(payment.booking_id): payment_to_dict(payment) for payment in payments}}
@@ -1,5 +1,5 @@
-from sqlalchemy import Column, String, Integer, DateTime, Float, ForeignKey
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, String, Integer, Date, DateTime, Float, ForeignKey, Index, text
+from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import declarative_base
 import uuid
 from datetime import datetime, timezone
@@ -13,5 +13,64 @@ class Payment(Base):
     booking_id = Column(UUID(as_uuid=True), nullable=False)
     amount = Column(Float, nullable=False)
     phone_number = Column(String, nullable=False)
-    status = Column(String, default="completed")
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc)) 
\ No newline at end of file
+    status = Column(String, default="completed")  # pending until the gateway settles it; failed, duplicate
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    
+    __table_args__ = (
+        Index("ix_payments_booking_id", "booking_id"),
+        # Receipts and payment history per user, newest first
+        Index("ix_payments_user_id_created_at", "user_id", "created_at"),
+        # Date-range scans by the reconciliation job
+        Index("ix_payments_created_at", "created_at"),
+        # At most one completed payment per booking; complete_instantly inserts with ON CONFLICT against it
+        Index(
+            "uq_payments_completed_booking_id",
+            "booking_id",
+            unique=True,
+            postgresql_where=text("status = 'completed'")
+        ),
+        # At most one open (pending or completed) payment per booking, so two submissions cannot both charge
+        Index(
+            "uq_payments_open_booking_id",
+            "booking_id",
+            unique=True,
+            postgresql_where=text("status IN ('pending', 'completed')")
+        ),
+    )
+
+class OutboxEvent(Base):
+    """An event written in the same transaction as the change it announces.
+
+    The relay publishes unpublished rows to RabbitMQ and stamps published_at.
+    """
+    __tablename__ = "payment_outbox"
+    id = Column(UUID(as_uuid=True), primary_key=True)  # the envelope's event_id
+    exchange = Column(String, nullable=False)
+    routing_key = Column(String, nullable=False)
+    payload = Column(JSONB, nullable=False)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    published_at = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        # The relay only ever scans the unpublished tail
+        Index("ix_payment_outbox_unpublished", "created_at", postgresql_where=text("published_at IS NULL")),
+    )
+
+class PaymentDailyRollup(Base):
+    """Payment totals per event and day, written by app.reconcile.
+
+    Payments whose booking no longer exists are counted under the nil event ID.
+    """
+    __tablename__ = "payment_daily_rollups"
+    event_id = Column(UUID(as_uuid=True), primary_key=True)
+    day = Column(Date, primary_key=True)
+    payments = Column(Integer, nullable=False, default=0)
+    completed = Column(Integer, nullable=False, default=0)
+    completed_amount = Column(Float, nullable=False, default=0)
+    pending = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    # Completed payments whose booking is not confirmed (pending, failed or cancelled)
+    unconfirmed = Column(Integer, nullable=False, default=0)
+    # Payments referring to a booking that does not exist
+    orphaned = Column(Integer, nullable=False, default=0)
+    reconciled_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
@@ -0,0 +1,182 @@
+"""Transactional outbox for payment events.
+
+Handlers add an OutboxEvent in the same transaction as the payment, so an
+event exists if and only if the payment committed. OutboxRelay publishes
+pending rows to RabbitMQ with publisher confirms and then marks them
+published. Delivery is at-least-once; consumers deduplicate on event_id.
+"""
+import asyncio
+import json
+import os
+import secrets
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+import aio_pika
+from sqlalchemy import text
+from .models import OutboxEvent
+
+RABBITMQ_URL = os.getenv("RABBITMQ_URL")
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+# Fallback polling for rows committed by other replicas; local commits wake the relay directly
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1.0"))
+OUTBOX_RETENTION_HOURS = int(os.getenv("OUTBOX_RETENTION_HOURS", "24"))
+PURGE_INTERVAL_SECONDS = 600
+
+def new_event_id() -> uuid.UUID:
+    """Time-ordered event ID (UUIDv7 layout), same scheme as booking's events."""
+    unix_ms = time.time_ns() // 1_000_000
+    value = (unix_ms & 0xFFFFFFFFFFFF) << 80
+    value |= 0x7 << 76  # version 7
+    value |= secrets.randbits(12) << 64
+    value |= 0b10 << 62  # RFC 4122 variant
+    value |= secrets.randbits(62)
+    return uuid.UUID(int=value)
+
+def outbox_event(exchange: str, event_type: str, data: Dict[str, Any]) -> OutboxEvent:
+    """Build an outbox row carrying the standard event envelope."""
+    event_id = new_event_id()
+    return OutboxEvent(
+        id=event_id,
+        exchange=exchange,
+        routing_key=event_type,
+        payload={
+            "event_type": event_type,
+            "event_id": str(event_id),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "data": data,
+            "version": "1.0"
+        }
+    )
+
+def claim_pending(conn, limit: int):
+    # SKIP LOCKED lets several payment replicas relay side by side
+    return conn.execute(
+        text(
+            "SELECT id, exchange, routing_key, payload FROM payment_outbox "
+            "WHERE published_at IS NULL ORDER BY created_at LIMIT :limit FOR UPDATE SKIP LOCKED"
+        ),
+        {"limit": limit}
+    ).all()
+
+def mark_published(conn, event_ids):
+    conn.execute(
+        text("UPDATE payment_outbox SET published_at = now() WHERE id = ANY(CAST(:event_ids AS uuid[]))"),
+        {"event_ids": event_ids}
+    )
+
+def purge_published(engine) -> int:
+    with engine.begin() as conn:
+        result = conn.execute(
+            text("DELETE FROM payment_outbox WHERE published_at < now() - make_interval(hours => :hours)"),
+            {"hours": OUTBOX_RETENTION_HOURS}
+        )
+        return result.rowcount
+
+class OutboxRelay:
+    """Background task draining payment_outbox into RabbitMQ."""
+
+    def __init__(self, engine, connection_string: Optional[str]):
+        self.engine = engine
+        self.connection_string = connection_string
+        self.connection: Optional[aio_pika.RobustConnection] = None
+        self.channel: Optional[aio_pika.Channel] = None
+        self.exchanges: Dict[str, aio_pika.Exchange] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._last_purge = 0.0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.connection is not None:
+            await self.connection.close()
+
+    def wake(self):
+        """Publish right away instead of at the next poll."""
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                if self.channel is None or self.channel.is_closed:
+                    await self._connect()
+                # Keep draining while full batches come back
+                while await self.relay_batch() == OUTBOX_BATCH_SIZE:
+                    pass
+                await self._purge_if_due()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Outbox relay error: {e}")
+                await asyncio.sleep(OUTBOX_POLL_INTERVAL)
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), OUTBOX_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _connect(self):
+        if self.connection is None or self.connection.is_closed:
+            self.connection = await aio_pika.connect_robust(self.connection_string)
+        # Publisher confirms (the aio_pika default) make publish() wait for the broker's ack
+        self.channel = await self.connection.channel(publisher_confirms=True)
+        self.exchanges = {}
+
+    async def _exchange(self, name: str) -> aio_pika.Exchange:
+        if name not in self.exchanges:
+            self.exchanges[name] = await self.channel.declare_exchange(name, aio_pika.ExchangeType.TOPIC, durable=True)
+        return self.exchanges[name]
+
+    async def relay_batch(self) -> int:
+        """Publish one batch of pending events; returns how many were published."""
+        conn = await asyncio.to_thread(self.engine.connect)
+        try:
+            transaction = await asyncio.to_thread(conn.begin)
+            rows = await asyncio.to_thread(claim_pending, conn, OUTBOX_BATCH_SIZE)
+            if not rows:
+                await asyncio.to_thread(transaction.rollback)
+                return 0
+
+            # Rows stay locked until the commit, so no other relay publishes them meanwhile.
+            # Publishing them together pipelines the confirms instead of paying a round trip each.
+            for name in {row.exchange for row in rows}:
+                await self._exchange(name)
+            await asyncio.gather(*[self._publish(row) for row in rows])
+
+            await asyncio.to_thread(mark_published, conn, [row.id for row in rows])
+            await asyncio.to_thread(transaction.commit)
+            return len(rows)
+        finally:
+            await asyncio.to_thread(conn.close)
+
+    async def _publish(self, row):
+        await self.exchanges[row.exchange].publish(
+            aio_pika.Message(
+                json.dumps(row.payload).encode(),
+                content_type="application/json",
+                delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                message_id=str(row.id),
+                timestamp=datetime.now(timezone.utc)
+            ),
+            routing_key=row.routing_key
+        )
+
+    async def _purge_if_due(self):
+        if time.monotonic() - self._last_purge < PURGE_INTERVAL_SECONDS:
+            return
+        self._last_purge = time.monotonic()
+        purged = await asyncio.to_thread(purge_published, self.engine)
+        if purged:
+            print(f"Purged {purged} published outbox events")
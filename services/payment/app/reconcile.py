@@ -0,0 +1,122 @@
+"""Reconcile payments against bookings and roll them up per event and day.
+
+Usage:
+    python -m app.reconcile --from 2024-06-01 --to 2024-06-30 --output june.csv
+
+Both dates are inclusive. Payments are streamed through a server-side cursor
+in chunks; each chunk's bookings are fetched with one ID-array query, so
+memory grows with the number of (event, day) groups, never with the number
+of payments. The totals are upserted into payment_daily_rollups, which makes
+re-running a range overwrite its earlier figures, and written to a CSV.
+"""
+import argparse
+import csv
+import os
+import uuid
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Tuple
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.dialects.postgresql import insert
+from .models import Payment, PaymentDailyRollup
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+RECONCILE_CHUNK_SIZE = int(os.getenv("RECONCILE_CHUNK_SIZE", "5000"))
+
+# Rollup key for payments whose booking is missing
+UNKNOWN_EVENT = uuid.UUID(int=0)
+
+COUNTERS = ["payments", "completed", "completed_amount", "pending", "failed", "unconfirmed", "orphaned"]
+
+def new_totals() -> Dict[str, float]:
+    return dict.fromkeys(COUNTERS, 0)
+
+def booking_statuses(conn, booking_ids) -> Dict[uuid.UUID, Tuple[uuid.UUID, str]]:
+    # bookings lives in the same database; booking owns the table, payment only reads it
+    rows = conn.execute(
+        text("SELECT id, event_id, status FROM bookings WHERE id = ANY(CAST(:booking_ids AS uuid[]))"),
+        {"booking_ids": [str(booking_id) for booking_id in booking_ids]}
+    )
+    return {row.id: (row.event_id, row.status) for row in rows}
+
+def aggregate(engine, start: date, end: date, chunk_size: int = RECONCILE_CHUNK_SIZE):
+    """One pass over the payments created from ``start`` through ``end``."""
+    totals = defaultdict(new_totals)
+    query = (
+        select(Payment.booking_id, Payment.amount, Payment.status, Payment.created_at)
+        .where(
+            Payment.created_at >= datetime.combine(start, time.min),
+            Payment.created_at < datetime.combine(end + timedelta(days=1), time.min)
+        )
+    )
+
+    # The stream holds its connection open, so bookings are looked up on a second one
+    with engine.connect() as stream, engine.connect() as lookup:
+        result = stream.execution_options(stream_results=True, yield_per=chunk_size).execute(query)
+        scanned = 0
+        for chunk in result.partitions():
+            bookings = booking_statuses(lookup, {payment.booking_id for payment in chunk})
+            for payment in chunk:
+                event_id, booking_status = bookings.get(payment.booking_id, (UNKNOWN_EVENT, None))
+                group = totals[(event_id, payment.created_at.date())]
+                group["payments"] += 1
+                if booking_status is None:
+                    group["orphaned"] += 1
+                if payment.status == "completed":
+                    group["completed"] += 1
+                    group["completed_amount"] += payment.amount
+                    if booking_status is not None and booking_status != "confirmed":
+                        group["unconfirmed"] += 1
+                elif payment.status == "pending":
+                    group["pending"] += 1
+                else:
+                    # failed, and duplicate charges awaiting a refund
+                    group["failed"] += 1
+            scanned += len(chunk)
+            print(f"Reconciled {scanned} payments")
+    return totals
+
+def write_rollups(engine, totals):
+    rows = [{"event_id": event_id, "day": day, **group} for (event_id, day), group in totals.items()]
+    if not rows:
+        return
+    PaymentDailyRollup.__table__.create(bind=engine, checkfirst=True)
+    statement = insert(PaymentDailyRollup)
+    statement = statement.on_conflict_do_update(
+        index_elements=["event_id", "day"],
+        set_={**{name: statement.excluded[name] for name in COUNTERS}, "reconciled_at": text("now()")}
+    )
+    with engine.begin() as conn:
+        for offset in range(0, len(rows), RECONCILE_CHUNK_SIZE):
+            conn.execute(statement, rows[offset:offset + RECONCILE_CHUNK_SIZE])
+
+def write_csv(path: str, totals):
+    with open(path, "w", newline="") as output:
+        writer = csv.writer(output)
+        writer.writerow(["day", "event_id", *COUNTERS])
+        for (event_id, day), group in sorted(totals.items(), key=lambda item: (item[0][1], str(item[0][0]))):
+            writer.writerow([day.isoformat(), event_id, *(group[name] for name in COUNTERS)])
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconcile payments against bookings per event and day")
+    parser.add_argument("--from", dest="start", type=date.fromisoformat, required=True, help="First day, YYYY-MM-DD")
+    parser.add_argument("--to", dest="end", type=date.fromisoformat, required=True, help="Last day (inclusive)")
+    parser.add_argument("--output", default=None, help="CSV path (default reconciliation_<from>_<to>.csv)")
+    parser.add_argument("--chunk-size", type=int, default=RECONCILE_CHUNK_SIZE)
+    args = parser.parse_args()
+    if args.end < args.start:
+        parser.error("--to must not be before --from")
+
+    engine = create_engine(DATABASE_URL)
+    totals = aggregate(engine, args.start, args.end, args.chunk_size)
+    write_rollups(engine, totals)
+    output = args.output or f"reconciliation_{args.start}_{args.end}.csv"
+    write_csv(output, totals)
+
+    unconfirmed = sum(group["unconfirmed"] for group in totals.values())
+    orphaned = sum(group["orphaned"] for group in totals.values())
+    print(f"Wrote {len(totals)} event/day rows to payment_daily_rollups and {output}")
+    print(f"{unconfirmed} completed payments with unconfirmed bookings, {orphaned} payments without a booking")
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 import uuid
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 class PaymentRequest(BaseModel):
@@ -12,10 +12,14 @@ class PaymentResponse(BaseModel):
     payment_id: str
     message: str
     requires_verification: bool
+    status: str = "completed"
 
 class PaymentReceipt(BaseModel):
     payment_id: str
     amount: float
     status: str
     created_at: datetime
-    phone_number: str 
\ No newline at end of file
+    phone_number: str
+
+class PaymentsByBookingsRequest(BaseModel):
+    booking_ids: List[uuid.UUID]
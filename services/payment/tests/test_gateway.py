@@ -0,0 +1,74 @@
+import asyncio
+import json
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from app import gateway
+from app.gateway import create_gateway, sign_webhook, verify_webhook, SimulatorGateway, COMPLETED, FAILED, PENDING
+from app.main import app
+
+BODY = json.dumps({"reference": "00000000-0000-0000-0000-000000000001", "status": "succeeded"}).encode()
+
+def test_signed_webhook_is_accepted():
+    assert verify_webhook(BODY, sign_webhook(BODY, "s3cret"), secret="s3cret")
+
+def test_bad_or_missing_signature_is_rejected():
+    assert not verify_webhook(BODY, sign_webhook(BODY, "other"), secret="s3cret")
+    assert not verify_webhook(BODY, None, secret="s3cret")
+
+def test_unsigned_webhooks_need_the_explicit_dev_flag():
+    assert not verify_webhook(BODY, None, secret="")
+    assert verify_webhook(BODY, None, secret="", allow_unsigned=True)
+
+def test_gateway_without_webhook_secret_refuses_to_start(monkeypatch):
+    monkeypatch.setattr(gateway, "PAYMENT_WEBHOOK_SECRET", "")
+    monkeypatch.setattr(gateway, "PAYMENT_WEBHOOK_ALLOW_UNSIGNED", False)
+    with pytest.raises(RuntimeError):
+        create_gateway("simulator")
+    # Instant completion takes no webhooks, so it needs no secret
+    assert create_gateway("none").name == "none"
+
+def test_unsigned_webhook_is_refused_by_default():
+    client = TestClient(app)
+    response = client.post("/payments/webhook", content=BODY)
+    assert response.status_code == 401
+
+def simulator(handler) -> SimulatorGateway:
+    simulator = SimulatorGateway("http://processor", max_connections=1, concurrency=1, timeout=1.0, webhook_url="http://payment/webhook")
+    simulator.client = httpx.AsyncClient(base_url="http://processor", transport=httpx.MockTransport(handler))
+    return simulator
+
+def charge_with(handler):
+    return asyncio.run(simulator(handler).charge("payment-1", 10.0, "+10000000000"))
+
+def raising(error):
+    def handler(request):
+        raise error("boom", request=request)
+    return handler
+
+def test_charge_that_never_left_is_failed():
+    assert charge_with(raising(httpx.ConnectError)).status == FAILED
+
+@pytest.mark.parametrize("error", [httpx.ReadTimeout, httpx.ReadError, httpx.RemoteProtocolError])
+def test_lost_response_leaves_the_charge_pending(error):
+    assert charge_with(raising(error)).status == PENDING
+
+def test_server_error_and_unreadable_success_stay_pending():
+    assert charge_with(lambda request: httpx.Response(503, json={"detail": "down"})).status == PENDING
+    assert charge_with(lambda request: httpx.Response(200, text="<html>ok</html>")).status == PENDING
+
+def test_charge_outcomes():
+    assert charge_with(lambda request: httpx.Response(202, json={"id": "c1"})).status == PENDING
+    assert charge_with(lambda request: httpx.Response(200, json={"id": "c1", "status": "succeeded"})).status == COMPLETED
+    declined = charge_with(lambda request: httpx.Response(200, json={"id": "c1", "status": "failed", "reason": "Card declined"}))
+    assert (declined.status, declined.reason) == (FAILED, "Card declined")
+
+def lookup_with(handler):
+    return asyncio.run(simulator(handler).lookup("payment-1"))
+
+def test_lookup_maps_the_processor_record():
+    assert lookup_with(lambda request: httpx.Response(404)).status == FAILED
+    assert lookup_with(lambda request: httpx.Response(200, json={"status": "succeeded"})).status == COMPLETED
+    assert lookup_with(lambda request: httpx.Response(200, json={"status": "pending"})) is None
+    assert lookup_with(lambda request: httpx.Response(503)) is None
+    assert lookup_with(raising(httpx.ReadTimeout)) is None
@@ -0,0 +1,73 @@
+import asyncio
+import os
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.models import Base, OutboxEvent
+from app.outbox import OutboxRelay, new_event_id, outbox_event
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+requires_db = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL (PostgreSQL) not set")
+
+class StubExchange:
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.published = []
+
+    async def publish(self, message, routing_key: str):
+        if self.fail:
+            raise ConnectionError("broker gone")
+        self.published.append((routing_key, message.message_id))
+
+@pytest.fixture
+def engine():
+    engine = create_engine(TEST_DATABASE_URL)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    try:
+        yield engine
+    finally:
+        Base.metadata.drop_all(bind=engine)
+        engine.dispose()
+
+def add_events(engine, count: int):
+    session = sessionmaker(bind=engine)()
+    events = [outbox_event("payment.events", "payment.completed", {"booking_id": str(index)}) for index in range(count)]
+    session.add_all(events)
+    session.commit()
+    event_ids = [str(event.id) for event in events]
+    session.close()
+    return event_ids
+
+def unpublished(engine):
+    session = sessionmaker(bind=engine)()
+    try:
+        return session.query(OutboxEvent).filter(OutboxEvent.published_at.is_(None)).count()
+    finally:
+        session.close()
+
+def test_event_ids_are_uuid7_and_time_ordered():
+    first, second = new_event_id(), new_event_id()
+    assert first.version == 7
+    assert first.hex[:12] <= second.hex[:12]
+
+@requires_db
+def test_relay_publishes_pending_events_once(engine):
+    event_ids = add_events(engine, 3)
+    relay = OutboxRelay(engine, None)
+    relay.exchanges = {"payment.events": StubExchange()}
+
+    assert asyncio.run(relay.relay_batch()) == 3
+    assert asyncio.run(relay.relay_batch()) == 0
+    assert sorted(message_id for _, message_id in relay.exchanges["payment.events"].published) == sorted(event_ids)
+    assert unpublished(engine) == 0
+
+@requires_db
+def test_failed_publish_leaves_events_pending(engine):
+    add_events(engine, 2)
+    relay = OutboxRelay(engine, None)
+    relay.exchanges = {"payment.events": StubExchange(fail=True)}
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(relay.relay_batch())
+    assert unpublished(engine) == 2
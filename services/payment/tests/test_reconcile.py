@@ -0,0 +1,84 @@
+import csv
+import os
+import uuid
+from datetime import date, datetime
+import pytest
+from sqlalchemy import create_engine, text
+from app.models import Base, Payment, PaymentDailyRollup
+from app.reconcile import UNKNOWN_EVENT, aggregate, write_csv, write_rollups
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL (PostgreSQL) not set")
+
+DAY = date(2024, 6, 1)
+
+@pytest.fixture
+def engine():
+    engine = create_engine(TEST_DATABASE_URL)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        # Owned by the booking service; only the columns reconcile reads
+        conn.execute(text("DROP TABLE IF EXISTS bookings"))
+        conn.execute(text("CREATE TABLE bookings (id uuid PRIMARY KEY, event_id uuid NOT NULL, status varchar NOT NULL)"))
+    try:
+        yield engine
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text("DROP TABLE bookings"))
+        Base.metadata.drop_all(bind=engine)
+        engine.dispose()
+
+def add_payment(engine, status, booking_status=None, event_id=None, created_at=datetime(2024, 6, 1, 12)):
+    booking_id = uuid.uuid4()
+    with engine.begin() as conn:
+        if booking_status:
+            conn.execute(
+                text("INSERT INTO bookings (id, event_id, status) VALUES (:id, :event_id, :status)"),
+                {"id": booking_id, "event_id": event_id, "status": booking_status}
+            )
+        conn.execute(Payment.__table__.insert().values(
+            user_id=uuid.uuid4(), booking_id=booking_id, amount=10.0, phone_number="+10000000000",
+            status=status, created_at=created_at
+        ))
+
+def test_mismatches_are_counted_across_chunks(engine):
+    event_id = uuid.uuid4()
+    add_payment(engine, "completed", "confirmed", event_id)
+    add_payment(engine, "completed", "cancelled", event_id)
+    add_payment(engine, "pending", "pending", event_id)
+    add_payment(engine, "failed", "failed", event_id)
+    add_payment(engine, "completed")
+    # Outside the range
+    add_payment(engine, "completed", "confirmed", event_id, created_at=datetime(2024, 6, 2, 0, 0, 1))
+
+    totals = aggregate(engine, DAY, DAY, chunk_size=2)
+
+    assert set(totals) == {(event_id, DAY), (UNKNOWN_EVENT, DAY)}
+    assert totals[(event_id, DAY)] == {
+        "payments": 4, "completed": 2, "completed_amount": 20.0, "pending": 1, "failed": 1, "unconfirmed": 1, "orphaned": 0
+    }
+    assert totals[(UNKNOWN_EVENT, DAY)]["orphaned"] == 1
+
+def test_rerunning_a_range_overwrites_its_rollups(engine):
+    event_id = uuid.uuid4()
+    add_payment(engine, "completed", "confirmed", event_id)
+    write_rollups(engine, aggregate(engine, DAY, DAY))
+    add_payment(engine, "completed", "confirmed", event_id)
+    write_rollups(engine, aggregate(engine, DAY, DAY))
+
+    with engine.connect() as conn:
+        rows = conn.execute(PaymentDailyRollup.__table__.select()).all()
+    assert [(row.event_id, row.day, row.payments, row.completed) for row in rows] == [(event_id, DAY, 2, 2)]
+
+def test_csv_has_one_row_per_event_and_day(engine, tmp_path):
+    event_id = uuid.uuid4()
+    add_payment(engine, "completed", "confirmed", event_id)
+    output = tmp_path / "reconciliation.csv"
+
+    write_csv(str(output), aggregate(engine, DAY, DAY))
+
+    with open(output, newline="") as report:
+        rows = list(csv.reader(report))
+    assert rows[0] == ["day", "event_id", "payments", "completed", "completed_amount", "pending", "failed", "unconfirmed", "orphaned"]
+    assert rows[1:] == [["2024-06-01", str(event_id), "1", "1", "10.0", "0", "0", "0", "0"]]
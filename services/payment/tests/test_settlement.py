@@ -0,0 +1,177 @@
+import asyncio
+import os
+import uuid
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+from app import main
+from app.gateway import ChargeResult, COMPLETED, FAILED
+from app.main import get_payment_by_booking, get_payments_by_bookings, open_payment, recheck_pending_payments, retire_duplicate_completed_payments, settle_payment
+from app.models import Base, OutboxEvent, Payment
+from app.schemas import PaymentRequest, PaymentsByBookingsRequest
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL (PostgreSQL) not set")
+
+@pytest.fixture
+def db():
+    engine = create_engine(TEST_DATABASE_URL)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(bind=engine)
+        engine.dispose()
+
+def add_payment(db, booking_id, status="pending") -> uuid.UUID:
+    payment = Payment(user_id=uuid.uuid4(), booking_id=booking_id, amount=25.0, phone_number="+10000000000", status=status)
+    db.add(payment)
+    db.commit()
+    return payment.id
+
+def event_types(db):
+    return [event.routing_key for event in db.query(OutboxEvent).all()]
+
+def test_repeated_success_settles_once(db):
+    payment_id = add_payment(db, uuid.uuid4())
+
+    assert settle_payment(db, payment_id, True) == "completed"
+    assert settle_payment(db, payment_id, True) is None
+
+    assert db.get(Payment, payment_id).status == "completed"
+    assert event_types(db) == ["payment.completed"]
+
+def test_failure_after_success_is_ignored(db):
+    payment_id = add_payment(db, uuid.uuid4())
+
+    settle_payment(db, payment_id, True)
+    assert settle_payment(db, payment_id, False, "Card declined") is None
+    assert event_types(db) == ["payment.completed"]
+
+def test_only_one_open_payment_per_booking(db):
+    booking_id = uuid.uuid4()
+    request = PaymentRequest(booking_id=booking_id, amount=25.0, phone_number="+10000000000")
+
+    first = open_payment(db, request, uuid.uuid4())
+    # A concurrent resubmission inserts nothing, so it never reaches the gateway
+    assert first is not None
+    assert open_payment(db, request, uuid.uuid4()) is None
+
+    # Once the charge is declined the booking can be paid again
+    settle_payment(db, first, False, "Card declined")
+    assert open_payment(db, request, uuid.uuid4()) is not None
+
+def test_completed_payment_blocks_new_attempts(db):
+    booking_id = uuid.uuid4()
+    add_payment(db, booking_id, status="completed")
+    request = PaymentRequest(booking_id=booking_id, amount=25.0, phone_number="+10000000000")
+
+    assert open_payment(db, request, uuid.uuid4()) is None
+
+def test_decline_fails_an_unpaid_booking(db):
+    payment_id = add_payment(db, uuid.uuid4())
+
+    assert settle_payment(db, payment_id, False, "Card declined") == "failed"
+    event = db.query(OutboxEvent).one()
+    assert event.routing_key == "payment.failed"
+    assert event.payload["data"]["reason"] == "Card declined"
+
+class StubGateway:
+    def __init__(self, outcomes):
+        self.outcomes = outcomes
+
+    async def lookup(self, payment_id):
+        return self.outcomes.get(payment_id)
+
+def test_recheck_settles_stale_pending_payments(db, monkeypatch):
+    charged, unknown_charge, unknown = add_payment(db, uuid.uuid4()), add_payment(db, uuid.uuid4()), add_payment(db, uuid.uuid4())
+    monkeypatch.setattr(main, "gateway", StubGateway({
+        str(charged): ChargeResult(COMPLETED, "c1"),
+        str(unknown_charge): ChargeResult(FAILED, reason="Charge not received by the payment gateway")
+    }))
+
+    assert asyncio.run(recheck_pending_payments(db, older_than=-60)) == 2
+    db.expire_all()
+    assert [db.get(Payment, payment_id).status for payment_id in (charged, unknown_charge, unknown)] == ["completed", "failed", "pending"]
+
+def test_recheck_leaves_recent_payments_alone(db, monkeypatch):
+    payment_id = add_payment(db, uuid.uuid4())
+    monkeypatch.setattr(main, "gateway", StubGateway({str(payment_id): ChargeResult(COMPLETED)}))
+
+    assert asyncio.run(recheck_pending_payments(db, older_than=300)) == 0
+
+def test_payment_lookup_prefers_the_completed_attempt(db, monkeypatch):
+    booking_id, user_id = uuid.uuid4(), uuid.uuid4()
+    started = datetime.utcnow()
+    for status, age in (("failed", 3), ("completed", 2), ("failed", 1)):
+        db.add(Payment(user_id=user_id, booking_id=booking_id, amount=25.0, phone_number="+10000000000", status=status,
+                       created_at=started - timedelta(minutes=age)))
+    db.commit()
+
+    async def current_user(authorization):
+        return user_id
+
+    monkeypatch.setattr(main, "get_current_user", current_user)
+    assert asyncio.run(get_payment_by_booking(str(booking_id), "Bearer token", db))["status"] == COMPLETED
+
+    db.query(Payment).filter(Payment.status == COMPLETED).update({"status": "refunded"})
+    db.commit()
+    latest = db.query(Payment).order_by(Payment.created_at.desc()).first()
+    assert asyncio.run(get_payment_by_booking(str(booking_id), "Bearer token", db))["payment_id"] == str(latest.id)
+
+def test_duplicate_scan_only_runs_until_the_unique_indexes_exist(db, monkeypatch):
+    monkeypatch.setattr(main, "engine", db.get_bind())
+    db.execute(text("DROP INDEX uq_payments_open_booking_id"))
+    db.commit()
+    booking_id = uuid.uuid4()
+    add_payment(db, booking_id)
+    add_payment(db, booking_id)
+
+    retire_duplicate_completed_payments()
+    assert sorted(payment.status for payment in db.query(Payment).all()) == ["duplicate", "pending"]
+
+    db.commit()
+    main.ensure_indexes(Payment.__table__)
+    statements = []
+    event.listen(db.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+    retire_duplicate_completed_payments()
+    assert not any(statement.startswith("UPDATE") for statement in statements)
+
+def test_batch_lookup_returns_one_payment_per_booking_of_the_user(db, monkeypatch):
+    user_id = uuid.uuid4()
+    started = datetime.utcnow()
+    retried, declined, unpaid, someone_elses = uuid.uuid4(), uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    for booking_id, status, age, owner in (
+        (retried, "completed", 2, user_id), (retried, "failed", 1, user_id),
+        (declined, "failed", 2, user_id), (declined, "failed", 1, user_id),
+        (someone_elses, "completed", 1, uuid.uuid4())
+    ):
+        db.add(Payment(user_id=owner, booking_id=booking_id, amount=25.0, phone_number="+10000000000", status=status,
+                       created_at=started - timedelta(minutes=age)))
+    db.commit()
+    latest_decline = db.query(Payment).filter(Payment.booking_id == declined).order_by(Payment.created_at.desc()).first()
+
+    async def current_user(authorization):
+        return user_id
+
+    monkeypatch.setattr(main, "get_current_user", current_user)
+    request = PaymentsByBookingsRequest(booking_ids=[retried, declined, unpaid, someone_elses])
+    payments = asyncio.run(get_payments_by_bookings(request, "Bearer token", db))["payments"]
+
+    assert set(payments) == {str(retried), str(declined)}
+    assert payments[str(retried)]["status"] == COMPLETED
+    assert payments[str(declined)]["payment_id"] == str(latest_decline.id)
+
+def test_batch_lookup_is_bounded(db, monkeypatch):
+    async def current_user(authorization):
+        return uuid.uuid4()
+
+    monkeypatch.setattr(main, "get_current_user", current_user)
+    request = PaymentsByBookingsRequest(booking_ids=[uuid.uuid4() for _ in range(main.MAX_BATCH_BOOKINGS + 1)])
+    with pytest.raises(main.HTTPException) as error:
+        asyncio.run(get_payments_by_bookings(request, "Bearer token", db))
+    assert error.value.status_code == 400
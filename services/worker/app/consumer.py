@@ -1,40 +1,202 @@
 import asyncio
+import metrics
 import aio_pika
 import os
 import json
-from sqlalchemy import create_engine, text
+import time
+import uuid
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
 from datetime import datetime, timezone
 
 RABBITMQ_URL = os.getenv("RABBITMQ_URL")
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(DATABASE_URL)
-
-async def process_message(message: aio_pika.IncomingMessage):
-    async with message.process():
-        body = message.body.decode()
-        data = json.loads(body)
-        booking_id = data.get("booking_id")
-        user_id = data.get("user_id")
-        # simulate payment & confirmation
-        print(f"[Worker] Processing booking {booking_id} for user {user_id}")
-        # For demo: just mark booking as confirmed
-        with engine.begin() as conn:
-            conn.execute(
-                text("UPDATE bookings SET status = 'confirmed' WHERE id = :booking_id"),
-                {"booking_id": booking_id}
+# Unacked deliveries the broker may push ahead, and micro-batch limits
+PREFETCH_COUNT = int(os.getenv("WORKER_PREFETCH", "500"))
+BATCH_SIZE = int(os.getenv("WORKER_BATCH_SIZE", "200"))
+BATCH_WAIT_MS = int(os.getenv("WORKER_BATCH_WAIT_MS", "100"))
+METRICS_INTERVAL = float(os.getenv("WORKER_METRICS_INTERVAL", "15"))
+
+def async_database_url(url: str) -> str:
+    """Point a postgresql:// URL at the asyncpg driver."""
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+LEGACY_QUEUE = "booking_queue"
+SHARD_EXCHANGE = "booking.shards"
+
+def shard_queue_name(shard_index: int) -> str:
+    return f"booking_queue.shard.{shard_index}"
+
+engine = create_async_engine(async_database_url(DATABASE_URL), pool_size=5, pool_pre_ping=True)
+
+async def confirm_bookings(booking_ids):
+    """Confirm a batch of bookings with one set-based UPDATE."""
+    async with engine.begin() as conn:
+        result = await conn.execute(
+            text("UPDATE bookings SET status = 'confirmed' WHERE id = ANY(CAST(:booking_ids AS uuid[]))"),
+            {"booking_ids": booking_ids}
+        )
+        return result.rowcount
+
+async def collect_batch(buffer: asyncio.Queue):
+    """Wait for one message, then gather more until the batch is full or old enough."""
+    loop = asyncio.get_running_loop()
+    batch = [await buffer.get()]
+    deadline = loop.time() + BATCH_WAIT_MS / 1000
+    while len(batch) < BATCH_SIZE:
+        timeout = deadline - loop.time()
+        if timeout <= 0:
+            break
+        try:
+            batch.append(await asyncio.wait_for(buffer.get(), timeout))
+        except asyncio.TimeoutError:
+            break
+    return batch
+
+async def process_batch(queue_name: str, batch):
+    """Confirm every booking of a batch and settle all deliveries with one ack."""
+    started = time.perf_counter()
+    booking_ids = []
+    for message in batch:
+        try:
+            data = json.loads(message.body.decode())
+            booking_ids.append(uuid.UUID(str(data.get("booking_id"))))
+        except (ValueError, TypeError) as e:
+            print(f"[Worker] Skipping malformed message: {e}")
+
+    # Deliveries arrive in tag order, so the last one covers the whole batch
+    last_message = batch[-1]
+    try:
+        confirmed = await confirm_bookings(booking_ids) if booking_ids else 0
+    except Exception as e:
+        print(f"[Worker] Failed to confirm batch of {len(batch)}: {e}")
+        await asyncio.sleep(1)
+        await last_message.nack(multiple=True, requeue=True)
+        metrics.observe_batch(queue_name, batch, "requeued", started)
+        return
+
+    await last_message.ack(multiple=True)
+    metrics.observe_batch(queue_name, batch, "confirmed", started)
+    print(f"[Worker] Confirmed {confirmed} bookings from {len(batch)} messages at {datetime.now(timezone.utc).isoformat()}")
+
+async def run_batches(queue_name: str, buffer: asyncio.Queue):
+    while True:
+        batch = await collect_batch(buffer)
+        try:
+            await process_batch(queue_name, batch)
+        except Exception as e:
+            # Unsettled deliveries are redelivered when the channel recovers
+            print(f"[Worker] Failed to settle batch: {e}")
+
+async def sample_rates():
+    while True:
+        await asyncio.sleep(METRICS_INTERVAL)
+        metrics.rates.sample()
+
+async def declare_shard_queue(channel, shard_index: int):
+    """Declare one shard queue and bind it to the consistent-hash exchange."""
+    exchange = await channel.declare_exchange(
+        SHARD_EXCHANGE,
+        aio_pika.ExchangeType.X_CONSISTENT_HASH,
+        durable=True
+    )
+    queue = await channel.declare_queue(shard_queue_name(shard_index), durable=True)
+    # The binding key is the shard's weight on the hash ring
+    await queue.bind(exchange, routing_key="1")
+    return queue
+
+async def find_retired_shard_queues(connection, shard_count: int):
+    """Names of the shard queues left over from a larger WORKER_SHARDS.
+    
+    Shards are numbered from 0, so probing stops at the first missing queue.
+    """
+    names = []
+    shard_index = shard_count
+    while True:
+        # A failed passive declare closes the channel, so each probe gets its own
+        channel = await connection.channel()
+        try:
+            await channel.declare_queue(shard_queue_name(shard_index), passive=True)
+        except aio_pika.exceptions.ChannelNotFoundEntity:
+            return names
+        finally:
+            if not channel.is_closed:
+                await channel.close()
+        names.append(shard_queue_name(shard_index))
+        shard_index += 1
+
+async def retire_shard_queue(connection, queue_name: str) -> int:
+    """Unbind a leftover shard queue, hash its messages onto the current shards and delete it.
+    
+    Returns the number of messages moved. Messages no shard is bound for yet
+    go to the legacy queue, which shard 0 drains.
+    """
+    channel = await connection.channel(on_return_raises=True)
+    async with channel:
+        exchange = await channel.declare_exchange(
+            SHARD_EXCHANGE,
+            aio_pika.ExchangeType.X_CONSISTENT_HASH,
+            durable=True
+        )
+        await channel.declare_queue(LEGACY_QUEUE, durable=True)
+        queue = await channel.declare_queue(queue_name, passive=True)
+        # Stop the queue filling up before draining it
+        await queue.unbind(exchange, routing_key="1")
+        
+        moved = 0
+        while True:
+            message = await queue.get(fail=False)
+            if message is None:
+                break
+            republished = aio_pika.Message(
+                body=message.body,
+                headers=message.headers,
+                content_type=message.content_type,
+                delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                # Returns are matched to their publish by message_id
+                message_id=message.message_id or str(uuid.uuid4())
             )
-        # Simulate sending notification (print)
-        print(f"[Worker] Booking {booking_id} confirmed and notification sent at {datetime.now(timezone.utc).isoformat()}")
+            try:
+                await exchange.publish(republished, routing_key=message.routing_key, mandatory=True)
+            except aio_pika.exceptions.PublishError:
+                await channel.default_exchange.publish(republished, routing_key=LEGACY_QUEUE, mandatory=True)
+            await message.ack()
+            moved += 1
+        
+        # Refuses while a consumer (an old replica) is still attached, so nothing in flight is lost
+        await queue.delete(if_unused=True, if_empty=True)
+    return moved
 
-async def main():
+async def open_channel(connection):
+    channel = await connection.channel()
+    # Prefetch must exceed the batch size or batches never fill up
+    await channel.set_qos(prefetch_count=max(PREFETCH_COUNT, BATCH_SIZE))
+    return channel
+
+async def main(shard_index: int = None):
     connection = await aio_pika.connect_robust(RABBITMQ_URL)
     async with connection:
-        channel = await connection.channel()
-        queue = await channel.declare_queue("booking_queue", durable=True)
-        await queue.consume(process_message, no_ack=False)
-        print("[Worker] Awaiting messages...")
-        await asyncio.Future()  # run forever
+        queues = []
+        if shard_index is None or shard_index == 0:
+            # Unsharded mode, and shard 0 drains messages published before sharding
+            queues.append(await (await open_channel(connection)).declare_queue(LEGACY_QUEUE, durable=True))
+        if shard_index is not None:
+            queues.append(await declare_shard_queue(await open_channel(connection), shard_index))
+
+        batchers = []
+        for queue in queues:
+            # Each queue has its own channel, so a multiple-ack only covers its own deliveries
+            buffer: asyncio.Queue = asyncio.Queue()
+            batchers.append(asyncio.create_task(run_batches(queue.name, buffer)))
+            await queue.consume(buffer.put, no_ack=False)
+
+        batchers.append(asyncio.create_task(sample_rates()))
+        print(f"[Worker] Awaiting messages on {[queue.name for queue in queues]} (prefetch={PREFETCH_COUNT}, batch={BATCH_SIZE}, wait={BATCH_WAIT_MS}ms)...")
+        await asyncio.gather(*batchers)  # run forever
 
 if __name__ == "__main__":
     asyncio.run(main())
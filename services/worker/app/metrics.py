@@ -0,0 +1,91 @@
+"""Prometheus metrics shared by the supervisor and its child processes.
+
+Children write to PROMETHEUS_MULTIPROC_DIR and the supervisor serves the
+merged view, so this module must be imported before prometheus_client is
+imported anywhere else.
+"""
+import os
+import shutil
+import tempfile
+import time
+
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "worker-metrics"))
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, multiprocess, start_http_server
+
+METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9000"))
+
+QUEUE_DEPTH = Gauge(
+    "worker_queue_depth",
+    "Messages ready on the broker, from passive queue declares",
+    ["queue"],
+    multiprocess_mode="max"
+)
+MESSAGES = Counter(
+    "worker_messages_total",
+    "Messages settled by the worker",
+    ["queue", "outcome"]
+)
+MESSAGE_RATE = Gauge(
+    "worker_messages_per_second",
+    "Messages settled per second over the last sampling interval",
+    ["queue"],
+    multiprocess_mode="livesum"
+)
+BATCH_LATENCY = Histogram(
+    "worker_batch_seconds",
+    "Time to process and settle one batch",
+    ["queue"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+REDELIVERIES = Counter(
+    "worker_redeliveries_total",
+    "Messages received again after a broker redelivery",
+    ["queue"]
+)
+
+class RateTracker:
+    """Turns settled-message counts into the messages-per-second gauge."""
+
+    def __init__(self):
+        self.settled = {}
+        self.last_settled = {}
+        self.last_sample = time.monotonic()
+
+    def record(self, queue_name: str, outcome: str, count: int):
+        MESSAGES.labels(queue_name, outcome).inc(count)
+        self.settled[queue_name] = self.settled.get(queue_name, 0) + count
+
+    def sample(self):
+        now = time.monotonic()
+        for queue_name, settled in self.settled.items():
+            rate = (settled - self.last_settled.get(queue_name, 0)) / (now - self.last_sample)
+            MESSAGE_RATE.labels(queue_name).set(rate)
+        self.last_settled = dict(self.settled)
+        self.last_sample = now
+
+rates = RateTracker()
+
+def observe_batch(queue_name: str, batch, outcome: str, started: float):
+    """Record latency, outcome and redeliveries for one settled batch."""
+    BATCH_LATENCY.labels(queue_name).observe(time.perf_counter() - started)
+    redelivered = sum(1 for message in batch if message.redelivered)
+    if redelivered:
+        REDELIVERIES.labels(queue_name).inc(redelivered)
+    rates.record(queue_name, outcome, len(batch))
+
+def reset_multiprocess_dir():
+    """Clear values left over from a previous supervisor run."""
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+def serve():
+    """Expose the merged metrics of all worker processes on METRICS_PORT."""
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    start_http_server(METRICS_PORT, registry=registry)
+
+def mark_process_dead(pid: int):
+    multiprocess.mark_process_dead(pid)
@@ -0,0 +1,243 @@
+"""Notification dispatch stage.
+
+Consumes notification.send events, groups a batch by channel and recipient
+domain, renders each template once per batch and delivers email over a pool
+of persistent SMTP connections. Point SMTP_HOST/SMTP_PORT at a debugging
+server (python -m aiosmtpd -n -l 0.0.0.0:1025) to run it locally.
+"""
+import asyncio
+import metrics
+import os
+import time
+import uuid
+from collections import defaultdict
+from email.message import EmailMessage
+from string import Template
+import aio_pika
+import aiosmtplib
+from sqlalchemy import text
+from consumer import engine, collect_batch, sample_rates
+from serialization import decode_event
+
+RABBITMQ_URL = os.getenv("RABBITMQ_URL")
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "1025"))
+SMTP_FROM = os.getenv("SMTP_FROM", "no-reply@event-booking.local")
+# Persistent connections, i.e. concurrent SMTP transactions
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "4"))
+# Most MTAs cap recipients per transaction
+SMTP_MAX_RECIPIENTS = int(os.getenv("SMTP_MAX_RECIPIENTS", "50"))
+NOTIFICATION_PREFETCH = int(os.getenv("NOTIFICATION_PREFETCH", "200"))
+NOTIFICATION_QUEUE = "worker.notification.send"
+# Messages that cannot be decoded wait here for inspection instead of being dropped
+NOTIFICATION_PARKING_QUEUE = "worker.notification.send.parking"
+
+TEMPLATES = {
+    "event_cancelled": (
+        Template("Your event has been cancelled"),
+        Template("The event $event_id you booked has been cancelled. Your payment will be refunded.")
+    ),
+    "event_cancelled_unpaid": (
+        Template("Your event has been cancelled"),
+        Template("The event $event_id you booked has been cancelled and your booking has been released.")
+    ),
+    "booking_confirmed": (
+        Template("Your booking is confirmed"),
+        Template("Your booking $booking_id for event $event_id is confirmed.")
+    ),
+}
+DEFAULT_TEMPLATE = (Template("Notification from Event Booking"), Template("$message"))
+
+async def park(channel, message: aio_pika.IncomingMessage, error: Exception):
+    """Copy an undecodable message to the parking queue; the batch ack then settles it."""
+    headers = dict(message.headers or {})
+    headers["x-original-queue"] = NOTIFICATION_QUEUE
+    headers["x-last-error"] = str(error)[:500]
+    await channel.default_exchange.publish(
+        aio_pika.Message(
+            message.body,
+            headers=headers,
+            content_type=message.content_type,
+            content_encoding=message.content_encoding,
+            message_id=message.message_id,
+            delivery_mode=aio_pika.DeliveryMode.PERSISTENT
+        ),
+        routing_key=NOTIFICATION_PARKING_QUEUE
+    )
+
+class SMTPPool:
+    """A fixed set of persistent SMTP connections handed out one at a time.
+
+    Waiting for a free connection is the backpressure: the stage cannot
+    have more transactions in flight than the pool has connections.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._idle: asyncio.Queue = asyncio.Queue()
+        for _ in range(size):
+            self._idle.put_nowait(None)
+
+    async def send(self, message: EmailMessage, recipients):
+        client = await self._idle.get()
+        try:
+            if client is None or not client.is_connected:
+                client = aiosmtplib.SMTP(hostname=SMTP_HOST, port=SMTP_PORT, timeout=10)
+                await client.connect()
+            await client.send_message(message, sender=SMTP_FROM, recipients=recipients)
+        except Exception:
+            # Drop the broken connection; the next sender reconnects
+            if client is not None:
+                client.close()
+            client = None
+            raise
+        finally:
+            self._idle.put_nowait(client)
+
+class Stats:
+    """Throughput counters printed every interval."""
+
+    def __init__(self):
+        self.messages = 0
+        self.recipients = 0
+        self.transactions = 0
+        self.failures = 0
+        self.since = time.monotonic()
+
+    def report(self):
+        elapsed = time.monotonic() - self.since
+        if elapsed < 10:
+            return
+        print(
+            f"[Notifications] {self.messages / elapsed:.1f} msg/s, {self.recipients / elapsed:.1f} recipients/s, "
+            f"{self.transactions} SMTP transactions, {self.failures} failures in {elapsed:.0f}s"
+        )
+        self.__init__()
+
+async def lookup_emails(user_ids):
+    """Resolve user IDs to email addresses with one query."""
+    valid_ids = []
+    for user_id in user_ids:
+        try:
+            valid_ids.append(uuid.UUID(str(user_id)))
+        except ValueError:
+            print(f"[Notifications] Skipping invalid user id {user_id}")
+    if not valid_ids:
+        return {}
+    async with engine.connect() as conn:
+        rows = await conn.execute(
+            text("SELECT id, email FROM users WHERE id = ANY(CAST(:user_ids AS uuid[]))"),
+            {"user_ids": valid_ids}
+        )
+        return {str(row.id): row.email for row in rows}
+
+def render(notification_type: str, data: dict):
+    subject, body = TEMPLATES.get(notification_type, DEFAULT_TEMPLATE)
+    return subject.safe_substitute(data), body.safe_substitute(data)
+
+async def dispatch_batch(events, pool: SMTPPool, stats: Stats):
+    """Group a batch of notifications, render once per group and send it."""
+    user_ids = {user_id for event in events for user_id in (event.get("data") or {}).get("user_ids") or []}
+    emails = await lookup_emails(user_ids)
+
+    # (channel, rendered content, recipient domain) -> recipients
+    groups = defaultdict(set)
+    rendered = {}
+    for event in events:
+        data = event.get("data") or {}
+        channel = data.get("channel", "email")
+        notification_type = data.get("type", "generic")
+        render_key = (notification_type, data.get("event_id"), data.get("booking_id"), data.get("message"))
+        if render_key not in rendered:
+            rendered[render_key] = render(notification_type, data)
+
+        recipients = list(data.get("recipients") or [])
+        recipients += [emails[str(user_id)] for user_id in data.get("user_ids") or [] if str(user_id) in emails]
+        for recipient in recipients:
+            domain = recipient.rsplit("@", 1)[-1].lower()
+            groups[(channel, render_key, domain)].add(recipient)
+
+    sends = []
+    for (channel, render_key, domain), recipients in groups.items():
+        if channel != "email":
+            print(f"[Notifications] Channel {channel} is not supported, skipping {len(recipients)} recipients")
+            continue
+        subject, body = rendered[render_key]
+        recipients = sorted(recipients)
+        for start in range(0, len(recipients), SMTP_MAX_RECIPIENTS):
+            chunk = recipients[start:start + SMTP_MAX_RECIPIENTS]
+            message = EmailMessage()
+            message["From"] = SMTP_FROM
+            message["To"] = "undisclosed-recipients:;"
+            message["Subject"] = subject
+            message.set_content(body)
+            sends.append(send_chunk(pool, message, chunk, stats))
+
+    failures = [result for result in await asyncio.gather(*sends, return_exceptions=True) if result is not None]
+    if failures:
+        # The batch is requeued, so chunks that did go out may be sent again
+        raise failures[0]
+    stats.messages += len(events)
+
+def is_permanent(error: Exception) -> bool:
+    """A 5xx rejection will fail the same way on every retry."""
+    if isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        return True
+    return isinstance(error, aiosmtplib.SMTPResponseException) and 500 <= error.code < 600
+
+async def send_chunk(pool: SMTPPool, message: EmailMessage, recipients, stats: Stats):
+    """Send one chunk; transient failures are raised so the batch is retried."""
+    try:
+        await pool.send(message, recipients)
+        stats.transactions += 1
+        stats.recipients += len(recipients)
+    except Exception as e:
+        stats.failures += 1
+        if is_permanent(e):
+            print(f"[Notifications] Mail server rejected {len(recipients)} recipients, dropping: {e}")
+            return
+        print(f"[Notifications] Failed to send to {len(recipients)} recipients: {e}")
+        raise
+
+async def run_notifications(channel, buffer: asyncio.Queue, pool: SMTPPool, stats: Stats):
+    while True:
+        batch = await collect_batch(buffer)
+        started = time.perf_counter()
+        try:
+            events = []
+            for message in batch:
+                try:
+                    events.append(decode_event(message.body, message.content_type, message.content_encoding))
+                except Exception as e:
+                    print(f"[Notifications] Parking undecodable message: {e}")
+                    await park(channel, message, e)
+            await dispatch_batch(events, pool, stats)
+            await batch[-1].ack(multiple=True)
+            metrics.observe_batch(NOTIFICATION_QUEUE, batch, "sent", started)
+        except Exception as e:
+            print(f"[Notifications] Failed to dispatch batch of {len(batch)}: {e}")
+            await asyncio.sleep(1)
+            await batch[-1].nack(multiple=True, requeue=True)
+            metrics.observe_batch(NOTIFICATION_QUEUE, batch, "requeued", started)
+        stats.report()
+
+async def main():
+    connection = await aio_pika.connect_robust(RABBITMQ_URL)
+    async with connection:
+        channel = await connection.channel()
+        # Bounded prefetch plus the SMTP pool keep a slow mail server from flooding memory
+        await channel.set_qos(prefetch_count=NOTIFICATION_PREFETCH)
+        exchange = await channel.declare_exchange("notification.events", aio_pika.ExchangeType.TOPIC, durable=True)
+        queue = await channel.declare_queue(NOTIFICATION_QUEUE, durable=True)
+        await queue.bind(exchange, "notification.send")
+        await channel.declare_queue(NOTIFICATION_PARKING_QUEUE, durable=True)
+
+        buffer: asyncio.Queue = asyncio.Queue()
+        dispatcher = asyncio.create_task(run_notifications(channel, buffer, SMTPPool(SMTP_POOL_SIZE), Stats()))
+        sampler = asyncio.create_task(sample_rates())
+        await queue.consume(buffer.put, no_ack=False)
+        print(f"[Notifications] Awaiting messages (smtp={SMTP_HOST}:{SMTP_PORT}, pool={SMTP_POOL_SIZE})...")
+        await asyncio.gather(dispatcher, sampler)  # run forever
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,67 @@
+"""Decoding of events published through booking's EventSerializer.
+
+A decode-only port of booking's app/serialization.py: every content type
+booking can publish with (EVENT_CONTENT_TYPE) must be readable here, so the
+two are kept in step. event_schemas.proto is a copy of booking's schema and
+is compiled into event_schemas_pb2 at image build time.
+"""
+import json
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+PROTOBUF = "application/x-protobuf"
+DEFLATE = "deflate"
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+try:
+    from google.protobuf import json_format
+    import event_schemas_pb2
+except ImportError:  # pragma: no cover - generated at image build time
+    json_format = None
+    event_schemas_pb2 = None
+
+def decode_event(body: bytes, content_type: Optional[str] = None, content_encoding: Optional[str] = None) -> Dict[str, Any]:
+    """Decode a JSON, msgpack or protobuf body, deflated or not."""
+    if content_encoding == DEFLATE:
+        body = zlib.decompress(body)
+    elif content_encoding:
+        raise ValueError(f"Unsupported content encoding: {content_encoding}")
+
+    if content_type == MSGPACK:
+        if msgpack is None:
+            raise ValueError("msgpack is not installed")
+        return msgpack.unpackb(body, raw=False)
+    if content_type == PROTOBUF:
+        if event_schemas_pb2 is None:
+            raise ValueError("event_schemas_pb2 is not generated")
+        envelope = event_schemas_pb2.EventEnvelope()
+        envelope.ParseFromString(body)
+        return _from_protobuf(envelope)
+    # Messages without a content type are JSON
+    return json.loads(body.decode())
+
+def _from_protobuf(envelope) -> Dict[str, Any]:
+    event = {
+        "event_type": envelope.event_type,
+        "event_id": envelope.event_id,
+        "timestamp": datetime.fromtimestamp(envelope.timestamp_ms / 1000).isoformat() if envelope.timestamp_ms else None,
+        "version": envelope.version
+    }
+    field = envelope.WhichOneof("payload")
+    if field is None:
+        event["data"] = {}
+    elif field == "data":
+        event["data"] = json_format.MessageToDict(envelope.data)
+    else:
+        payload = getattr(envelope, field)
+        data = json_format.MessageToDict(payload, preserving_proto_field_name=True)
+        data.update(data.pop("extra", {}))
+        event["data"] = data
+    return event
@@ -0,0 +1,137 @@
+"""Run one booking consumer process per shard, plus the notification stage,
+and keep them alive.
+
+Bookings are routed to shard queues by a consistent hash of event_id, so a
+hot event only loads the process that owns its shard. WORKER_SHARDS must be
+the same on every replica because it defines the queue topology. When it is
+lowered, the supervisor unbinds the shard queues above it and moves their
+messages onto the remaining shards.
+"""
+# Must come first: configures multiprocess metrics before prometheus_client loads
+import metrics
+import asyncio
+import multiprocessing
+import os
+import time
+import aio_pika
+import consumer
+import notifications
+
+# A fixed default, not the CPU count: replicas on different hosts must agree on it
+SHARD_COUNT = int(os.getenv("WORKER_SHARDS", "4"))
+REPORT_INTERVAL = float(os.getenv("WORKER_REPORT_INTERVAL", "15"))
+# Restart backoff for children that keep crashing
+MAX_RESTART_DELAY = 60.0
+
+RUN_NOTIFICATIONS = os.getenv("WORKER_NOTIFICATIONS", "true").lower() == "true"
+
+def run_shard(shard_index: int):
+    asyncio.run(consumer.main(shard_index))
+
+def run_notifications():
+    asyncio.run(notifications.main())
+
+class ChildProcess:
+    def __init__(self, context, name: str, target, args=()):
+        self.context = context
+        self.name = name
+        self.target = target
+        self.args = args
+        self.process = None
+        self.restarts = 0
+        self.next_start = 0.0
+        self.started_at = 0.0
+
+    def start(self):
+        self.process = self.context.Process(target=self.target, args=self.args, name=self.name, daemon=True)
+        self.process.start()
+        self.started_at = time.monotonic()
+        print(f"[Supervisor] Started {self.name} (pid {self.process.pid})")
+
+    def check(self):
+        """Restart the child if it died, backing off when it crashes repeatedly."""
+        if self.process.is_alive():
+            return
+        now = time.monotonic()
+        if self.next_start == 0.0:
+            metrics.mark_process_dead(self.process.pid)
+            # Reset the backoff once a child has stayed up for a while
+            if now - self.started_at > MAX_RESTART_DELAY:
+                self.restarts = 0
+            delay = min(MAX_RESTART_DELAY, 2 ** self.restarts)
+            self.next_start = now + delay
+            print(f"[Supervisor] {self.name} exited with code {self.process.exitcode}, restarting in {delay:.0f}s")
+        if now >= self.next_start:
+            self.restarts += 1
+            self.next_start = 0.0
+            self.start()
+
+async def report_lag(channel, retiring=()):
+    """Print the backlog of every shard queue and export it as queue depth."""
+    queue_names = [consumer.shard_queue_name(shard_index) for shard_index in range(SHARD_COUNT)]
+    # Leftover shard queues still being drained
+    queue_names.extend(retiring)
+    queue_names.append(consumer.LEGACY_QUEUE)
+    if RUN_NOTIFICATIONS:
+        queue_names.append(notifications.NOTIFICATION_QUEUE)
+
+    lag = {}
+    for queue_name in queue_names:
+        queue = await channel.declare_queue(queue_name, passive=True)
+        lag[queue_name] = queue.declaration_result.message_count
+        metrics.QUEUE_DEPTH.labels(queue_name).set(lag[queue_name])
+    print(f"[Supervisor] Queue lag: {lag}")
+    return lag
+
+async def retire_shards(connection, retiring: list):
+    """Drain and delete the leftover shard queues, retrying the ones that fail."""
+    while retiring:
+        for queue_name in list(retiring):
+            try:
+                moved = await consumer.retire_shard_queue(connection, queue_name)
+            except Exception as e:
+                print(f"[Supervisor] Failed to retire {queue_name}: {e}")
+                continue
+            retiring.remove(queue_name)
+            print(f"[Supervisor] Retired {queue_name}, moved {moved} messages")
+        if retiring:
+            await asyncio.sleep(REPORT_INTERVAL)
+
+async def supervise():
+    # spawn gives every child its own event loop, engine and connections
+    context = multiprocessing.get_context("spawn")
+    children = [
+        ChildProcess(context, f"worker-shard-{shard_index}", run_shard, (shard_index,))
+        for shard_index in range(SHARD_COUNT)
+    ]
+    if RUN_NOTIFICATIONS:
+        children.append(ChildProcess(context, "worker-notifications", run_notifications))
+    for child in children:
+        child.start()
+
+    connection = await aio_pika.connect_robust(consumer.RABBITMQ_URL)
+    async with connection:
+        retiring = await consumer.find_retired_shard_queues(connection, SHARD_COUNT)
+        if retiring:
+            print(f"[Supervisor] Retiring shard queues above WORKER_SHARDS={SHARD_COUNT}: {retiring}")
+            # Held so the task is not garbage collected while it runs
+            retirement = asyncio.create_task(retire_shards(connection, retiring))
+        channel = await connection.channel()
+        last_report = 0.0
+        while True:
+            for child in children:
+                child.check()
+            if time.monotonic() - last_report >= REPORT_INTERVAL:
+                last_report = time.monotonic()
+                try:
+                    await report_lag(channel, list(retiring))
+                except Exception as e:
+                    print(f"[Supervisor] Failed to read queue lag: {e}")
+                    channel = await connection.channel()
+            await asyncio.sleep(1)
+
+if __name__ == "__main__":
+    print(f"[Supervisor] Starting {SHARD_COUNT} worker shards")
+    metrics.reset_multiprocess_dir()
+    metrics.serve()
+    asyncio.run(supervise())
@@ -0,0 +1,73 @@
+import asyncio
+import json
+import uuid
+import consumer
+import metrics
+
+class StubMessage:
+    def __init__(self, body: bytes):
+        self.body = body
+        self.redelivered = False
+        self.settled = []
+
+    async def ack(self, multiple: bool = False):
+        self.settled.append(("ack", multiple))
+
+    async def nack(self, multiple: bool = False, requeue: bool = True):
+        self.settled.append(("nack", multiple))
+
+def booking_message(booking_id) -> StubMessage:
+    return StubMessage(json.dumps({"booking_id": str(booking_id)}).encode())
+
+def test_batch_is_confirmed_with_one_update_and_one_ack(monkeypatch):
+    confirmed = []
+
+    async def confirm_bookings(booking_ids):
+        confirmed.append(booking_ids)
+        return len(booking_ids)
+
+    monkeypatch.setattr(consumer, "confirm_bookings", confirm_bookings)
+    booking_ids = [uuid.uuid4(), uuid.uuid4()]
+    batch = [booking_message(booking_ids[0]), StubMessage(b"not json"), booking_message(booking_ids[1])]
+
+    asyncio.run(consumer.process_batch("booking_queue", batch))
+
+    assert confirmed == [booking_ids]
+    assert [message.settled for message in batch] == [[], [], [("ack", True)]]
+
+def test_failed_batch_is_requeued(monkeypatch):
+    async def confirm_bookings(booking_ids):
+        raise ConnectionError("database down")
+
+    async def no_wait(seconds):
+        pass
+
+    monkeypatch.setattr(consumer, "confirm_bookings", confirm_bookings)
+    monkeypatch.setattr(consumer.asyncio, "sleep", no_wait)
+    batch = [booking_message(uuid.uuid4()), booking_message(uuid.uuid4())]
+
+    asyncio.run(consumer.process_batch("booking_queue", batch))
+
+    assert [message.settled for message in batch] == [[], [("nack", True)]]
+
+def test_batches_are_cut_by_size(monkeypatch):
+    monkeypatch.setattr(consumer, "BATCH_SIZE", 2)
+
+    async def scenario():
+        buffer = asyncio.Queue()
+        for index in range(3):
+            buffer.put_nowait(index)
+        return await consumer.collect_batch(buffer), await consumer.collect_batch(buffer)
+
+    assert asyncio.run(scenario()) == ([0, 1], [2])
+
+def test_message_rate_is_sampled_per_queue():
+    tracker = metrics.RateTracker()
+    tracker.record("booking_queue.shard.7", "confirmed", 30)
+    tracker.last_sample -= 10
+
+    tracker.sample()
+
+    rate = metrics.MESSAGE_RATE.labels("booking_queue.shard.7")._value.get()
+    assert 2.9 < rate <= 3.0
+    assert tracker.last_settled == {"booking_queue.shard.7": 30}
@@ -0,0 +1,125 @@
+import asyncio
+import json
+import aiosmtplib
+import zlib
+import msgpack
+import pytest
+import notifications
+import serialization
+from serialization import decode_event
+
+EVENT = {
+    "event_type": "notification.send",
+    "event_id": "0190a0b0-0000-7000-8000-000000000001",
+    "timestamp": "2024-06-01T12:00:00",
+    "version": "1.0",
+    "data": {"type": "event_cancelled", "event_id": "e-1", "recipients": ["a@example.com", "b@example.org"]}
+}
+
+def protobuf_body(event) -> bytes:
+    envelope = serialization.event_schemas_pb2.EventEnvelope(
+        event_type=event["event_type"], event_id=event["event_id"], version=event["version"]
+    )
+    envelope.data.update(event["data"])
+    return envelope.SerializeToString()
+
+def test_decodes_json_and_deflated_msgpack():
+    assert decode_event(json.dumps(EVENT).encode()) == EVENT
+    assert decode_event(zlib.compress(msgpack.packb(EVENT)), "application/msgpack", "deflate") == EVENT
+
+@pytest.mark.skipif(serialization.event_schemas_pb2 is None, reason="grpcio-tools not installed")
+def test_decodes_protobuf_notifications():
+    event = decode_event(zlib.compress(protobuf_body(EVENT)), "application/x-protobuf", "deflate")
+    assert event["event_type"] == "notification.send"
+    assert event["data"] == EVENT["data"]
+
+def test_unknown_encoding_is_an_error():
+    with pytest.raises(ValueError):
+        decode_event(b"{}", "application/json", "br")
+
+class StubMessage:
+    def __init__(self, body: bytes, content_type: str = "application/json"):
+        self.body = body
+        self.content_type = content_type
+        self.content_encoding = None
+        self.headers = {}
+        self.message_id = None
+        self.redelivered = False
+        self.settled = []
+
+    async def ack(self, multiple: bool = False):
+        self.settled.append(("ack", multiple))
+
+    async def nack(self, multiple: bool = False, requeue: bool = True):
+        self.settled.append(("nack", multiple))
+
+class StubExchange:
+    def __init__(self):
+        self.published = []
+
+    async def publish(self, message, routing_key: str):
+        self.published.append(routing_key)
+
+class StubChannel:
+    def __init__(self):
+        self.default_exchange = StubExchange()
+
+class StubPool:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, message, recipients):
+        self.sent.append(sorted(recipients))
+
+def test_undecodable_messages_are_parked_not_dropped():
+    channel, pool = StubChannel(), StubPool()
+    batch = [StubMessage(b"\xff not an event"), StubMessage(json.dumps(EVENT).encode())]
+
+    async def scenario():
+        buffer = asyncio.Queue()
+        for message in batch:
+            buffer.put_nowait(message)
+        task = asyncio.create_task(notifications.run_notifications(channel, buffer, pool, notifications.Stats()))
+        await asyncio.sleep(0.3)
+        task.cancel()
+
+    asyncio.run(scenario())
+    assert channel.default_exchange.published == [notifications.NOTIFICATION_PARKING_QUEUE]
+    assert pool.sent == [["a@example.com"], ["b@example.org"]]
+    assert batch[-1].settled == [("ack", True)]
+
+class DownPool:
+    async def send(self, message, recipients):
+        raise ConnectionRefusedError("smtp down")
+
+class RejectingPool:
+    async def send(self, message, recipients):
+        raise aiosmtplib.SMTPResponseException(550, "No such user")
+
+def run_batch(batch, pool, wait: float = 0.3):
+    async def scenario():
+        buffer = asyncio.Queue()
+        for message in batch:
+            buffer.put_nowait(message)
+        task = asyncio.create_task(notifications.run_notifications(StubChannel(), buffer, pool, notifications.Stats()))
+        await asyncio.sleep(wait)
+        task.cancel()
+
+    asyncio.run(scenario())
+
+def test_batch_is_requeued_while_smtp_is_down():
+    batch = [StubMessage(json.dumps(EVENT).encode())]
+    run_batch(batch, DownPool(), wait=1.3)
+    assert batch[-1].settled == [("nack", True)]
+
+def test_permanent_rejections_are_not_retried():
+    batch = [StubMessage(json.dumps(EVENT).encode())]
+    run_batch(batch, RejectingPool())
+    assert batch[-1].settled == [("ack", True)]
+
+def test_null_data_is_tolerated():
+    pool = StubPool()
+    batch = [StubMessage(json.dumps({**EVENT, "data": None}).encode())]
+    run_batch(batch, pool)
+    assert pool.sent == []
+    assert batch[-1].settled == [("ack", True)]
@@ -0,0 +1,112 @@
+import asyncio
+import aio_pika
+import consumer
+
+class StubMessage:
+    def __init__(self, event_id: str):
+        self.body = b"{}"
+        self.headers = {}
+        self.content_type = "application/json"
+        self.message_id = None
+        self.routing_key = event_id
+        self.acked = False
+
+    async def ack(self):
+        self.acked = True
+
+class StubExchange:
+    def __init__(self, bound: bool = True):
+        self.bound = bound
+        self.published = []
+
+    async def publish(self, message, routing_key: str, mandatory: bool = False):
+        if not self.bound:
+            # The broker returned it; the real exception wraps the Basic.Return frame
+            raise aio_pika.exceptions.PublishError.__new__(aio_pika.exceptions.PublishError)
+        self.published.append(routing_key)
+
+class StubQueue:
+    def __init__(self, name: str, messages=()):
+        self.name = name
+        self.messages = list(messages)
+        self.unbound = False
+        self.deleted = False
+
+    async def unbind(self, exchange, routing_key: str):
+        self.unbound = True
+
+    async def get(self, fail: bool = True):
+        assert self.unbound, "drained before it stopped filling"
+        return self.messages.pop(0) if self.messages else None
+
+    async def delete(self, if_unused: bool = True, if_empty: bool = True):
+        self.deleted = True
+
+class StubChannel:
+    def __init__(self, queues, exchange):
+        self.queues = queues
+        self.exchange = exchange
+        self.default_exchange = StubExchange()
+        self.is_closed = False
+
+    async def declare_exchange(self, name, kind, durable: bool = False):
+        return self.exchange
+
+    async def declare_queue(self, name: str, durable: bool = False, passive: bool = False):
+        if name not in self.queues:
+            if passive:
+                self.is_closed = True
+                raise aio_pika.exceptions.ChannelNotFoundEntity(name)
+            self.queues[name] = StubQueue(name)
+        return self.queues[name]
+
+    async def close(self):
+        self.is_closed = True
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+class StubConnection:
+    def __init__(self, queues, exchange=None):
+        self.queues = queues
+        self.exchange = exchange or StubExchange()
+        self.channels = []
+
+    async def channel(self, **kwargs):
+        self.channels.append(StubChannel(self.queues, self.exchange))
+        return self.channels[-1]
+
+def shard_queues(*shard_indexes):
+    return {consumer.shard_queue_name(index): StubQueue(consumer.shard_queue_name(index)) for index in shard_indexes}
+
+def test_finds_shard_queues_above_the_shard_count():
+    connection = StubConnection(shard_queues(0, 1, 2, 3))
+    assert asyncio.run(consumer.find_retired_shard_queues(connection, 2)) == [
+        consumer.shard_queue_name(2), consumer.shard_queue_name(3)
+    ]
+    assert asyncio.run(consumer.find_retired_shard_queues(connection, 4)) == []
+
+def test_retired_queue_is_unbound_drained_and_deleted():
+    messages = [StubMessage("event-a"), StubMessage("event-b")]
+    queues = shard_queues(0, 1)
+    queues[consumer.shard_queue_name(1)].messages = list(messages)
+    connection = StubConnection(queues)
+
+    moved = asyncio.run(consumer.retire_shard_queue(connection, consumer.shard_queue_name(1)))
+
+    assert moved == 2
+    assert connection.exchange.published == ["event-a", "event-b"]
+    assert all(message.acked for message in messages)
+    assert queues[consumer.shard_queue_name(1)].deleted
+
+def test_unroutable_messages_fall_back_to_the_legacy_queue():
+    queues = shard_queues(1)
+    queues[consumer.shard_queue_name(1)].messages = [StubMessage("event-a")]
+    connection = StubConnection(queues, StubExchange(bound=False))
+
+    asyncio.run(consumer.retire_shard_queue(connection, consumer.shard_queue_name(1)))
+
+    assert connection.channels[-1].default_exchange.published == [consumer.LEGACY_QUEUE]